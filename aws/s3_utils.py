@@ -1,18 +1,104 @@
 from botocore.config import Config
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError, BotoCoreError, EndpointConnectionError
 import datetime
 import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Data files are named transactions_<event date YYYYmmdd>_... (process worker, compactor)
+EVENT_DATE_RE = re.compile(r"^transactions_(\d{8})_")
 
 s3_cfg = Config(retries={"max_attempts": 10, "mode" : "standard"})
 
-def build_s3(AWS_REGION, s3_cfg):
+# One client per (region, endpoint, pool size) for the whole process: boto3 clients are thread-safe
+# and keep their urllib3 pool, so every uploader thread, handoff thread and the log shipper reuse the
+# same open connections instead of paying a new TLS handshake
+clients = {}
+clients_lock = threading.Lock()
+
+def build_s3(AWS_REGION, s3_cfg, endpoint_url=None):
     session = boto3.Session(region_name = AWS_REGION)
-    return session.client("s3", config = s3_cfg)
+    return session.client("s3", config = s3_cfg, endpoint_url = endpoint_url or None)
+
+def pool_size(workers, concurrency=1, extra=1):
+    # Every worker can hold `concurrency` multipart connections at once, plus `extra` (log shipper)
+    return max(10, workers * concurrency + extra)
+
+def shared_s3(AWS_REGION, max_pool_connections=10, endpoint_url=None, tcp_keepalive=True):
+    # Sessions are not thread-safe, so clients are only created under the lock
+    key = (AWS_REGION, endpoint_url or None, max_pool_connections, tcp_keepalive)
+    with clients_lock:
+        client = clients.get(key)
+        if client is None:
+            config = s3_cfg.merge(Config(max_pool_connections=max_pool_connections, tcp_keepalive=tcp_keepalive))
+            client = clients[key] = build_s3(AWS_REGION, config, endpoint_url)
+        return client
+
+def warm_connections(s3, S3_BUCKET, count, logger=None):
+    # `count` concurrent HeadBucket calls, so that many connections are open (and TLS done) before
+    # the first upload. A failure is only logged: uploads open their connections themselves.
+    # With the client's retries an unreachable endpoint takes minutes, so services run this in a
+    # thread (start_warming)
+    def head(_):
+        try:
+            s3.head_bucket(Bucket=S3_BUCKET)
+            return True
+        except (ClientError, BotoCoreError):
+            return False
+    if count <= 0:
+        return 0
+    with ThreadPoolExecutor(max_workers=count, thread_name_prefix="s3-warm") as pool:
+        warmed = sum(pool.map(head, range(count)))
+    if logger is not None:
+        if warmed:
+            logger.info("🌀 S3 connections warmed: %d of %d", warmed, count)
+        else:
+            logger.warning("🟡 Could not warm S3 connections (bucket %s unreachable?)", S3_BUCKET)
+    return warmed
+
+def start_warming(s3, S3_BUCKET, count, logger=None):
+    thread = threading.Thread(target=warm_connections, args=(s3, S3_BUCKET, count, logger), name="s3-warm", daemon=True)
+    thread.start()
+    return thread
+
+def build_transfer_config(multipart_threshold_mb=8, multipart_chunk_mb=8, max_concurrency=10):
+    # Files above the threshold are sent as parallel multipart parts of multipart_chunk_mb
+    MB = 1024 * 1024
+    return TransferConfig(
+        multipart_threshold=int(multipart_threshold_mb * MB),
+        multipart_chunksize=int(multipart_chunk_mb * MB),
+        max_concurrency=max_concurrency,
+        use_threads=max_concurrency > 1,
+    )
 
 def utcnow():
     return datetime.datetime.now(datetime.timezone.utc)
 
+def event_time(file_name):
+    # Partition of a data file: its event date, upload time only for names without one
+    match = EVENT_DATE_RE.match(file_name)
+    if match is None:
+        return utcnow()
+    return datetime.datetime.strptime(match.group(1), "%Y%m%d").replace(tzinfo=datetime.timezone.utc)
+
+def content_name(file_name, digest):
+    # transactions_<event date>_<uuid>.parquet -> transactions_<event date>_<sha256>.parquet: the
+    # same content always gets the same key, whatever the local name
+    match = EVENT_DATE_RE.match(file_name)
+    prefix = f"transactions_{match.group(1)}_" if match else ""
+    return f"{prefix}{digest}{os.path.splitext(file_name)[1]}"
+
+def object_exists(s3, S3_BUCKET, key):
+    # Any error other than "not there" counts as missing: the upload is idempotent anyway
+    try:
+        s3.head_object(Bucket=S3_BUCKET, Key=key)
+        return True
+    except (ClientError, BotoCoreError):
+        return False
+
 def s3_key(S3_PREFIX, now, file_name, is_logs=False):
     prefix = "logs" if is_logs else S3_PREFIX
     date_path = f"year={now:%Y}/month={now:%m}/day={now:%d}"
@@ -23,14 +109,15 @@ def s3_key(S3_PREFIX, now, file_name, is_logs=False):
     return f"{prefix}/{date_path}/{file_name}"
 
 
-def upload_to_s3(s3, file_path, logger_uploader, S3_BUCKET, S3_PREFIX, failed_folder, is_logs = False):
+def upload_to_s3(s3, file_path, logger_uploader, S3_BUCKET, S3_PREFIX, failed_folder, is_logs = False, transfer_config = None, on_uploaded = None, key = None, extra_args = None):
     logger_uploader.info("Processing: %s", file_path)
 
     file_name = os.path.basename(file_path)
-    key = s3_key(S3_PREFIX, utcnow(), file_name, is_logs)
+    if key is None:
+        key = s3_key(S3_PREFIX, utcnow() if is_logs else event_time(file_name), file_name, is_logs)
 
     try:
-        s3.upload_file(file_path, S3_BUCKET, key)
+        s3.upload_file(file_path, S3_BUCKET, key, Config=transfer_config, ExtraArgs=extra_args)
         logger_uploader.info("✅ Uploaded to S3 %s", key)
 
     except EndpointConnectionError as e:
@@ -44,11 +131,12 @@ def upload_to_s3(s3, file_path, logger_uploader, S3_BUCKET, S3_PREFIX, failed_fo
                 logger_uploader.warning(
                     "🟡 STUCK IN LOGS FOLDER! Failed to move to failed/log_upload: %s | %s",
                     file_path, move_e, exc_info=True)
-                return
+                return False
             logger_uploader.warning(
                 "🟡 STUCK IN PROCESSED FOLDER! Failed to move to failed: %s | %s",
                 file_path, move_e, exc_info=True)
-            return
+            return False
+        return False
 
     except (ClientError, BotoCoreError) as e:
         logger_uploader.warning("🔴 Upload to S3 failed %s | %s", key, e, exc_info=True)
@@ -61,14 +149,18 @@ def upload_to_s3(s3, file_path, logger_uploader, S3_BUCKET, S3_PREFIX, failed_fo
                 logger_uploader.warning(
                     "🟡 STUCK IN LOGS FOLDER! Failed to move to failed/log_upload: %s | %s",
                     file_path, move_e, exc_info=True)
-                return
+                return False
             logger_uploader.warning(
                 "🟡 STUCK IN PROCESSED FOLDER! Failed to move to failed: %s | %s",
                 file_path, move_e, exc_info=True
             )
-            return
+            return False
+        return False
 
     else:
+        if on_uploaded is not None:
+            # Recorded before the local file is removed, so a crash in between never re-uploads it
+            on_uploaded(file_path, key)
         try:
             os.remove(file_path)
             logger_uploader.info("✅ Uploaded and removed: %s", file_path)
@@ -76,3 +168,4 @@ def upload_to_s3(s3, file_path, logger_uploader, S3_BUCKET, S3_PREFIX, failed_fo
             logger_uploader.info("🟡 Uploaded but file already missing: %s", file_path)
         except Exception:
             logger_uploader.warning("🟡 Uploaded but failed to remove: %s", file_path, exc_info=True)
+        return True
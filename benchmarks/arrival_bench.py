@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from logging_config import setup_logger
+from utils.arrival import ArrivalTracker, ArrivalHandler
+
+# Arrival -> queue latency of the incoming watchdog path (utils/arrival.py) per producer pattern:
+#   rename   write a hidden .tmp, then os.replace into the folder
+#   inplace  write the CSV in place in one go
+#   slow     write in place in chunks with pauses (a file that is still growing must not be queued)
+#   append   reopen, append a chunk and close, with pauses (one close-write per chunk)
+#   copy     shutil.copy of a finished file from another folder
+# Latency is measured from the moment the producer finished the file.
+# Usage: python3 -m benchmarks.arrival_bench --files 20 [--polling]
+
+PATTERNS = ("rename", "inplace", "slow", "append", "copy")
+
+
+def payload(rows):
+    lines = ["transaction_id,transaction_ts,user_id,amount,currency,status,product_id,payment_method"]
+    lines += [f"t{i},2026-01-01T00:00:00,{1000 + i},10.5,USD,paid,P0001,card" for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode()
+
+def produce(pattern, folder, source_dir, name, data, chunk_pause):
+    path = os.path.join(folder, name)
+    if pattern == "rename":
+        tmp_path = os.path.join(folder, "." + name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    elif pattern == "inplace":
+        with open(path, "wb") as f:
+            f.write(data)
+    elif pattern == "slow":
+        with open(path, "wb") as f:
+            step = max(1, len(data) // 5)
+            for start in range(0, len(data), step):
+                f.write(data[start:start + step])
+                f.flush()
+                time.sleep(chunk_pause)
+    elif pattern == "append":
+        step = max(1, len(data) // 5)
+        for start in range(0, len(data), step):
+            with open(path, "ab") as f:
+                f.write(data[start:start + step])
+            time.sleep(chunk_pause)
+    else:
+        source = os.path.join(source_dir, name)
+        with open(source, "wb") as f:
+            f.write(data)
+        shutil.copy(source, path)
+    return time.time()
+
+def run(args):
+    if args.polling:
+        from watchdog.observers.polling import PollingObserver
+        observer = PollingObserver(timeout=args.poll_s)
+    else:
+        from watchdog.observers import Observer
+        observer = Observer()
+
+    data = payload(args.rows)
+    ready = {}   # path -> (queued at, size when queued)
+
+    def on_ready(arrivals):
+        now = time.time()
+        for path, _ in arrivals:
+            ready.setdefault(path, (now, os.path.getsize(path)))
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="dropzone_arrival_") as base_dir:
+        folder = os.path.join(base_dir, "incoming")
+        source_dir = os.path.join(base_dir, "source")
+        os.makedirs(folder)
+        os.makedirs(source_dir)
+
+        tracker = ArrivalTracker(on_ready, setup_logger("dropzone.reading"), ".csv", args.quiet_s, args.max_wait_s)
+        stop = threading.Event()
+        thread = threading.Thread(target=tracker.run, args=(stop,), daemon=True)
+        thread.start()
+        observer.schedule(ArrivalHandler(tracker), folder, recursive=False)
+        observer.start()
+
+        for pattern in PATTERNS:
+            finished = {}
+            for i in range(args.files):
+                name = f"{pattern}_{i:04d}.csv"
+                finished[os.path.join(folder, name)] = produce(pattern, folder, source_dir, name, data, args.chunk_pause)
+                time.sleep(args.gap)
+            deadline = time.time() + args.max_wait_s + 5
+            while any(path not in ready for path in finished) and time.time() < deadline:
+                time.sleep(0.05)
+
+            latencies = [ready[path][0] - done for path, done in finished.items() if path in ready]
+            results[pattern] = {
+                "queued": len(latencies),
+                "partial": sum(1 for path in finished if path in ready and ready[path][1] != len(data)),
+                "latency_s": {
+                    "p50": round(float(np.percentile(latencies, 50)), 3),
+                    "p90": round(float(np.percentile(latencies, 90)), 3),
+                    "max": round(max(latencies), 3),
+                } if latencies else None,
+            }
+
+        observer.stop()
+        observer.join()
+        stop.set()
+        thread.join()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Arrival-to-queue latency of the incoming watchdog path")
+    parser.add_argument("--files", type=int, default=20, help="files per producer pattern")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--gap", type=float, default=0.05, help="seconds between two files")
+    parser.add_argument("--chunk-pause", type=float, default=0.1, help="slow / append pattern: pause between chunks")
+    parser.add_argument("--polling", action="store_true", help="PollingObserver instead of the native one")
+    parser.add_argument("--poll-s", type=float, default=0.5)
+    parser.add_argument("--quiet-s", type=float, default=2.0)
+    parser.add_argument("--max-wait-s", type=float, default=10.0)
+    parser.add_argument("--out", help="write the JSON result to this file")
+    args = parser.parse_args()
+
+    report = {"benchmark": "arrival", "params": vars(args), "results": run(args)}
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from logging_config import setup_logger
+from incoming_watcher import process_worker as pw
+from s3_upload import uploader_worker as upw
+from synth_data.gen_synth_data import main as gen_csv
+from benchmarks.fake_s3 import FakeS3
+from utils import tracing
+
+# End to end: incoming CSV -> process pool -> processed Parquet -> uploader threads -> fake S3.
+# Usage: python3 -m benchmarks.e2e_bench --files 200 --rows 5000 --workers 2 --uploaders 4 \
+#            --s3-latency 0.05 --throttle-rate 0.02 --outage 5:15 --out results.json
+
+BUCKET = "bench-bucket"
+
+
+def parse_outage(value):
+    start, duration = value.split(":")
+    return float(start), float(start) + float(duration)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values)
+    return {
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p90": round(float(np.percentile(values, 90)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "max": round(float(values.max()), 3),
+    }
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux; children = pool processes that already exited
+    return {
+        "main": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+def manifest_rows(manifest, columns):
+    with manifest.lock:
+        return manifest.conn.execute(f"SELECT {columns} FROM files").fetchall()
+
+def make_dirs(base_dir):
+    dirs = {name: os.path.join(base_dir, *name.split("/")) for name in (
+        "source", "incoming", "processed", "failed/read", "failed/transform", "failed/upload", "state", "s3",
+    )}
+    for folder in dirs.values():
+        os.makedirs(folder, exist_ok=True)
+    return dirs
+
+def generate(dirs, args):
+    paths = []
+    for i in range(args.files):
+        name = f"payments_bench_{i:06d}.csv"
+        if i < round(args.files * args.bad_files):
+            # Unreadable CSV: goes through every read retry and ends in failed/read
+            path = os.path.join(dirs["source"], name)
+            with open(path, "wb") as f:
+                f.write(b"\x00\xff\xfe" * 64)
+        else:
+            path = gen_csv(dirs["source"], args.rows, name, args.error_mix)
+        paths.append(path)
+    return paths
+
+def memory_uploads(output):
+    # Outputs the in-memory handoff uploaded are listed by name only (spilled ones with their path)
+    return {name for name in output.split(",") if not os.path.dirname(name)}
+
+def is_done(expected):
+    processed = failed = 0
+    outputs = set()
+    uploaded = {name for name, state in manifest_rows(upw.manifest, "name, state") if state == "uploaded"}
+    for state, output in manifest_rows(pw.manifest, "state, output"):
+        if state == "processed":
+            processed += 1
+            outputs.update(os.path.basename(path) for path in output.split(","))
+            uploaded.update(memory_uploads(output))
+        elif state in ("failed", "empty"):
+            failed += 1
+    return processed + failed >= expected and outputs <= uploaded
+
+def collect(dropped, started, finished, fake_s3, input_bytes, args):
+    csv_rows = manifest_rows(pw.manifest, "name, state, updated_at, output")
+    uploads = {name: updated_at for name, state, updated_at in manifest_rows(upw.manifest, "name, state, updated_at") if state == "uploaded"}
+
+    process_s, upload_s, end_to_end_s = [], [], []
+    processed = failed = empty = 0
+    for name, state, updated_at, output in csv_rows:
+        if state == "failed":
+            failed += 1
+            continue
+        if state == "empty":
+            empty += 1
+            continue
+        if state != "processed":
+            continue
+        processed += 1
+        process_s.append(updated_at - dropped[name])
+        # One Parquet per event date: the CSV is delivered when its last partition is. Handed-off
+        # partitions were uploaded before the CSV row was finished (parquet_to_s3 counts them as 0)
+        in_memory = memory_uploads(output)
+        uploaded = [updated_at if os.path.basename(path) in in_memory else uploads.get(os.path.basename(path)) for path in output.split(",")]
+        if None not in uploaded:
+            uploaded_at = max(uploaded)
+            upload_s.append(uploaded_at - updated_at)
+            end_to_end_s.append(uploaded_at - dropped[name])
+
+    elapsed = finished - started
+    good_files = args.files - round(args.files * args.bad_files)
+    return {
+        "complete": len(end_to_end_s) == processed and processed + failed + empty == args.files,
+        "seconds": round(elapsed, 2),
+        "files_processed": processed,
+        "files_failed": failed,
+        "files_empty": empty,
+        "files_uploaded": len(end_to_end_s),
+        "files_per_s": round(processed / elapsed, 2),
+        "rows_per_s": round(good_files * args.rows / elapsed),
+        "input_mb_per_s": round(input_bytes / elapsed / (1024 * 1024), 2),
+        "upload_mb_per_s": round(fake_s3.stats["bytes"] / elapsed / (1024 * 1024), 2),
+        "latency_s": {
+            "drop_to_parquet": percentiles(process_s),
+            "parquet_to_s3": percentiles(upload_s),
+            "end_to_end": percentiles(end_to_end_s),
+        },
+        "s3": dict(fake_s3.stats),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def run(args, base_dir):
+    dirs = make_dirs(base_dir)
+    sources = generate(dirs, args)
+    input_bytes = sum(os.path.getsize(path) for path in sources)
+
+    if args.trace_file:
+        tracing.TRACER.configure(args.trace_file, "e2e_bench")
+
+    fake_s3 = FakeS3(dirs["s3"], args.s3_latency, args.s3_mb_per_s, args.throttle_rate, args.max_inflight, args.outage)
+
+    pw.init_context(
+        setup_logger("dropzone.reading"),
+        setup_logger("dropzone.processing"),
+        dirs["incoming"],
+        dirs["processed"],
+        dirs["failed/read"],
+        dirs["failed/transform"],
+        transform_engine=args.engine,
+        manifest_path=os.path.join(dirs["state"], "processor.db"),
+        handoff_max_bytes=int(args.handoff_mb * 1024 * 1024),
+    )
+    upw.init_context(
+        setup_logger("dropzone.uploader"),
+        setup_logger("dropzone.reading"),
+        "us-east-1",
+        BUCKET,
+        "data",
+        dirs["processed"],
+        dirs["failed/upload"],
+        fake_s3,
+        manifest_path=os.path.join(dirs["state"], "uploader.db"),
+        content_keys=args.content_keys,
+    )
+
+    stop_processing = threading.Event()
+    stop_upload = threading.Event()
+    threads = [threading.Thread(target=pw.process_worker, args=(stop_processing, args.workers, args.retry_base, args.retry_max))]
+    upw.start_retry_scheduler(stop_upload, args.retry_base, args.retry_max)
+    if args.handoff_mb:
+        # Combined runtime (COMBINED_RUNTIME=1): Parquet bytes go from the pool straight to the upload threads
+        pw.handoff = upw.hand_off
+        upw.start_handoff(args.uploaders, int(args.handoff_budget_mb * 1024 * 1024), pw.finish_handoff)
+    threads += [threading.Thread(target=upw.uploader_worker, args=(stop_upload,)) for _ in range(args.uploaders)]
+    # Stands in for the uploader's watchdog: short-interval rescan of processed/ and failed/upload
+    threads.append(threading.Thread(target=upw.processed_rescan_loop, args=(stop_upload, [dirs["failed/upload"], dirs["processed"]], 0.2)))
+    for thread in threads:
+        thread.start()
+
+    dropped = {}
+    started = time.time()
+    fake_s3.started = time.monotonic()
+    for source in sources:
+        path = os.path.join(dirs["incoming"], os.path.basename(source))
+        os.replace(source, path)
+        dropped[os.path.basename(path)] = time.time()
+        while not pw.queue_csv(path, source="benchmark"):
+            time.sleep(0.01)
+
+    deadline = started + args.timeout
+    while not is_done(args.files) and time.time() < deadline:
+        time.sleep(0.2)
+    finished = time.time()
+
+    stop_processing.set()
+    threads[0].join()
+    if args.handoff_mb:
+        upw.stop_handoff()
+    stop_upload.set()
+    for thread in threads[1:]:
+        thread.join()
+    pw.manifest.commit()
+    upw.manifest.commit()
+
+    return collect(dropped, started, finished, fake_s3, input_bytes, args)
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end throughput: incoming CSV -> Parquet -> (fake) S3")
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--error-mix", type=float, default=1.0, help="share of rows drawn with possible errors")
+    parser.add_argument("--bad-files", type=float, default=0.0, help="share of unreadable CSV files")
+    parser.add_argument("--engine", choices=["pandas", "arrow"], default="pandas")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--uploaders", type=int, default=4)
+    parser.add_argument("--s3-latency", type=float, default=0.0, help="seconds added to every upload")
+    parser.add_argument("--s3-mb-per-s", type=float, default=0.0, help="per-upload bandwidth, 0 = unlimited")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of uploads answered with SlowDown")
+    parser.add_argument("--max-inflight", type=int, default=0, help="SlowDown above this many concurrent uploads")
+    parser.add_argument("--outage", type=parse_outage, action="append", default=[], help="START:DURATION seconds")
+    parser.add_argument("--retry-base", type=float, default=1.0)
+    parser.add_argument("--retry-max", type=float, default=10.0)
+    parser.add_argument("--handoff-mb", type=float, default=0.0, help="combined runtime: hand off outputs up to this size in memory, 0 = off")
+    parser.add_argument("--handoff-budget-mb", type=float, default=256.0, help="in-memory Parquet bytes waiting for upload")
+    parser.add_argument("--content-keys", action="store_true", help="content-addressed S3 keys, skip content already uploaded")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--out", help="write the JSON result to this file")
+    parser.add_argument("--trace-file", help="write per-file spans here (see utils/trace_report.py)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="dropzone_e2e_") as base_dir:
+        results = run(args, base_dir)
+
+    report = {
+        "benchmark": "e2e",
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "cpu_count": os.cpu_count(),
+        "params": {**vars(args), "outage": [list(window) for window in args.outage]},
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import logging
+import numbers
+import os
+import tempfile
+import time
+
+from logging_config import setup_logger
+from incoming_watcher import arrow_engine
+from incoming_watcher import process_worker as pw
+from synth_data.gen_synth_data import main as gen_csv
+
+# Usage: python3 -m benchmarks.engine_parity --files 50 --rows 5000
+# Exit code 1 if the pandas and arrow engines keep different rows for any generated file
+
+def normalize(df):
+    df = df.reset_index(drop=True)
+    df["transaction_ts"] = df["transaction_ts"].astype("datetime64[us]")
+    # user_id is float64 in pandas (NaN before filtering) and int64 or text in arrow; compare the id
+    # columns as text
+    for column in ("transaction_id", "user_id", "product_id"):
+        df[column] = df[column].map(lambda v: str(int(v)) if isinstance(v, numbers.Number) else str(v))
+    df["amount"] = df["amount"].astype("float64")
+    for column in ("currency", "status", "payment_method"):
+        df[column] = df[column].astype(str)
+    return df
+
+def compare_file(file_path):
+    started = time.perf_counter()
+    expected = pw.transform_df(pw.read_frame(file_path, pw.header_plan(file_path)), file_path)
+    pandas_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    table = arrow_engine.transform_table(arrow_engine.read_table(file_path))
+    arrow_s = time.perf_counter() - started
+
+    expected = normalize(expected)
+    actual = normalize(table.to_pandas())
+    same = expected.shape == actual.shape and expected.equals(actual)
+    return same, len(expected), pandas_s, arrow_s
+
+def main():
+    parser = argparse.ArgumentParser(description="Row-level parity of the pandas and arrow transform engines")
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    logger = setup_logger("dropzone.processing")
+    logger.setLevel(logging.WARNING)
+    pw.init_context(logger, logger, None, None, None, None)
+
+    mismatched = 0
+    rows = 0
+    pandas_total = arrow_total = 0.0
+    with tempfile.TemporaryDirectory(prefix="dropzone_parity_") as incoming:
+        for i in range(args.files):
+            file_path = gen_csv(incoming, args.rows, f"payments_parity_{i:06d}.csv")
+            same, kept, pandas_s, arrow_s = compare_file(file_path)
+            rows += kept
+            pandas_total += pandas_s
+            arrow_total += arrow_s
+            if not same:
+                mismatched += 1
+                print("MISMATCH:", os.path.basename(file_path))
+
+    print({
+        "files": args.files,
+        "rows_kept": rows,
+        "mismatched_files": mismatched,
+        "pandas_s": round(pandas_total, 2),
+        "arrow_s": round(arrow_total, 2),
+    })
+    raise SystemExit(1 if mismatched else 0)
+
+if __name__ == "__main__":
+    main()
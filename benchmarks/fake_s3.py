@@ -0,0 +1,106 @@
+import base64
+import os
+import random
+import shutil
+import threading
+import time
+import zlib
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+# Filesystem-backed stand-in for the S3 client calls the uploader makes (upload_file, upload_fileobj,
+# head_object).
+# Objects land in <root>/<bucket>/<key>. Faults are injected in this order:
+#   outages       [(start_s, end_s)] since creation: EndpointConnectionError (network down)
+#   max_inflight  more concurrent uploads than this: ClientError SlowDown
+#   throttle_rate share of uploads answered with ClientError SlowDown
+#   latency_s + size / mb_per_s of sleep for every accepted upload
+
+
+class FakeS3:
+    def __init__(self, root, latency_s=0.0, mb_per_s=0.0, throttle_rate=0.0, max_inflight=0, outages=()):
+        self.root = root
+        self.latency_s = latency_s
+        self.mb_per_s = mb_per_s
+        self.throttle_rate = throttle_rate
+        self.max_inflight = max_inflight
+        self.outages = list(outages)
+        self.started = time.monotonic()
+
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.stats = {"objects": 0, "bytes": 0, "throttled": 0, "outage_errors": 0, "heads": 0, "verified": 0}
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.stats[name] += value
+
+    def slow_down(self):
+        self.count("throttled")
+        return ClientError({"Error": {"Code": "SlowDown", "Message": "Please reduce your request rate."}}, "PutObject")
+
+    def head_object(self, Bucket, Key):
+        # No faults: a HEAD that fails only makes the uploader PUT again
+        self.count("heads")
+        target = os.path.join(self.root, Bucket, Key)
+        if not os.path.exists(target):
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        return {"ContentLength": os.path.getsize(target)}
+
+    def upload_file(self, Filename, Bucket, Key, Config=None, ExtraArgs=None):
+        def write(target):
+            shutil.copyfile(Filename, target)
+            self.verify(target, ExtraArgs)
+        self.store(Bucket, Key, os.path.getsize(Filename), write)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, Config=None, ExtraArgs=None):
+        # In-memory handoff (combined runtime): same faults and pacing as upload_file
+        data = Fileobj.read()
+
+        def write(target):
+            with open(target, "wb") as f:
+                f.write(data)
+            self.verify(target, ExtraArgs)
+        self.store(Bucket, Key, len(data), write)
+
+    def verify(self, target, ExtraArgs):
+        # Like S3 with a full-object ChecksumCRC32: a mismatch rejects the object
+        expected = (ExtraArgs or {}).get("ChecksumCRC32")
+        if expected is None:
+            return
+        crc = 0
+        with open(target, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                crc = zlib.crc32(chunk, crc)
+        self.count("verified")
+        if base64.b64encode(crc.to_bytes(4, "big")).decode("ascii") != expected:
+            os.remove(target)
+            raise ClientError({"Error": {"Code": "BadDigest", "Message": "The CRC32 you specified did not match the calculated checksum."}}, "PutObject")
+
+    def store(self, Bucket, Key, size, write):
+        elapsed = time.monotonic() - self.started
+        if any(start <= elapsed < end for start, end in self.outages):
+            self.count("outage_errors")
+            raise EndpointConnectionError(endpoint_url="http://fake-s3.local")
+
+        with self.lock:
+            self.inflight += 1
+            inflight = self.inflight
+        try:
+            if self.max_inflight and inflight > self.max_inflight:
+                raise self.slow_down()
+            if random.random() < self.throttle_rate:
+                raise self.slow_down()
+
+            delay = self.latency_s + (size / (self.mb_per_s * 1024 * 1024) if self.mb_per_s else 0)
+            if delay:
+                time.sleep(delay)
+
+            target = os.path.join(self.root, Bucket, Key)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            write(target)
+            self.count("objects")
+            self.count("bytes", size)
+        finally:
+            with self.lock:
+                self.inflight -= 1
@@ -0,0 +1,72 @@
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from logging_config import setup_logger
+from incoming_watcher import process_worker as pw
+from synth_data.gen_synth_data import main as gen_csv
+
+# Usage: python3 -m benchmarks.process_pool_bench --files 200 --rows 5000 --workers 1 2 4 8
+
+def run_once(workers, files, rows, base_dir):
+    incoming = os.path.join(base_dir, "incoming")
+    processed = os.path.join(base_dir, "processed")
+    failed_read = os.path.join(base_dir, "failed", "read")
+    failed_transform = os.path.join(base_dir, "failed", "transform")
+    for folder in (incoming, processed, failed_read, failed_transform):
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+
+    pw.init_context(
+        setup_logger("dropzone.reading"),
+        setup_logger("dropzone.processing"),
+        incoming,
+        processed,
+        failed_read,
+        failed_transform,
+        manifest_path=os.path.join(base_dir, "state", f"bench_{workers}.db"),
+    )
+
+    paths = [gen_csv(incoming, rows, f"payments_bench_{i:06d}.csv") for i in range(files)]
+
+    stop = threading.Event()
+    worker = threading.Thread(target=pw.process_worker, args=(stop, workers))
+    worker.start()
+
+    started = time.perf_counter()
+    for path in paths:
+        while not pw.queue_csv(path, source="benchmark"):
+            time.sleep(0.01)
+    pw.process_queue.join()
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    worker.join()
+
+    return {
+        "workers": workers,
+        "files": files,
+        "seconds": round(elapsed, 2),
+        "files_per_s": round(files / elapsed, 2),
+        "rows_per_s": round(files * rows / elapsed),
+        # Parquet only: every file has a .parquet.sums checksum sidecar next to it
+        "parquet_out": sum(1 for name in os.listdir(processed) if name.endswith(".parquet")),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Process pool throughput for incoming CSV -> processed Parquet")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print("cpu_count:", os.cpu_count())
+    with tempfile.TemporaryDirectory(prefix="dropzone_bench_") as base_dir:
+        for workers in args.workers:
+            print(run_once(workers, args.files, args.rows, base_dir))
+
+if __name__ == "__main__":
+    main()
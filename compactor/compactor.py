@@ -0,0 +1,248 @@
+import os
+import re
+import sys
+import glob
+import json
+import time
+from datetime import datetime
+from uuid import uuid4
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils import tracing
+from utils.parquet_layout import ParquetLayout, OUTPUT_TYPES
+from utils.checksums import HashingFile, write_sidecar, remove_sidecar
+
+# Small-file compaction: the process worker writes into STAGING_DIR, this loop merges
+# staged Parquet per partition into one file in PROCESSED_DIR (same .tmp + os.replace handoff).
+# The partition is the event date in the file name (transactions_<YYYYmmdd>_...), and the
+# compacted file keeps it, so the uploader puts it under the same S3 partition.
+# Every batch is recorded in a journal in STAGING_DIR (.compaction_<output>.json) before the
+# compacted file is renamed into PROCESSED_DIR, and removed once its sources are deleted. A crash in
+# between is settled on the next pass (recover_batches): before the rename the batch is rolled back,
+# after it the sources are deleted, so they are never compacted (and uploaded) a second time.
+# A staged file that cannot be merged (unreadable, a declared column of another type than
+# OUTPUT_TYPES, a schema that does not unify with the rest, data that does not cast) goes to
+# failed/transform and the rest of its batch is compacted without it
+
+PARTITION_RE = re.compile(r"transactions_(\d{8})_")
+JOURNAL_PREFIX = ".compaction_"
+
+
+class StagedFileError(Exception):
+    # A staged file whose data could not be merged into its batch
+    def __init__(self, path):
+        super().__init__(path)
+        self.path = path
+
+
+def partition_key(file_path):
+    match = PARTITION_RE.search(os.path.basename(file_path))
+    return match.group(1) if match else "default"
+
+def staged_files(staging_dir):
+    files = []
+    for path in glob.glob(os.path.join(staging_dir, "*.parquet")):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    return sorted(files)
+
+def pick_batches(files, target_bytes, max_age_s, flush_all=False):
+    partitions = {}
+    for mtime, size, path in files:
+        partitions.setdefault(partition_key(path), []).append((mtime, size, path))
+
+    now = time.time()
+    batches = []
+    for key, entries in partitions.items():
+        batch, batch_bytes = [], 0
+        for mtime, size, path in entries:
+            batch.append(path)
+            batch_bytes += size
+            if batch_bytes >= target_bytes:
+                batches.append((key, batch))
+                batch, batch_bytes = [], 0
+
+        if batch and (flush_all or now - entries[0][0] >= max_age_s):
+            batches.append((key, batch))
+    return batches
+
+def journal_path(staging_dir, fname):
+    return os.path.join(staging_dir, JOURNAL_PREFIX + fname + ".json")
+
+def write_journal(path, tmp_path, p_path, sources):
+    with open(path + ".tmp", "w") as f:
+        json.dump({"tmp": tmp_path, "output": p_path, "sources": sources}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def quarantine(path, failed_dir, logger, reason):
+    logger.warning("🔴 %s, moving to failed/transform: %s", reason, path, exc_info=sys.exc_info()[0] is not None)
+    try:
+        os.replace(path, os.path.join(failed_dir, os.path.basename(path)))
+        remove_sidecar(path)
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logger.warning("🟡 STUCK IN STAGING FOLDER! Failed to move to failed/transform: %s", path)
+
+def declared_mismatch(schema):
+    return [field.name for field in schema if field.name in OUTPUT_TYPES and field.type != OUTPUT_TYPES[field.name]]
+
+def remove_sources(sources):
+    for path in sources:
+        remove_quietly(path)
+        remove_sidecar(path)
+
+def recover_batches(staging_dir, logger):
+    # Settles batches a crash left between journal and cleanup; returns the sources of the ones
+    # that could not be settled (kept out of new batches until a later pass manages)
+    blocked = set()
+    for leftover in glob.glob(os.path.join(staging_dir, JOURNAL_PREFIX + "*.json.tmp")):
+        remove_quietly(leftover)
+    for journal in glob.glob(os.path.join(staging_dir, JOURNAL_PREFIX + "*.json")):
+        batch = None
+        try:
+            with open(journal) as f:
+                batch = json.load(f)
+            if os.path.exists(batch["tmp"]):
+                # Never renamed: the sources stay staged and are compacted again
+                remove_quietly(batch["tmp"])
+                if not os.path.exists(batch["output"]):
+                    remove_sidecar(batch["output"])
+                logger.warning("🟡 Compaction into %s was interrupted before the rename, rolled back", batch["output"])
+            else:
+                # Renamed (and maybe uploaded already): only the sources were left behind
+                remove_sources(batch["sources"])
+                logger.warning("🟡 Compaction into %s was interrupted after the rename, removed its %d staged sources",
+                               batch["output"], len(batch["sources"]))
+            os.remove(journal)
+        except Exception:
+            logger.warning("🔴 Could not settle compaction journal %s", journal, exc_info=True)
+            if batch is not None:
+                blocked.update(batch["sources"])
+    return blocked
+
+def write_compacted(paths, processed_dir, failed_dir, logger, key="default", layout=None):
+    layout = layout or ParquetLayout()
+    readable = []
+    schema = None
+    staged = []   # (trace_ids, sources, staged since) per readable file
+    for path in paths:
+        try:
+            file_schema = pq.read_schema(path)
+            trace_ids, sources = tracing.schema_trace(file_schema)
+            staged_at = os.stat(path).st_ctime
+        except FileNotFoundError:
+            continue
+        except Exception:
+            quarantine(path, failed_dir, logger, "Unreadable staged parquet")
+            continue
+        file_schema = file_schema.remove_metadata()
+        mismatch = declared_mismatch(file_schema)
+        if mismatch:
+            quarantine(path, failed_dir, logger, f"Staged parquet with undeclared types for {mismatch}")
+            continue
+        try:
+            schema = file_schema if schema is None else pa.unify_schemas([schema, file_schema], promote_options="permissive")
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            quarantine(path, failed_dir, logger, "Staged parquet schema does not merge with its batch")
+            continue
+        staged.append((trace_ids, sources, staged_at))
+        readable.append(path)
+
+    if not readable:
+        return None
+
+    schema = tracing.with_trace(
+        schema,
+        [trace_id for trace_ids, _, _ in staged for trace_id in trace_ids],
+        [source for _, sources, _ in staged for source in sources],
+    )
+    event_date = datetime.now().strftime("%Y%m%d") if key == "default" else key
+    fname = f"transactions_{event_date}_{datetime.now():%H%M%S}_{uuid4().hex}.parquet"
+    tmp_path = os.path.join(processed_dir, "." + fname + ".tmp")
+    p_path = os.path.join(processed_dir, fname)
+
+    journal = journal_path(os.path.dirname(readable[0]), fname)
+    buffered, buffered_rows = [], 0
+    try:
+        # Staged files are sorted on their own: every merged row group is re-sorted before it is written
+        with HashingFile(tmp_path) as sink, layout.writer(sink, schema) as writer:
+            for path in readable:
+                try:
+                    table = pq.read_table(path).replace_schema_metadata(None).cast(schema)
+                except FileNotFoundError:
+                    raise
+                except Exception as e:
+                    raise StagedFileError(path) from e
+                buffered.append(table)
+                buffered_rows += table.num_rows
+                if buffered_rows >= layout.row_group_rows:
+                    layout.write_batch(writer, layout.sort(pa.concat_tables(buffered)))
+                    buffered, buffered_rows = [], 0
+            if buffered:
+                layout.write_batch(writer, layout.sort(pa.concat_tables(buffered)))
+        write_sidecar(p_path, sink.result())
+        write_journal(journal, tmp_path, p_path, readable)
+        os.replace(tmp_path, p_path)
+    except Exception:
+        # Not renamed: the sources stay staged and the batch is not recorded
+        remove_quietly(tmp_path)
+        remove_quietly(journal)
+        if not os.path.exists(p_path):
+            remove_sidecar(p_path)
+        raise
+
+    compacted = time.time()
+    remove_sources(readable)
+    os.remove(journal)
+    for trace_ids, _, staged_at in staged:
+        tracing.record(trace_ids, "staging_wait", min(staged_at, compacted), compacted, parquet=fname, merged=len(readable))
+    return p_path
+
+def compact_once(staging_dir, processed_dir, failed_dir, logger, target_bytes, max_age_s, flush_all=False, layout=None):
+    emitted = 0
+    blocked = recover_batches(staging_dir, logger)
+    files = [entry for entry in staged_files(staging_dir) if entry[2] not in blocked]
+    for key, batch in pick_batches(files, target_bytes, max_age_s, flush_all):
+        p_path = None
+        while batch:
+            try:
+                p_path = write_compacted(batch, processed_dir, failed_dir, logger, key, layout)
+            except StagedFileError as e:
+                # Only this file is bad: the rest of the batch goes ahead without it
+                quarantine(e.path, failed_dir, logger, "Staged parquet could not be merged")
+                batch = [path for path in batch if path != e.path]
+                continue
+            except Exception:
+                logger.warning("🌀 Compaction failed for partition %s (%d files), will retry", key, len(batch), exc_info=True)
+            break
+        if p_path:
+            emitted += 1
+            logger.info("✅ Compacted %d staged files (partition %s) into %s", len(batch), key, p_path)
+    return emitted
+
+def compaction_loop(stop_event, staging_dir, processed_dir, failed_dir, logger, target_bytes, max_age_s, interval=10, layout=None):
+    os.makedirs(staging_dir, exist_ok=True)
+    os.makedirs(processed_dir, exist_ok=True)
+    logger.info("🌀 Compaction started: %s -> %s (target %d bytes, max age %ds)", staging_dir, processed_dir, target_bytes, max_age_s)
+
+    while not stop_event.is_set():
+        compact_once(staging_dir, processed_dir, failed_dir, logger, target_bytes, max_age_s, layout=layout)
+        stop_event.wait(interval)
+
+    # Shutdown: hand everything that is staged to the uploader
+    compact_once(staging_dir, processed_dir, failed_dir, logger, target_bytes, max_age_s, flush_all=True, layout=layout)
+    logger.info("--Compaction stopped")
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+from incoming_watcher import column_plan
+from incoming_watcher.normalization import CURRENCY_TABLE, STATUS_TABLE, PAYMENT_METHOD_TABLE
+
+# Same rules as process_worker.transform_df, on Arrow tables with pyarrow.compute
+
+# pandas' default na_values, so both engines agree on what is missing
+NULL_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+TS_FORMATS = ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%d"]
+NUMBER_RE = r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$"
+
+
+def read_table(file_path, plan=None):
+    # Only the planned columns, under canonical names and in canonical order (column_plan.py)
+    plan = plan or column_plan.plan_for(file_path)[0]
+
+    # Everything as (nullable) strings: types are decided explicitly in transform_table
+    return pacsv.read_csv(
+        file_path,
+        read_options=pacsv.ReadOptions(column_names=plan.names, skip_rows=1),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=plan.columns,
+            column_types=plan.arrow_types(),
+            null_values=NULL_VALUES,
+            strings_can_be_null=True,
+        ),
+    )
+
+def parse_ts(values):
+    parsed = [pc.strptime(values, format=fmt, unit="us", error_is_null=True) for fmt in TS_FORMATS]
+    return pc.coalesce(*parsed)
+
+def parse_number(values):
+    trimmed = pc.utf8_trim_whitespace(values)
+    valid = pc.fill_null(pc.match_substring_regex(trimmed, NUMBER_RE), False)
+    return pc.cast(pc.if_else(valid, trimmed, pa.scalar(None, pa.string())), pa.float64())
+
+def parse_user_id(values):
+    try:
+        return pc.cast(values, pa.int64())
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return values
+
+def first_occurrence(ids, mask):
+    # Row numbers of the first row per id among rows that passed `mask`
+    rows = pa.array(range(len(ids)), pa.int64())
+    candidates = pa.table({"id": ids, "row": rows}).filter(mask)
+    firsts = candidates.group_by("id", use_threads=False).aggregate([("row", "min")])
+    return pc.is_in(rows, value_set=firsts["row_min"])
+
+def true_count(mask):
+    return pc.sum(mask).as_py() or 0
+
+def narrow(mask, condition, reason, drops=None):
+    # mask AND condition (null = False); mask=None starts from all rows
+    condition = pc.fill_null(condition, False)
+    narrowed = condition if mask is None else pc.and_(mask, condition)
+    if drops is not None:
+        before = len(condition) if mask is None else true_count(mask)
+        drops[reason] = drops.get(reason, 0) + before - true_count(narrowed)
+    return narrowed
+
+def transform_table(table, today=None, drops=None, late_days=7):
+    # Event dates from `late_days` days ago up to tomorrow are kept
+    today = today or datetime.now().date()
+    window_start = pa.scalar(datetime.combine(today - timedelta(days=late_days), datetime.min.time()), pa.timestamp("us"))
+    window_end = pa.scalar(datetime.combine(today + timedelta(days=2), datetime.min.time()), pa.timestamp("us"))
+
+    ts = parse_ts(table["transaction_ts"])
+    amount = parse_number(table["amount"])
+    user_id = parse_user_id(table["user_id"])
+    user_ok = pc.is_valid(user_id)
+    if pa.types.is_string(user_id.type):
+        user_ok = pc.and_(user_ok, pc.not_equal(user_id, ""))
+    currency = CURRENCY_TABLE.normalize_array(table["currency"])
+    status = STATUS_TABLE.normalize_array(table["status"])
+    payment_method = PAYMENT_METHOD_TABLE.normalize_array(table["payment_method"])
+
+    # Same filter order as the pandas engine; `drops` (optional dict) gets the rows each one removed
+    mask = narrow(None, pc.is_valid(ts), "bad_ts", drops)
+    mask = narrow(mask, pc.and_(pc.greater_equal(ts, window_start), pc.less(ts, window_end)), "out_of_window", drops)
+    mask = narrow(mask, user_ok, "empty_user", drops)
+    mask = narrow(mask, pc.is_valid(currency), "bad_currency", drops)
+    mask = narrow(mask, pc.greater_equal(amount, 0), "bad_amount", drops)
+    mask = narrow(mask, pc.is_valid(table["transaction_id"]), "no_transaction_id", drops)
+
+    mask = narrow(mask, first_occurrence(table["transaction_id"], mask), "duplicate", drops)
+    mask = narrow(mask, pc.is_valid(status), "status", drops)
+    mask = narrow(mask, pc.is_valid(payment_method), "payment_method", drops)
+
+    for column, values in (
+        ("transaction_ts", ts),
+        ("amount", amount),
+        ("user_id", user_id),
+        ("currency", currency),
+        ("status", status),
+        ("payment_method", payment_method),
+    ):
+        table = table.set_column(table.schema.get_field_index(column), column, values)
+    return table.filter(mask)
+
+def split_by_event_date(table):
+    # [(event date, rows of that date)], oldest date first
+    days = pc.cast(table["transaction_ts"], pa.date32())
+    return [(day, table.filter(pc.equal(days, pa.scalar(day, pa.date32())))) for day in sorted(pc.unique(days).to_pylist())]
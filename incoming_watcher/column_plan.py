@@ -0,0 +1,119 @@
+import csv
+import hashlib
+
+import pyarrow as pa
+
+from synth_data.values import CORRECT_COLUMN_NAMES, COLUMN_ALIASES, AMBIGUOUS_COLUMN_ALIASES
+
+# Header resolution: a header (names, aliases, order, extra columns) is resolved once against
+# COLUMN_ALIASES into a ColumnPlan, cached by the fingerprint of the raw header line. Files from a
+# partner seen before only read their first line and look the plan up.
+# Both engines read only the planned columns (usecols / include_columns) under canonical names.
+
+# Read as text in the pandas engine too: no type inference, and the same values as the arrow engine
+TEXT_COLUMNS = ("transaction_id", "currency", "status", "product_id", "payment_method")
+
+MAX_PLANS = 1024
+
+ALIASES = {
+    alias.strip().lower(): column
+    for column, aliases in COLUMN_ALIASES.items()
+    for alias in [column, *aliases]
+}
+
+plans = {}
+
+
+class HeaderError(ValueError):
+    # Required columns missing: the file will never be readable, retrying does not help
+    pass
+
+
+class IncompleteHeader(ValueError):
+    # Header line empty or cut off before its newline: the file is likely still being written,
+    # retried like any other read error
+    pass
+
+
+class ColumnPlan:
+    def __init__(self, header, fingerprint):
+        self.header = header
+        self.fingerprint = fingerprint
+        self.sources, self.positional = resolve(header)        # column -> header index
+        self.usecols = sorted(self.sources.values())
+        # Full-width names for the reader: canonical for planned columns, placeholders for the rest
+        by_index = {index: column for column, index in self.sources.items()}
+        self.names = [by_index.get(index, f"_unused_{index}") for index in range(len(header))]
+        self.columns = list(CORRECT_COLUMN_NAMES)
+        self.dtypes = {column: str for column in TEXT_COLUMNS}
+        self.renamed = {header[index]: column for column, index in self.sources.items() if header[index] != column}
+        self.dropped = [header[index] for index in range(len(header)) if index not in by_index]
+
+    def pandas_options(self):
+        return {"header": 0, "names": self.names, "usecols": self.usecols, "dtype": self.dtypes}
+
+    def arrow_types(self):
+        return {column: pa.string() for column in self.columns}
+
+    def order(self, df):
+        # Canonical column order (usecols keeps the file's order)
+        return df if list(df.columns) == self.columns else df[self.columns]
+
+
+def normalize_name(name):
+    return (name or "").strip().lower()
+
+def resolve(header):
+    # ({column: header index}, positional). Exact names and unique aliases first, then ambiguous ones
+    sources = {}
+    ambiguous = []
+    for index, raw in enumerate(header):
+        name = normalize_name(raw)
+        column = ALIASES.get(name)
+        if column is not None and column not in sources:
+            sources[column] = index
+        elif name in AMBIGUOUS_COLUMN_ALIASES:
+            ambiguous.append((index, AMBIGUOUS_COLUMN_ALIASES[name]))
+
+    for index, candidates in ambiguous:
+        free = [column for column in candidates if column not in sources]
+        at_position = CORRECT_COLUMN_NAMES[index] if index < len(CORRECT_COLUMN_NAMES) else None
+        if at_position in free:
+            sources[at_position] = index
+        elif len(free) == 1:
+            sources[free[0]] = index
+
+    missing = [column for column in CORRECT_COLUMN_NAMES if column not in sources]
+    if not missing:
+        return sources, False
+    if len(header) == len(CORRECT_COLUMN_NAMES):
+        # Unknown names but the expected width: taken by position, as before the alias registry
+        return {column: index for index, column in enumerate(CORRECT_COLUMN_NAMES)}, True
+    raise HeaderError(f"columns {missing} not found in header {header}")
+
+def header_line(file_path):
+    with open(file_path, "rb") as f:
+        return f.readline()
+
+def fingerprint(line):
+    return hashlib.blake2b(line, digest_size=8).hexdigest()
+
+def plan_for(file_path):
+    # (plan, cached): one line read per file; a known header skips resolution
+    line = header_line(file_path)
+    key = fingerprint(line)
+    plan = plans.get(key)
+    if plan is not None:
+        return plan, True
+    header = next(csv.reader([line.decode("utf-8-sig")]), [])
+    try:
+        plan = ColumnPlan(header, key)
+    except HeaderError as e:
+        # Only a complete header line proves the columns are missing; a partial one is not cached
+        if not line.endswith(b"\n"):
+            raise IncompleteHeader(f"incomplete header {header}") from e
+        raise
+    if len(plans) >= MAX_PLANS:
+        plans.clear()
+    plans[key] = plan
+    return plan, False
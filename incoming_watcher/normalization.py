@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from synth_data.values import CURRENCY_MAPPING, VALID_CURRENCIES, CANONICAL_STATUS, STATUS_MAPPING, CANONICAL_PAYMENT_METHODS, PAYMENT_METHOD_MAPPING
+
+
+class NormalizationTable:
+    # Canonical values + aliases compiled once into raw value -> category code.
+    # Validation and mapping are one lookup; the result is categorical / dictionary-encoded
+    # with the same fixed dictionary in every file
+    def __init__(self, canonical, mapping):
+        unknown = set(mapping.values()) - set(canonical)
+        if unknown:
+            raise ValueError(f"Mapping targets outside canonical values: {sorted(unknown)}")
+
+        self.categories = sorted(canonical)
+        position = {value: code for code, value in enumerate(self.categories)}
+
+        self.lookup = dict(position)
+        self.lookup.update({raw: position[value] for raw, value in mapping.items()})
+
+        self.keys = pa.array(list(self.lookup.keys()), pa.string())
+        self.codes = pa.array(list(self.lookup.values()), pa.int8())
+        self.dictionary = pa.array(self.categories, pa.string())
+
+    def normalize_series(self, values):
+        # One hash pass (factorize) over the column, then a lookup per distinct value
+        codes, uniques = pd.factorize(values)
+        unique_codes = np.array([self.lookup.get(value, -1) for value in uniques] + [-1], dtype=np.int8)
+        normalized = pd.Categorical.from_codes(unique_codes[codes], categories=self.categories)
+        return pd.Series(normalized, index=values.index, name=values.name)
+
+    def normalize_array(self, values):
+        if isinstance(values, pa.ChunkedArray):
+            values = values.combine_chunks()
+        codes = pc.take(self.codes, pc.index_in(values, value_set=self.keys))
+        return pa.DictionaryArray.from_arrays(codes, self.dictionary)
+
+
+CURRENCY_TABLE = NormalizationTable(VALID_CURRENCIES, CURRENCY_MAPPING)
+STATUS_TABLE = NormalizationTable(CANONICAL_STATUS, STATUS_MAPPING)
+PAYMENT_METHOD_TABLE = NormalizationTable(CANONICAL_PAYMENT_METHODS, PAYMENT_METHOD_MAPPING)
@@ -1,15 +1,32 @@
-import time
-from synth_data.values import CORRECT_COLUMN_NAMES, CURRENCY_MAPPING, VALID_CURRENCIES, CANONICAL_STATUS, STATUS_MAPPING, CANONICAL_PAYMENT_METHODS, PAYMENT_METHOD_MAPPING
 import os
 import pandas as pd
-from queue import Full, Queue, Empty
+import pyarrow as pa
+from queue import Full, Empty
 from datetime import datetime
 from uuid import uuid4
-import glob
-
-from utils.queue_utils import is_candidate
+from functools import partial
+
+import utils.queue_utils as utils
+from utils.manifest import FileManifest, file_stat
+from utils.dedup_utils import SeenIds, DedupIndex
+from utils.retry_utils import RetryScheduler
+from utils.rescan_utils import DirCursor, rescan_once
+from utils.parquet_layout import ParquetLayout
+from utils.checksums import HashingFile, buffer_checksums, write_sidecar, remove_sidecar
+import utils.file_queue as file_queue
+from incoming_watcher import arrow_engine, column_plan
+from incoming_watcher.normalization import CURRENCY_TABLE, STATUS_TABLE, PAYMENT_METHOD_TABLE
+import logging_config
+from logging_config import setup_logger
+from utils.metrics import REGISTRY, STAGE_SECONDS, FILES, RETRIES, ROWS_IN, ROWS_OUT, ROWS_DROPPED, count_files
+from utils import tracing
 
+import time
+import logging
 import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 logger_ingest = None
 logger_process = None
@@ -19,6 +36,51 @@ PROCESSED_DIR = None
 FAILED_DIR_READ = None
 FAILED_DIR_TRANSFORM = None
 
+# Streaming mode: CSVs of at least STREAM_MIN_BYTES are read STREAM_CHUNK_ROWS rows at a time;
+# the transaction_ids seen so far in the file are kept in memory up to STREAM_MEMORY_IDS ids, the
+# rest is spilled to disk (0 = no limit)
+STREAM_CHUNK_ROWS = 0
+STREAM_MIN_BYTES = 0
+STREAM_MEMORY_IDS = 0
+
+# "pandas" (default) or "arrow" (pyarrow.compute, no pandas round trip)
+TRANSFORM_ENGINE = "pandas"
+
+# Output is split by event date (transaction_ts): one Parquet per day, named transactions_<YYYYmmdd>_...
+# so compaction and the S3 key follow the event date. Rows dated more than LATE_DATA_DAYS before
+# today or after tomorrow are dropped
+LATE_DATA_DAYS = 7
+
+# Codec, row groups, sort order, dictionary / statistics / Bloom filter columns (utils/parquet_layout.py)
+parquet_layout = ParquetLayout()
+
+# Combined runtime (COMBINED_RUNTIME=1 in watcher.py): a pool process returns outputs of up to
+# HANDOFF_MAX_BYTES as Parquet bytes instead of writing processed/, and the parent passes them to
+# handoff(file_path, outputs, trace_id) (s3_upload/uploader_worker.hand_off). The CSV stays in
+# incoming/, claimed, until finish_handoff. Streamed files always go through processed/
+HANDOFF_MAX_BYTES = 0
+handoff = None
+
+# A failed read/write is retried later by the RetryScheduler instead of sleeping in the worker;
+# after MAX_ATTEMPTS the CSV goes to failed/read or failed/transform
+MAX_ATTEMPTS = 3
+RETRY = "retry"
+retry_scheduler = None
+
+# Durable per-file state (utils/manifest.py); pool processes open their own connection
+manifest = None
+
+# Cross-file transaction_id dedup over the last DEDUP_WINDOW_DAYS (utils/dedup_utils.py), off when None
+dedup_index = None
+
+# Lineage (utils/tracing.py): trace id of the file the current pool process works on,
+# and when each file entered process_queue (parent)
+current_trace = None
+queued_at = {}
+
+# Watermark flow control on the downstream folders (utils/flow_control.py), parent process only
+flow_control = None
+
 def init_context(
     logger_ingest_main,
     logger_process_main,
@@ -26,9 +88,24 @@ def init_context(
     processed_dir,
     failed_dir_read,
     failed_dir_transform,
+    stream_chunk_rows=0,
+    stream_min_bytes=0,
+    stream_memory_ids=0,
+    transform_engine="pandas",
+    manifest_path=None,
+    manifest_owner=None,
+    dedup_path=None,
+    dedup_window_days=7,
+    late_data_days=7,
+    layout=None,
+    handoff_max_bytes=0,
+    flow=None,
+    shortest_first=False,
 ):
     global logger_ingest, logger_process
     global INCOMING_DIR, PROCESSED_DIR, FAILED_DIR_READ, FAILED_DIR_TRANSFORM
+    global STREAM_CHUNK_ROWS, STREAM_MIN_BYTES, STREAM_MEMORY_IDS, TRANSFORM_ENGINE, LATE_DATA_DAYS, manifest, dedup_index, flow_control
+    global parquet_layout, HANDOFF_MAX_BYTES
 
     logger_ingest = logger_ingest_main
     logger_process = logger_process_main
@@ -37,114 +114,390 @@ def init_context(
     PROCESSED_DIR = processed_dir
     FAILED_DIR_READ = failed_dir_read
     FAILED_DIR_TRANSFORM = failed_dir_transform
-
-process_queue = Queue(maxsize=2000)
-claimed_csv = set()
-claimed_csv_lock = threading.Lock()
+    STREAM_CHUNK_ROWS = stream_chunk_rows
+    STREAM_MIN_BYTES = stream_min_bytes
+    STREAM_MEMORY_IDS = stream_memory_ids
+    TRANSFORM_ENGINE = transform_engine
+    LATE_DATA_DAYS = late_data_days
+    if layout is not None:
+        parquet_layout = layout
+    HANDOFF_MAX_BYTES = handoff_max_bytes
+    if manifest_path:
+        manifest = FileManifest(manifest_path, owner=manifest_owner)
+    if dedup_path:
+        dedup_index = DedupIndex(dedup_path, dedup_window_days)
+    flow_control = flow
+    process_queue.shortest_first = shortest_first
+
+def context_args():
+    return (
+        INCOMING_DIR,
+        PROCESSED_DIR,
+        FAILED_DIR_READ,
+        FAILED_DIR_TRANSFORM,
+        STREAM_CHUNK_ROWS,
+        STREAM_MIN_BYTES,
+        STREAM_MEMORY_IDS,
+        TRANSFORM_ENGINE,
+        manifest.db_path,
+        manifest.owner,
+        dedup_index.db_path if dedup_index else None,
+        dedup_index.window_days if dedup_index else 0,
+        LATE_DATA_DAYS,
+        parquet_layout,
+        HANDOFF_MAX_BYTES,
+    )
+
+def init_pool_worker(log_queue, *context):
+    # Runs once in every pool process: loggers and folders are not inherited with spawn. Records go
+    # to the parent's log queue, never to the log file itself (LOG_MODE async and sync alike)
+    logging_config.forward_to(log_queue)
+    tracing.TRACER.buffer()
+    init_context(
+        setup_logger("dropzone.reading"),
+        setup_logger("dropzone.processing"),
+        *context,
+    )
+
+def build_process_pool(workers):
+    # spawn, not fork: the parent already runs the observer and logging threads
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_pool_worker,
+        initargs=(logging_config.pool_log_queue(),) + context_args(),
+    )
+
+# Fresh drops before rescans before retries; oldest first (or smallest first) within a class
+process_queue = file_queue.FileQueue(maxsize=2000)
 
 def claim_csv(file_path):
-    if not is_candidate(file_path, target = ".csv"):
+    return utils.claim_file(file_path, manifest, target=".csv")
+
+def release_claim(file_path, reset_attempts=False):
+    utils.release_claim(file_path, manifest, reset_attempts)
+
+def queue_csv(file_path, source, priority=file_queue.FRESH):
+    # While paused the CSV is not claimed at all: the rescan offers it again after resume
+    if flow_control is not None and flow_control.paused():
+        logger_ingest.info("⏸️ Deferred (%s, backpressure): %s", source, file_path)
         return False
-    
-    claimed_csv_lock.acquire()
+    queued = utils.queue_file(
+        file_path=file_path,
+        general_queue=process_queue,
+        logger=logger_ingest,
+        source=source,
+        manifest=manifest,
+        target=".csv",
+        priority=priority,
+    )
+    if queued:
+        queued_at[file_path] = time.time()
+    return queued
+
+def queue_arrivals(arrivals):
+    # One batch from the ArrivalTracker (utils/arrival.py): [(path, first event time)]
+    queued = 0
+    for file_path, seen_at in arrivals:
+        if not queue_csv(file_path, source="watchdog // incoming folder"):
+            continue
+        queued += 1
+        now = time.time()
+        STAGE_SECONDS.observe(now - seen_at, stage="arrival")
+        tracing.record(manifest.trace_id(file_path), "arrival", seen_at, now, file=os.path.basename(file_path))
+    if len(arrivals) > 1:
+        logger_ingest.info("🟣 %d arrivals in one batch, %d queued", len(arrivals), queued)
+    return queued
+
+def resume_incoming():
+    # Restart: re-queue CSVs that were in flight, clear finished leftovers, drop old rows
+    for file_path in manifest.leftovers():
+        utils.remove_finished(file_path, manifest, logger_ingest)
+    resumed = 0
+    for file_path in manifest.resume():
+        if queue_csv(file_path, source="resume", priority=file_queue.RESCAN):
+            resumed += 1
+    manifest.prune()
+    logger_ingest.info("🟣 Resumed %d in-flight CSV files from the manifest", resumed)
+    return resumed
+
+def header_plan(file_path):
+    # Column plan for the file's header (column_plan.py); a header seen before is not resolved again
+    plan, cached = column_plan.plan_for(file_path)
+    if not cached:
+        logger_ingest.info("🟣 New header %s: renamed %s, dropped %s", plan.fingerprint, plan.renamed or "-", plan.dropped or "-")
+        if plan.positional:
+            logger_ingest.warning("🟡 Header %s matched no aliases, columns taken by position: %s", plan.fingerprint, plan.header)
+    return plan
+
+def read_frame(file_path, plan, **kwargs):
+    return plan.order(pd.read_csv(file_path, **plan.pandas_options(), **kwargs))
+
+def read_csv(file_path, attempt=1, read=read_frame):
+    print("READING:", file_path)
+    logger_ingest.info("READING %s", file_path)
+
+    started = time.time()
     try:
-        if file_path in claimed_csv:
-            return False
-        claimed_csv.add(file_path)
-        return True
-    finally:
-        claimed_csv_lock.release()
+        plan = header_plan(file_path)
+        df = read(file_path, plan)
+        observe_stage("read", started, file_path, attempt=attempt, header=plan.fingerprint)
+        ROWS_IN.inc(len(df))
+        logger_ingest.info("✅ CSV's been successfully read: %s", file_path)
+        return df
+    except column_plan.HeaderError as e:
+        tracing.record(current_trace, "read", started, time.time(), file=os.path.basename(file_path), attempt=attempt, result="bad_header")
+        logger_ingest.error("❗Unknown CSV header, moving to failed/read: %s | %s", file_path, e)
+        move_to_failed_read(file_path)
+        return
+    except column_plan.IncompleteHeader as e:
+        tracing.record(current_trace, "read", started, time.time(), file=os.path.basename(file_path), attempt=attempt, result="partial_header")
+        logger_ingest.warning("🌀 CSV header incomplete: %s | %s, Attempt NO %d", file_path, e, attempt)
+    except Exception as e:
+        tracing.record(current_trace, "read", started, time.time(), file=os.path.basename(file_path), attempt=attempt, result="error")
+        logger_ingest.warning("🌀 Read csv failed. Path: %s, Attempt NO %d", file_path, attempt)
+
+    if attempt < MAX_ATTEMPTS:
+        return RETRY
+    logger_ingest.error("❗Read csv permaently failed: %s", file_path)
+    move_to_failed_read(file_path)
+    return
     
-def release_claim(file_path):
-    claimed_csv_lock.acquire()
+def parquet_paths(event_date):
+    fname = f"transactions_{event_date:%Y%m%d}_{datetime.now():%H%M%S}_{uuid4().hex}.parquet"
+    tmp_path = os.path.join(PROCESSED_DIR, "." + fname + ".tmp")
+    p_path = os.path.join(PROCESSED_DIR, fname)
+    return fname, tmp_path, p_path
+
+def observe_stage(stage, started, file_path, **attrs):
+    ended = time.time()
+    STAGE_SECONDS.observe(ended - started, stage=stage)
+    tracing.record(current_trace, stage, started, ended, file=os.path.basename(file_path), **attrs)
+
+def traced(schema, file_path):
+    return tracing.with_trace(schema, [current_trace], [os.path.basename(file_path)])
+
+def remove_csv(file_path, p_path, s3_key=None):
+    manifest.finish(file_path, "processed", output=p_path, s3_key=s3_key)
+    FILES.inc(stage="process", result="processed")
     try:
-        claimed_csv.discard(file_path)
-    finally:
-        claimed_csv_lock.release()
+        os.remove(file_path)
+        logger_process.info("✅ Parquet saved / CSV removed: %s", p_path)
+    except FileNotFoundError:
+        logger_process.warning("🟡 Parquet saved but CSV file already missing: %s", file_path)
+    except Exception:
+        logger_process.warning("🟡 Parquet saved but CSV  failed to remove: %s", file_path, exc_info=True)
+    return True
+
+def remove_empty_csv(file_path):
+    # Every row was filtered out: nothing to write, but the CSV is finished all the same (state
+    # "empty"), so neither resume nor a rescan claims it again
+    manifest.finish(file_path, "empty")
+    forget_delivery(file_path)
+    FILES.inc(stage="process", result="empty")
+    try:
+        os.remove(file_path)
+        logger_process.warning("🟡 All rows filtered out, no parquet written / CSV removed: %s", file_path)
+    except FileNotFoundError:
+        logger_process.warning("🟡 All rows filtered out but CSV file already missing: %s", file_path)
+    except Exception:
+        logger_process.warning("🟡 All rows filtered out but CSV failed to remove: %s", file_path, exc_info=True)
+    return False
 
-def queue_csv(file_path, source):
-    if not claim_csv(file_path):
-        return False
-    
+def move_to_failed_transform(file_path):
+    failed_path_t = os.path.join(FAILED_DIR_TRANSFORM, os.path.basename(file_path))
     try:
-        process_queue.put(file_path, timeout=1)
-        logger_ingest.info("-- Queued (%s): %s", source, file_path)
-        return True
-    except Full:
-        logger_ingest.warning("🟡 Queue full, could not enqueue: %s", file_path, exc_info=True)
-        release_claim(file_path)
+        os.replace(file_path, failed_path_t)
+        manifest.finish(file_path, "failed", path=failed_path_t)
+        FILES.inc(stage="process", result="failed_transform")
+        forget_delivery(file_path)
+        logger_process.info("🔴 File moved to failed/transform: %s", failed_path_t)
+    except Exception as e:
+        logger_process.warning("🟡 STUCK IN INCOMING FOLDER! Failed to move to failed/transform: %s", file_path)
+    return False
+
+def move_to_failed_read(file_path):
+    failed_path_r = os.path.join(FAILED_DIR_READ, os.path.basename(file_path))
+    try:
+        os.replace(file_path, failed_path_r)
+        manifest.finish(file_path, "failed", path=failed_path_r)
+        FILES.inc(stage="process", result="failed_read")
+        # A streamed file may have recorded the ids of its first chunks before the read failed
+        forget_delivery(file_path)
+        logger_ingest.info("File moved to failed/read: %s", failed_path_r)
+    except Exception as e:
+        logger_ingest.warning("🟡 STUCK IN INCOMING FOLDER! Failed to move to failed/read: %s", file_path)
+    return False
+
+def event_partitions(data):
+    # [(event date, rows of that date)] for a DataFrame or a pa.Table
+    if isinstance(data, pa.Table):
+        return arrow_engine.split_by_event_date(data)
+    days = data["transaction_ts"].dt.normalize()
+    return [(day.date(), part) for day, part in data.groupby(days, sort=True)]
+
+def conform(table, file_path):
+    # Output types (utils/parquet_layout.py): rows with a value that does not fit are dropped here
+    drops = {}
+    table = parquet_layout.conform(table, drops)
+    if drops.get("bad_type"):
+        ROWS_DROPPED.inc(drops["bad_type"], filter="bad_type")
+        logger_process.warning("🟡 %s: %d rows with values that do not fit the output types dropped", file_path, drops["bad_type"])
+    return table
+
+def write_tmp_parquet(df, file_path, attempt=1):
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
+
+    # All partitions are written to .tmp first and only then renamed, so a failure leaves none behind.
+    # With HANDOFF_MAX_BYTES they are written to memory first and only go to disk when too big
+    written = []   # (fname, tmp_path, p_path)
+    buffers = []   # Parquet bytes per partition (handoff)
+    sums = []      # checksums per partition, taken from the bytes as they are written
+    try:
+        started = time.time()
+        rows = 0
+        for event_date, part in event_partitions(df):
+            if not isinstance(part, pa.Table):
+                part = pa.Table.from_pandas(part, preserve_index=False)
+            table = conform(part, file_path)
+            if not table.num_rows:
+                continue
+            rows += table.num_rows
+            fname, tmp_path, p_path = parquet_paths(event_date)
+            written.append((fname, tmp_path, p_path))
+            if logger_process.isEnabledFor(logging.DEBUG):
+                logger_process.debug("tmp_path=%r schema: %s", tmp_path, dict(zip(table.schema.names, map(str, table.schema.types))))
+            if HANDOFF_MAX_BYTES:
+                sink = pa.BufferOutputStream()
+                parquet_layout.write_table(table, sink, traced(table.schema, file_path).metadata)
+                buffers.append(sink.getvalue())
+            else:
+                with HashingFile(tmp_path) as sink:
+                    parquet_layout.write_table(table, sink, traced(table.schema, file_path).metadata)
+                sums.append(sink.result())
+        if not written:
+            return remove_empty_csv(file_path)
+
+        if buffers and sum(buffer.size for buffer in buffers) <= HANDOFF_MAX_BYTES:
+            outputs = [(fname, buffer.to_pybytes()) for (fname, _, _), buffer in zip(written, buffers)]
+            observe_stage("write", started, file_path, attempt=attempt, rows=rows, parquet=",".join(fname for fname, _ in outputs))
+            ROWS_OUT.inc(rows)
+            return outputs
+        for (_, tmp_path, _), buffer in zip(written, buffers):
+            with open(tmp_path, "wb") as f:
+                f.write(buffer)
+            sums.append(buffer_checksums(buffer))
+        for (fname, tmp_path, p_path), checksums in zip(written, sums):
+            write_sidecar(p_path, checksums)
+            os.replace(tmp_path, p_path)
+        fnames = ",".join(fname for fname, _, _ in written)
+        observe_stage("write", started, file_path, attempt=attempt, rows=rows, parquet=fnames)
+        ROWS_OUT.inc(rows)
+        logger_process.info("✅ Parquet is ready in processed folder: %s", fnames)
+        return remove_csv(file_path, ",".join(p_path for _, _, p_path in written))
+    except Exception as e:
+        logger_process.warning("🌀 Failed to write parquet for %s, Attempt NO %d", file_path, attempt, exc_info=True)
+        for _, tmp_path, p_path in written:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            if not os.path.exists(p_path):
+                remove_sidecar(p_path)
+
+    if attempt < MAX_ATTEMPTS:
+        return RETRY
+    logger_process.error("🔴 Write parquet permaently failed: %s", file_path)
+    return move_to_failed_transform(file_path)
+
+def use_streaming(file_path):
+    if STREAM_CHUNK_ROWS <= 0:
         return False
-    
-    except Exception:
-        logger_ingest.warning("🟡 Adding to queue failed: %s", file_path, exc_info=True)
-        release_claim(file_path)
+    try:
+        return os.path.getsize(file_path) >= STREAM_MIN_BYTES
+    except OSError:
         return False
 
-def read_csv(file_path):
-    print("READING:", file_path)
-    logger_ingest.info("READING %s", file_path)
-
-    for attempt in range(1,4):
-        try:
-            df = pd.read_csv(file_path)
-            logger_ingest.info("✅ CSV's been successfully read: %s", file_path)
-            return df
-        except Exception as e:
-            logger_ingest.warning("🌀 Read csv failed. Path: %s, Attempt NO %d", file_path, attempt)
-            time.sleep(30)
-        
-    else:
-        logger_ingest.error("❗Read csv permaently failed: %s", file_path)
-        failed_path_r = os.path.join(FAILED_DIR_READ, os.path.basename(file_path))
-        try:
-            os.replace(file_path, failed_path_r)
-            logger_ingest.info("File moved to failed/read: %s", failed_path_r)
-        except Exception as e:
-            logger_ingest.warning("🟡 STUCK IN INCOMING FOLDER! Failed to move to failed/read: %s", file_path)
-        return
-    
-def write_tmp_parquet(df,file_path):
+def write_streaming_parquet(file_path, attempt=1):
+    # Bounded memory: one chunk of STREAM_CHUNK_ROWS rows in flight, one row group appended per chunk
+    # and event date (one open writer per date). Cross-chunk transaction_id dedup keeps ~8 bytes per
+    # unique id (SeenIds) in memory up to STREAM_MEMORY_IDS ids, memory-mapped files in
+    # PROCESSED_DIR beyond that
     os.makedirs(PROCESSED_DIR, exist_ok=True)
 
-    fname = f"transactions_{datetime.now():%Y%m%d_%H%M%S}_{uuid4().hex}.parquet"
-    tmp_path = os.path.join(PROCESSED_DIR, "." + fname + ".tmp")
-    p_path = os.path.join(PROCESSED_DIR, fname)
+    logger_process.info("🌀 STREAMING %s in chunks of %d rows", file_path, STREAM_CHUNK_ROWS)
 
-    for attempt in range(1,4):
-        try:
-            logger_process.info("PROCESSED_DIR=%r tmp_path=%r", PROCESSED_DIR, tmp_path)
-            logger_process.info("dtypes: %s", df.dtypes.to_dict())
-            df.to_parquet(tmp_path, index=False)
+    stage = "read"
+    writers = {}   # event date -> (writer, sink, fname, tmp_path, p_path)
+    rows_in = rows_out = 0
+    started = time.time()
+    try:
+        seen_ids = SeenIds(STREAM_MEMORY_IDS, spill_dir=PROCESSED_DIR)
+        plan = header_plan(file_path)
+        with pd.read_csv(file_path, chunksize=STREAM_CHUNK_ROWS, **plan.pandas_options()) as reader:
+            for chunk in reader:
+                stage = "transform"
+                rows_in += len(chunk)
+                df = drop_seen_elsewhere(transform_df(plan.order(chunk), file_path, seen_ids=seen_ids), file_path)
+                for event_date, part in event_partitions(df):
+                    table = conform(pa.Table.from_pandas(part, preserve_index=False), file_path)
+                    if not table.num_rows:
+                        continue
+                    if event_date not in writers:
+                        fname, tmp_path, p_path = parquet_paths(event_date)
+                        sink = HashingFile(tmp_path)
+                        writer = parquet_layout.writer(sink, traced(table.schema, file_path), rows=STREAM_CHUNK_ROWS)
+                        writers[event_date] = (writer, sink, fname, tmp_path, p_path)
+                    writer = writers[event_date][0]
+                    parquet_layout.write_batch(writer, table.cast(writer.schema))
+                    rows_out += table.num_rows
+                stage = "read"
+
+        if not writers:
+            ROWS_IN.inc(rows_in)
+            return remove_empty_csv(file_path)
+
+        stage = "transform"
+        for writer, sink, _, _, _ in writers.values():
+            writer.close()
+            sink.close()
+        for _, sink, _, tmp_path, p_path in writers.values():
+            write_sidecar(p_path, sink.result())
             os.replace(tmp_path, p_path)
-            logger_process.info("✅ Parquet is ready in processed folder: %s", fname)
-
+        fnames = ",".join(fname for _, _, fname, _, _ in writers.values())
+        observe_stage("stream", started, file_path, attempt=attempt, rows=rows_out, parquet=fnames)
+        ROWS_IN.inc(rows_in)
+        ROWS_OUT.inc(rows_out)
+        logger_process.info("✅ Parquet is ready in processed folder: %s (%d of %d rows)", fnames, rows_out, rows_in)
+        return remove_csv(file_path, ",".join(p_path for _, _, _, _, p_path in writers.values()))
+
+    except column_plan.HeaderError as e:
+        logger_ingest.error("❗Unknown CSV header, moving to failed/read: %s | %s", file_path, e)
+        return move_to_failed_read(file_path)
+    except column_plan.IncompleteHeader as e:
+        logger_ingest.warning("🌀 CSV header incomplete: %s | %s, Attempt NO %d", file_path, e, attempt)
+    except Exception as e:
+        logger_process.warning("🌀 Streaming %s failed at %s, Attempt NO %d", file_path, stage, attempt, exc_info=True)
+        for writer, sink, _, tmp_path, p_path in writers.values():
             try:
-                os.remove(file_path)
-                logger_process.info("✅ Parquet saved / CSV removed: %s", p_path)
-                return True
-            except FileNotFoundError:
-                logger_process.warning("🟡 Parquet saved but CSV file already missing: %s", file_path)
-                return True
+                writer.close()
             except Exception:
-                logger_process.warning("🟡 Parquet saved but CSV  failed to remove: %s", file_path, exc_info=True)
-                return True
-        except Exception as e:
-            logger_process.warning("🌀 Failed to write parquet: %s, Attempt NO %d", fname, attempt, exc_info=True)
+                pass
+            sink.close()
             try:
                 os.remove(tmp_path)
             except FileNotFoundError:
                 pass
-            time.sleep(30)
-    else:
-        logger_process.error("🔴 Write parquet permaently failed: %s", fname)
-        failed_path_t = os.path.join(FAILED_DIR_TRANSFORM, os.path.basename(file_path))
-        try:
-            os.replace(file_path, failed_path_t)
-            logger_process.info("🔴 File moved to failed/transform: %s", failed_path_t)
-            return False
-        except Exception as e:
-            logger_process.warning("🟡 STUCK IN INCOMING FOLDER! Failed to move to failed/transform: %s", file_path)
-        return False
+            if not os.path.exists(p_path):
+                remove_sidecar(p_path)
+
+    if attempt < MAX_ATTEMPTS:
+        return RETRY
+    if stage == "read":
+        logger_ingest.error("❗Read csv permaently failed: %s", file_path)
+        return move_to_failed_read(file_path)
+    logger_process.error("🔴 Write parquet permaently failed: %s", file_path)
+    return move_to_failed_transform(file_path)
 
  #"transaction_id",
  #"transaction_ts",
@@ -154,90 +507,272 @@ def write_tmp_parquet(df,file_path):
  #"status",
  #"product_id",
  #"payment_method"
-def process_file(file_path):
-    df = read_csv(file_path)
-    if df is None:
-        return False
-
-    print("🌀 PROCESS:", file_path)
-    if len(CORRECT_COLUMN_NAMES )== df.shape[1]:
-        # We are only considering cases where the problem lies in the column names
-        # but not in their order or number
-        # So in test case -- columns always fine
-        df.columns = CORRECT_COLUMN_NAMES
-        logger_process.info("🟣 Processing: columns are fine")
-    else:
-        logger_process.warning("🟡 Unexpected column count (%d) for %s", df.shape[1], file_path)
-    
+def drop_rows(df, keep, reason):
+    kept = df[keep]
+    if len(kept) < len(df):
+        ROWS_DROPPED.inc(len(df) - len(kept), filter=reason)
+    return kept
+
+def transform_df(df, file_path, seen_ids=None):
+    # Columns arrive under canonical names from the header plan (read_frame)
     ts = pd.to_datetime(df.get("transaction_ts"), errors="coerce")
-    df = df[ts.notna()]
+    df = drop_rows(df, ts.notna(), "bad_ts")
     df["transaction_ts"] = ts
 
-    today = pd.Timestamp.today().date()
-    mask_today = df["transaction_ts"].dt.date == today
-    df = df[mask_today]
-    logger_process.info("🟣 Processing: filtered dates for -- %s", today)
+    today = pd.Timestamp.today().normalize()
+    event_day = df["transaction_ts"].dt.normalize()
+    in_window = (event_day >= today - pd.Timedelta(days=LATE_DATA_DAYS)) & (event_day <= today + pd.Timedelta(days=1))
+    df = drop_rows(df, in_window, "out_of_window")
+    logger_process.info("🟣 Processing: kept event dates from %s to %s", (today - pd.Timedelta(days=LATE_DATA_DAYS)).date(), (today + pd.Timedelta(days=1)).date())
 
-    df = df[df["user_id"].notna() & (df["user_id"] != "")]
-    df = df[df["currency"].isin(VALID_CURRENCIES) | df["currency"].isin(CURRENCY_MAPPING)]
-    df["currency"] = df["currency"].replace(CURRENCY_MAPPING)
+    df = drop_rows(df, df["user_id"].notna() & (df["user_id"] != ""), "empty_user")
+    df["currency"] = CURRENCY_TABLE.normalize_series(df["currency"])
+    df = drop_rows(df, df["currency"].notna(), "bad_currency")
     logger_process.info("🟣 Processing: currency mapping")
 
     df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
-    df = df[df["amount"].notna()]
-    df = df[df["amount"] >= 0]
+    df = drop_rows(df, df["amount"].notna(), "bad_amount")
+    df = drop_rows(df, df["amount"] >= 0, "bad_amount")
     logger_process.info("🟣 Processing: valid amount")
 
-    df = df[df["transaction_id"].notna()]
-    df = df.drop_duplicates(subset=["transaction_id"])
+    df = drop_rows(df, df["transaction_id"].notna(), "no_transaction_id")
+    if seen_ids is None:
+        df = drop_rows(df, ~df["transaction_id"].duplicated(), "duplicate")
+    else:
+        df = drop_rows(df, seen_ids.first_seen(df["transaction_id"]), "duplicate")
 
-    df = df[df["status"].isin(CANONICAL_STATUS) | df["status"].isin(STATUS_MAPPING)]
-    df["status"] = df["status"].replace(STATUS_MAPPING)
+    df["status"] = STATUS_TABLE.normalize_series(df["status"])
+    df = drop_rows(df, df["status"].notna(), "status")
     logger_process.info("🟣 Processing: transaction status mapping")
 
-    df = df[df["payment_method"].isin(CANONICAL_PAYMENT_METHODS) | df["payment_method"].isin(PAYMENT_METHOD_MAPPING)]
-    df["payment_method"] = df["payment_method"].replace(PAYMENT_METHOD_MAPPING)
+    df["payment_method"] = PAYMENT_METHOD_TABLE.normalize_series(df["payment_method"])
+    df = drop_rows(df, df["payment_method"].notna(), "payment_method")
     logger_process.info("🟣 Processing: payment method mapping")
+    return df
+
+def delivery_id(file_path):
+    # Dedup source of the file being processed: its claim's trace id, kept across retries and new
+    # for every new version of the file (manifest.claim), so a resend under the same name is
+    # another delivery. Without a manifest row: name, size and mtime
+    trace_id = current_trace or manifest.trace_id(file_path)
+    if trace_id:
+        return trace_id
+    size, mtime = file_stat(file_path)
+    return f"{os.path.basename(file_path)}:{size}:{mtime}"
+
+def forget_delivery(file_path):
+    # The delivery published no output (yet): the ids it recorded must not hold back a corrected
+    # resend. A retry of the same delivery records them again
+    if dedup_index is not None:
+        dedup_index.forget(delivery_id(file_path))
+
+def drop_seen_elsewhere(data, file_path):
+    # Rows whose transaction_id an earlier file already delivered (DataFrame or pa.Table)
+    if dedup_index is None or not len(data):
+        return data
+    is_table = isinstance(data, pa.Table)
+    ids = data["transaction_id"].to_pandas() if is_table else data["transaction_id"]
+    keep = dedup_index.first_seen(ids, delivery_id(file_path))
+    dropped = len(keep) - int(keep.sum())
+    if dropped:
+        ROWS_DROPPED.inc(dropped, filter="duplicate_cross_file")
+        logger_process.info("🟣 Processing: %d transaction_ids already delivered by earlier files", dropped)
+    return data.filter(pa.array(keep)) if is_table else data[keep]
+
+def process_file(file_path, attempt=1):
+    if use_streaming(file_path):
+        return write_streaming_parquet(file_path, attempt)
+
+    if TRANSFORM_ENGINE == "arrow":
+        return process_file_arrow(file_path, attempt)
+
+    df = read_csv(file_path, attempt)
+    if df is None:
+        return False
+    if df is RETRY:
+        return RETRY
+
+    print("🌀 PROCESS:", file_path)
+    started = time.time()
+    df = drop_seen_elsewhere(transform_df(df, file_path), file_path)
+    observe_stage("transform", started, file_path, attempt=attempt)
 
     if df.empty:
-        logger_process.warning("🟡 All rows filtered out, skipping parquet write: %s", file_path)
+        return remove_empty_csv(file_path)
+
+    print("🌀 WRITING:", file_path)
+    return write_tmp_parquet(df, file_path, attempt)
+
+def process_file_arrow(file_path, attempt=1):
+    table = read_csv(file_path, attempt, read=arrow_engine.read_table)
+    if table is None:
         return False
+    if table is RETRY:
+        return RETRY
+
+    print("🌀 PROCESS (arrow):", file_path)
+    started = time.time()
+    drops = {}
+    table = drop_seen_elsewhere(arrow_engine.transform_table(table, drops=drops, late_days=LATE_DATA_DAYS), file_path)
+    observe_stage("transform", started, file_path, attempt=attempt)
+    for reason, dropped in drops.items():
+        if dropped:
+            ROWS_DROPPED.inc(dropped, filter=reason)
+    logger_process.info("🟣 Processing (arrow): %d rows kept", table.num_rows)
+
+    if table.num_rows == 0:
+        return remove_empty_csv(file_path)
 
     print("🌀 WRITING:", file_path)
-    write_tmp_parquet(df, file_path)
+    return write_tmp_parquet(table, file_path, attempt)
 
+def process_file_in_pool(file_path, attempt, trace_id=None):
+    # Pool entry point: the result plus the metrics and spans this file produced in the pool process
+    global current_trace
+    current_trace = trace_id
+    return process_file(file_path, attempt), REGISTRY.drain(), tracing.TRACER.drain()
 
-def process_worker(stop_processing):
-    logger_process.info("--Process worker started")
+# Files waiting in the RetryScheduler keep their claim (state "queued" in the manifest)
+def requeue_retry(file_path):
+    if not os.path.exists(file_path):
+        release_claim(file_path)
+        return True
+    try:
+        process_queue.put_nowait((file_path, file_queue.RETRY))
+    except Full:
+        return False
+    queued_at[file_path] = time.time()
+    logger_ingest.info("-- Queued (retry, attempt NO %d): %s", manifest.attempts(file_path) + 1, file_path)
+    return True
 
-    while not stop_processing.is_set():
-        try:
-            file_path = process_queue.get(timeout=1)
-        except Empty:
-            continue
+def finish_handoff(file_path, output, s3_keys=None):
+    # Called by the upload side once every handed-off output is in S3 or spilled to processed/
+    # (output=None: neither worked, the CSV stays in incoming/ for the rescan)
+    try:
+        if output is not None:
+            remove_csv(file_path, output, s3_keys or None)
+        else:
+            forget_delivery(file_path)
+    finally:
+        release_claim(file_path, reset_attempts=output is not None)
 
-        try:
-            logger_process.info("--Start process: %s", file_path)
-            process_file(file_path)
+def finish_processing(file_path, attempt, slots, scheduler, future):
+    retry = False
+    handed_off = False
+    try:
+        result, collected, spans = future.result()
+        manifest.survived(file_path)
+        REGISTRY.merge(collected)
+        tracing.TRACER.extend(spans)
+        if isinstance(result, list):
+            # Parquet bytes for the upload side; the claim is released in finish_handoff
+            handoff(file_path, result, manifest.trace_id(file_path))
+            handed_off = True
+            logger_process.info("✅ PROCESS WORKER -- handed off %d Parquet in memory: %s", len(result), file_path)
+        elif result == RETRY:
+            retry = True
+            forget_delivery(file_path)
+            RETRIES.inc(stage="process")
+            manifest.set_state(file_path, "queued")
+            delay = scheduler.schedule(file_path, attempt)
+            logger_process.info("🌀 Retry NO %d of %s in %.0fs", attempt + 1, file_path, delay)
+        else:
             logger_process.info("✅ PROCESS WORKER -- finished: %s", file_path)
-        finally:
-            process_queue.task_done()
-            release_claim(file_path)
+    except BrokenProcessPool:
+        # Every file in flight sees the crash, and only one of them may have caused it (OOM kill,
+        # segfault): each gets its attempt back and a crash counted instead. A file that was in
+        # flight for MAX_ATTEMPTS crashes in a row goes to failed/transform
+        FILES.inc(stage="process", result="pool_crash")
+        forget_delivery(file_path)
+        crashes = manifest.crashed(file_path)
+        if crashes >= MAX_ATTEMPTS:
+            logger_process.error("🔴 Process pool broke %d times in a row while handling %s", crashes, file_path)
+            move_to_failed_transform(file_path)
+        else:
+            retry = True
+            RETRIES.inc(stage="process")
+            manifest.set_state(file_path, "queued")
+            delay = scheduler.schedule(file_path, crashes)
+            logger_process.error("🔴 Process pool broken while handling %s (crash NO %d), retry in %.0fs", file_path, crashes, delay)
+    except Exception:
+        FILES.inc(stage="process", result="crashed")
+        forget_delivery(file_path)
+        logger_process.warning("🟡 PROCESS WORKER -- crashed on: %s", file_path, exc_info=True)
+    finally:
+        process_queue.task_done()
+        if not retry:
+            queued_at.pop(file_path, None)
+        if not retry and not handed_off:
+            release_claim(file_path, reset_attempts=True)
+        slots.release()
+
+def process_worker(stop_processing, workers=1, retry_base_delay=30, retry_max_delay=600):
+    logger_process.info("--Process worker started: %d process(es)", workers)
+
+    # One slot per pool process: files wait in process_queue, not inside the executor
+    slots = threading.BoundedSemaphore(workers)
+    pool = build_process_pool(workers)
+
+    global retry_scheduler
+    scheduler = retry_scheduler = RetryScheduler(requeue_retry, logger_process, retry_base_delay, retry_max_delay)
+    threading.Thread(target=scheduler.run, args=(stop_processing,), daemon=True).start()
 
-def incoming_rescan_loop(stop_processing):
+    try:
+        while not stop_processing.is_set():
+            if flow_control is not None and not flow_control.wait_open(timeout=1):
+                continue
+            if not slots.acquire(timeout=1):
+                continue
+            try:
+                file_path = process_queue.get(timeout=1)
+            except Empty:
+                slots.release()
+                continue
+
+            attempt = manifest.start(file_path, "processing")
+            trace_id = manifest.trace_id(file_path)
+            dispatched = time.time()
+            tracing.record(trace_id, "queue_wait", queued_at.pop(file_path, dispatched), dispatched,
+                           file=os.path.basename(file_path), attempt=attempt)
+            logger_process.info("--Start process: %s", file_path)
+            try:
+                future = pool.submit(process_file_in_pool, file_path, attempt, trace_id)
+            except BrokenProcessPool:
+                logger_process.error("🔴 Process pool broken, restarting %d process(es)", workers)
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = build_process_pool(workers)
+                future = pool.submit(process_file_in_pool, file_path, attempt, trace_id)
+
+            future.add_done_callback(partial(finish_processing, file_path, attempt, slots, scheduler))
+    finally:
+        pool.shutdown(wait=True)
+        logger_process.info("--Process worker stopped")
+
+def register_metrics(registry=REGISTRY):
+    # Scrape-time gauges for the processor service
+    registry.gauge("dropzone_queue_depth", "Files waiting in the queue", lambda: {"process": process_queue.qsize()}, ("queue",))
+    registry.gauge("dropzone_claims", "Files claimed by this run per manifest state", manifest.counts, ("state",))
+    registry.gauge("dropzone_retries_pending", "Files waiting for a delayed retry",
+                   lambda: {"process": len(retry_scheduler) if retry_scheduler else 0}, ("stage",))
+    registry.gauge("dropzone_failed_files", "Files in the failed folders", lambda: {
+        "read": count_files(FAILED_DIR_READ),
+        "transform": count_files(FAILED_DIR_TRANSFORM),
+    }, ("folder",))
+    if flow_control is not None:
+        registry.gauge("dropzone_backpressure_paused", "1 while intake is paused by backpressure", lambda: int(flow_control.paused()))
+
+def incoming_rescan_loop(stop_processing, interval=60, arrivals=None, settle_s=0):
+    # Files the arrival tracker is still settling, or written during the last settle_s seconds,
+    # may still be growing: they wait for the tracker or the next pass
     logger_ingest.info("🌀 -- Rescan INCOMING folder for missed files -- 🌀")
+    cursor = DirCursor(INCOMING_DIR, ".csv", settle_s=settle_s)
+    skip = arrivals.busy if arrivals is not None else None
     while not stop_processing.is_set():
-        pattern = os.path.join(INCOMING_DIR, "*.csv")
-        found = 0
-        queued = 0
-
-        for file_path in sorted(glob.glob(pattern)):
-            if stop_processing.is_set():
-                break
-            found += 1
-            logger_ingest.info("🟡 Located csv-file in INCOMING FOLDER: %s", file_path)
-            if queue_csv(file_path, source="rescan incoming folder"):
-                logger_ingest.info("🟣 Missed CSV file was queued for processing: %s", file_path)
-                queued += 1
-
-        stop_processing.wait(60)
\ No newline at end of file
+        manifest.prune_if_due()
+        if flow_control is not None and flow_control.paused():
+            stop_processing.wait(1)
+            continue
+        found, queued = rescan_once(cursor, partial(queue_csv, source="rescan incoming folder", priority=file_queue.RESCAN), process_queue, stop_processing, skip)
+        if found:
+            logger_ingest.info("🟣 Rescan INCOMING: %d new or changed csv files, %d queued", found, queued)
+        stop_processing.wait(interval)
@@ -1,55 +1,199 @@
-from watchdog.events import FileSystemEventHandler
 import time
 import os
 from dotenv import load_dotenv
-from logging_config import setup_logger
-from aws.s3_utils import build_s3, s3_cfg
-
-from log_shipper.log_shipper import ship_ratated_logs
+from logging_config import setup_logger, configure_logging, LOG_SHIP
 import threading
 from incoming_watcher import process_worker as pw
+from compactor.compactor import compaction_loop
+from utils.flow_control import FlowControl
+from utils.parquet_layout import ParquetLayout, column_list
+from utils.metrics import serve_metrics
+from utils.arrival import ArrivalTracker, ArrivalHandler
+from utils import tracing
 
 load_dotenv()
 
 USE_POLLING = os.getenv("WATCHDOG_POLLING", "0") == "1"
+# Polling observer: seconds between directory snapshots
+WATCHDOG_POLL_S = float(os.getenv("WATCHDOG_POLL_S", "0.5"))
 if USE_POLLING:
-    from watchdog.observers.polling import PollingObserver as Observer
+    from functools import partial
+    from watchdog.observers.polling import PollingObserver
+    Observer = partial(PollingObserver, timeout=WATCHDOG_POLL_S)
 else:
     from watchdog.observers import Observer
 
-logger_ingest = setup_logger("dropzone.reading")
-logger_process = setup_logger("dropzone.processing")
-logger_uploader = setup_logger("dropzone.uploader")
 
 INCOMING_DIR = os.getenv("INCOMING_DIR")
 PROCESSED_DIR = os.getenv("PROCESSED_DIR")
 FAILED_DIR_READ = os.getenv("FAILED_DIR_READ")
 FAILED_DIR_TRANSFORM = os.getenv("FAILED_DIR_TRANSFORM")
+PROCESS_WORKERS = int(os.getenv("PROCESS_WORKERS", "1"))
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "250000"))
+STREAM_MIN_FILE_MB = float(os.getenv("STREAM_MIN_FILE_MB", "256"))
+# Memory for the transaction_ids of one streamed file (~16 bytes per id); beyond it they go to disk
+STREAM_DEDUP_MEMORY_MB = float(os.getenv("STREAM_DEDUP_MEMORY_MB", "64"))
+TRANSFORM_ENGINE = os.getenv("TRANSFORM_ENGINE", "pandas")
+# One Parquet per event date; rows dated more than LATE_DATA_DAYS before today are dropped
+LATE_DATA_DAYS = int(os.getenv("LATE_DATA_DAYS", "7"))
+
+# Parquet layout (utils/parquet_layout.py). Column lists are comma-separated, "all" or "none"
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+PARQUET_COMPRESSION_LEVEL = os.getenv("PARQUET_COMPRESSION_LEVEL", "")
+PARQUET_ROW_GROUP_ROWS = int(os.getenv("PARQUET_ROW_GROUP_ROWS", "1000000"))
+PARQUET_SORT_BY = os.getenv("PARQUET_SORT_BY", "transaction_ts,user_id")
+PARQUET_DICTIONARY = os.getenv("PARQUET_DICTIONARY", "currency,status,payment_method,product_id")
+PARQUET_STATISTICS = os.getenv("PARQUET_STATISTICS", "all")
+PARQUET_PAGE_INDEX = os.getenv("PARQUET_PAGE_INDEX", "1") == "1"
+PARQUET_BLOOM_FILTERS = os.getenv("PARQUET_BLOOM_FILTERS", "")
+PARQUET_BLOOM_FPP = float(os.getenv("PARQUET_BLOOM_FPP", "0.05"))
+RETRY_BASE_S = float(os.getenv("RETRY_BASE_S", "30"))
+RETRY_MAX_S = float(os.getenv("RETRY_MAX_S", "600"))
+MANIFEST_DB = os.getenv("MANIFEST_DB", "./file_storage/state/processor.db")
+
+# Cross-file transaction_id dedup: ids delivered during the last DEDUP_WINDOW_DAYS days (0 = off)
+DEDUP_WINDOW_DAYS = int(os.getenv("DEDUP_WINDOW_DAYS", "7"))
+DEDUP_DB = os.getenv("DEDUP_DB", "./file_storage/state/dedup.db")
+
+# Files written in place (no tmp + rename): queued once they were not written for ARRIVAL_QUIET_S
+# (also after close-write) and their size is stable; a file not ending in a newline waits up to
+# ARRIVAL_MAX_WAIT_S. The rescan skips files written during the last ARRIVAL_QUIET_S too
+ARRIVAL_QUIET_S = float(os.getenv("ARRIVAL_QUIET_S", "2"))
+ARRIVAL_MAX_WAIT_S = float(os.getenv("ARRIVAL_MAX_WAIT_S", "10"))
+
+# Smallest CSV first within a priority class (a file waiting > 5 min goes first anyway)
+QUEUE_SHORTEST_FIRST = os.getenv("QUEUE_SHORTEST_FIRST", "0") == "1"
+
+# Backpressure: pause intake while processed/ (+ failed/upload, staging) holds too much or the disk
+# runs low; resume under the low watermarks. 0 turns a check off
+FAILED_DIR_UPLOAD = os.getenv("FAILED_DIR_UPLOAD")
+BACKPRESSURE_HIGH_FILES = int(os.getenv("BACKPRESSURE_HIGH_FILES", "5000"))
+BACKPRESSURE_LOW_FILES = int(os.getenv("BACKPRESSURE_LOW_FILES", "2500"))
+BACKPRESSURE_HIGH_MB = float(os.getenv("BACKPRESSURE_HIGH_MB", "4096"))
+BACKPRESSURE_LOW_MB = float(os.getenv("BACKPRESSURE_LOW_MB", "2048"))
+MIN_FREE_DISK_MB = float(os.getenv("MIN_FREE_DISK_MB", "1024"))
+RESUME_FREE_DISK_MB = float(os.getenv("RESUME_FREE_DISK_MB", "2048"))
+
+# Prometheus text metrics on http://<host>:METRICS_PORT/metrics (0 = off)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))
+
+# Per-file spans as JSON lines, read by `python3 -m utils.trace_report` (empty = off)
+TRACE_FILE = os.getenv("TRACE_FILE", "./logs/traces/processor.jsonl")
+
+# Compaction: workers write small Parquet into STAGING_DIR, compaction merges it into PROCESSED_DIR
+COMPACTION = os.getenv("COMPACTION", "0") == "1"
+STAGING_DIR = os.getenv("STAGING_DIR", "./file_storage/staging")
+COMPACT_TARGET_MB = float(os.getenv("COMPACT_TARGET_MB", "128"))
+COMPACT_MAX_AGE_S = int(os.getenv("COMPACT_MAX_AGE_S", "300"))
+
+# Combined runtime: this process also uploads. Outputs of up to HANDOFF_MAX_MB go from the pool
+# to S3 in memory, with at most HANDOFF_BUDGET_MB of them waiting for an upload thread; anything
+# else (larger, streamed, spilled after a failed upload) goes through processed/ as usual.
+# Compaction needs the staged files on disk, so it turns the in-memory handoff off
+COMBINED_RUNTIME = os.getenv("COMBINED_RUNTIME", "0") == "1"
+HANDOFF_MAX_MB = float(os.getenv("HANDOFF_MAX_MB", "64"))
+HANDOFF_BUDGET_MB = float(os.getenv("HANDOFF_BUDGET_MB", "256"))
 
-pw.init_context(
-    logger_ingest,
-    logger_process,
-    INCOMING_DIR,
-    PROCESSED_DIR,
-    FAILED_DIR_READ,
-    FAILED_DIR_TRANSFORM,
-)
-
-S3_BUCKET = os.getenv("S3_BUCKET")
-AWS_REGION = os.getenv("AWS_REGION")
-s3 = build_s3(AWS_REGION, s3_cfg)
-
-class IngestingFileHandler(FileSystemEventHandler):
-    def on_moved(self, event):
-        if event.is_directory:
-            return
-        
-        file_path = event.dest_path
-        pw.queue_csv(file_path, source= "watchdog // incomong_folder")
-        
 
 if __name__ == "__main__":
+    # Service wiring only here: spawned pool processes re-import this module as __mp_main__ and
+    # must not open their own manifest, loggers, flow control or S3 client (see init_pool_worker)
     import socket, os, sys, signal
+
+    configure_logging("processor")
+    logger_ingest = setup_logger("dropzone.reading")
+    logger_process = setup_logger("dropzone.processing")
+    logger_uploader = setup_logger("dropzone.uploader")
+
+    parquet_layout = ParquetLayout(
+        compression=PARQUET_COMPRESSION,
+        compression_level=int(PARQUET_COMPRESSION_LEVEL) if PARQUET_COMPRESSION_LEVEL else None,
+        row_group_rows=PARQUET_ROW_GROUP_ROWS,
+        sort_by=column_list(PARQUET_SORT_BY) or (),
+        dictionary=column_list(PARQUET_DICTIONARY),
+        statistics=column_list(PARQUET_STATISTICS),
+        page_index=PARQUET_PAGE_INDEX,
+        bloom_filters=column_list(PARQUET_BLOOM_FILTERS) or (),
+        bloom_fpp=PARQUET_BLOOM_FPP,
+    )
+
+    flow_control = FlowControl(
+        [PROCESSED_DIR, FAILED_DIR_UPLOAD, STAGING_DIR if COMPACTION else None],
+        logger_process,
+        high_files=BACKPRESSURE_HIGH_FILES,
+        low_files=BACKPRESSURE_LOW_FILES,
+        high_bytes=int(BACKPRESSURE_HIGH_MB * 1024 * 1024),
+        low_bytes=int(BACKPRESSURE_LOW_MB * 1024 * 1024),
+        min_free_bytes=int(MIN_FREE_DISK_MB * 1024 * 1024),
+        resume_free_bytes=int(RESUME_FREE_DISK_MB * 1024 * 1024),
+    )
+
+    pw.init_context(
+        logger_ingest,
+        logger_process,
+        INCOMING_DIR,
+        STAGING_DIR if COMPACTION else PROCESSED_DIR,
+        FAILED_DIR_READ,
+        FAILED_DIR_TRANSFORM,
+        stream_chunk_rows=STREAM_CHUNK_ROWS,
+        stream_min_bytes=int(STREAM_MIN_FILE_MB * 1024 * 1024),
+        stream_memory_ids=int(STREAM_DEDUP_MEMORY_MB * 1024 * 1024 / 16),
+        transform_engine=TRANSFORM_ENGINE,
+        manifest_path=MANIFEST_DB,
+        dedup_path=DEDUP_DB if DEDUP_WINDOW_DAYS > 0 else None,
+        dedup_window_days=DEDUP_WINDOW_DAYS,
+        late_data_days=LATE_DATA_DAYS,
+        layout=parquet_layout,
+        handoff_max_bytes=int(HANDOFF_MAX_MB * 1024 * 1024) if COMBINED_RUNTIME and not COMPACTION else 0,
+        flow=flow_control,
+        shortest_first=QUEUE_SHORTEST_FIRST,
+    )
+
+    if COMBINED_RUNTIME:
+        from aws.s3_utils import shared_s3, pool_size, start_warming, build_transfer_config
+        from s3_upload import uploader_worker as upw
+        from log_shipper.log_shipper import ship_rotated_logs
+
+        # Same settings as s3_upload/s3_parquet_uploader.py
+        S3_BUCKET = os.getenv("S3_BUCKET")
+        UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+        UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+        S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "0"))
+        S3_WARM_CONNECTIONS = int(os.getenv("S3_WARM_CONNECTIONS", "4"))
+        if not S3_BUCKET:
+            logger_uploader.error("❗S3_Bucket unavaliable")
+            raise SystemExit("S3_Bucket is required with COMBINED_RUNTIME=1")
+
+        # Upload workers, handoff threads and the log shipper share one client and its connection pool
+        s3 = shared_s3(
+            os.getenv("AWS_REGION"),
+            max_pool_connections=S3_MAX_POOL_CONNECTIONS or pool_size(2 * UPLOAD_WORKERS, UPLOAD_CONCURRENCY),
+            endpoint_url=os.getenv("S3_ENDPOINT_URL", ""),
+            tcp_keepalive=os.getenv("S3_TCP_KEEPALIVE", "1") == "1",
+        )
+        upw.init_context(
+            logger_uploader,
+            logger_ingest,
+            os.getenv("AWS_REGION"),
+            S3_BUCKET,
+            os.getenv("S3_PREFIX"),
+            PROCESSED_DIR,
+            FAILED_DIR_UPLOAD,
+            s3,
+            build_transfer_config(
+                float(os.getenv("MULTIPART_THRESHOLD_MB", "8")),
+                float(os.getenv("MULTIPART_CHUNK_MB", "8")),
+                UPLOAD_CONCURRENCY,
+            ),
+            manifest_path=os.getenv("MANIFEST_DB_UPLOADER", "./file_storage/state/uploader.db"),
+            shortest_first=QUEUE_SHORTEST_FIRST,
+            content_keys=os.getenv("UPLOAD_CONTENT_KEYS", "0") == "1",
+            checksums=os.getenv("UPLOAD_CHECKSUMS", "1") == "1",
+        )
+        pw.handoff = upw.hand_off
+
+    arrivals = ArrivalTracker(pw.queue_arrivals, logger_ingest, ".csv", quiet_s=ARRIVAL_QUIET_S, max_wait_s=ARRIVAL_MAX_WAIT_S)
+
     logger_uploader.info("BOOT env | host=%s | cwd=%s | python=%s",
     socket.gethostname(),
     os.getcwd(),
@@ -59,21 +203,73 @@ if __name__ == "__main__":
     os.makedirs(INCOMING_DIR, exist_ok=True)
     os.makedirs(FAILED_DIR_READ, exist_ok=True)
     os.makedirs(FAILED_DIR_TRANSFORM, exist_ok=True)
+    # Workers write here and backpressure measures it, whether or not uploads run in-process
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
+    if COMPACTION:
+        os.makedirs(STAGING_DIR, exist_ok=True)
 
     stop_processing = threading.Event()
+    stop_compaction = threading.Event()
+    stop_uploads = threading.Event()
+
+    if TRACE_FILE:
+        tracing.TRACER.configure(TRACE_FILE, "processor")
 
-    t_logrotation = threading.Thread(target=ship_ratated_logs, args=(s3, S3_BUCKET, logger_uploader), daemon=True)
-    t_logrotation.start()
+    if METRICS_PORT:
+        # Upload counters and histograms land in the same registry; the uploader's gauges would
+        # replace the processor's (same names), so only the processor's are registered
+        pw.register_metrics()
+        serve_metrics(METRICS_PORT, logger_process)
 
-    t_processing = threading.Thread(target=pw.process_worker, args=(stop_processing,))
+    if COMBINED_RUNTIME:
+        os.makedirs(FAILED_DIR_UPLOAD, exist_ok=True)
+        start_warming(s3, S3_BUCKET, min(S3_WARM_CONNECTIONS, UPLOAD_WORKERS * UPLOAD_CONCURRENCY), logger_uploader)
+        upw.start_retry_scheduler(stop_uploads, RETRY_BASE_S, RETRY_MAX_S)
+        upw.start_handoff(UPLOAD_WORKERS, int(HANDOFF_BUDGET_MB * 1024 * 1024), pw.finish_handoff)
+        upw.resume_uploads()
+        upload_threads = []
+        for i in range(UPLOAD_WORKERS):
+            thr_upload = threading.Thread(target=upw.uploader_worker, args=(stop_uploads,), name=f"uploader-{i + 1}")
+            thr_upload.start()
+            upload_threads.append(thr_upload)
+        # No observer on processed/: spilled Parquet is queued directly, the rest is found by the rescan
+        thr_upload_rescan = threading.Thread(target=upw.processed_rescan_loop, args=(stop_uploads, [FAILED_DIR_UPLOAD, PROCESSED_DIR], 60))
+        thr_upload_rescan.start()
+        if LOG_SHIP:
+            thr_logs = threading.Thread(target=ship_rotated_logs, args=(stop_uploads, s3, S3_BUCKET, logger_uploader), name="log-shipper")
+            thr_logs.start()
+        logger_uploader.info("---Combined runtime: %d uploader workers UP---", UPLOAD_WORKERS)
+
+    t_flow = threading.Thread(target=flow_control.run, args=(stop_processing,), daemon=True)
+    t_flow.start()
+
+    t_processing = threading.Thread(target=pw.process_worker, args=(stop_processing, PROCESS_WORKERS, RETRY_BASE_S, RETRY_MAX_S))
     t_processing.start()
-    logger_process.info("---Process worker UP---")
+    logger_process.info("---Process worker UP (%d processes)---", PROCESS_WORKERS)
 
-    t_csv_rescan = threading.Thread(target = pw.incoming_rescan_loop, args=(stop_processing,))
+    pw.resume_incoming()
+
+    t_csv_rescan = threading.Thread(target = pw.incoming_rescan_loop, args=(stop_processing,),
+                                    kwargs={"arrivals": arrivals, "settle_s": ARRIVAL_QUIET_S})
     t_csv_rescan.start()
 
+    if COMPACTION:
+        t_compaction = threading.Thread(target=compaction_loop, args=(
+            stop_compaction,
+            STAGING_DIR,
+            PROCESSED_DIR,
+            FAILED_DIR_TRANSFORM,
+            logger_process,
+            int(COMPACT_TARGET_MB * 1024 * 1024),
+            COMPACT_MAX_AGE_S,
+        ), kwargs={"layout": parquet_layout})
+        t_compaction.start()
+
+    t_arrivals = threading.Thread(target=arrivals.run, args=(stop_processing,), name="arrivals", daemon=True)
+    t_arrivals.start()
+
     observer = Observer()
-    observer.schedule(IngestingFileHandler(), INCOMING_DIR, recursive=False)
+    observer.schedule(ArrivalHandler(arrivals), INCOMING_DIR, recursive=False)
     observer.start()
     print("Watching:", os.path.abspath(INCOMING_DIR))
     logger_ingest.info("Watching: %s", os.path.abspath(INCOMING_DIR))
@@ -93,8 +289,28 @@ if __name__ == "__main__":
         request_shutdown(signal.SIGINT, None)
 
     observer.join()
+    t_arrivals.join()
     t_csv_rescan.join()
     t_processing.join()
 
+    # Only after the last worker wrote its output: the final pass flushes everything staged
+    stop_compaction.set()
+    if COMPACTION:
+        t_compaction.join()
+
+    # Handoffs in flight finish (or spill) before the upload workers drain their queue
+    if COMBINED_RUNTIME:
+        upw.stop_handoff()
+        stop_uploads.set()
+        thr_upload_rescan.join()
+        for thr_upload in upload_threads:
+            thr_upload.join()
+        if LOG_SHIP:
+            thr_logs.join()
+        upw.manifest.close()
+    pw.manifest.close()
+    if pw.dedup_index is not None:
+        pw.dedup_index.close()
+
     
 
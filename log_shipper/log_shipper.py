@@ -1,41 +1,101 @@
+import gzip
 import os
-import time
-import glob
+import shutil
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError, BotoCoreError
 from dotenv import load_dotenv
-from aws.s3_utils import upload_to_s3
 
-load_dotenv()
+from aws.s3_utils import s3_key, utcnow
+from logging_config import SHIP_DIR
 
-def ship_ratated_logs(s3, bucket, logger_uploader):
-    LOGS_DIR = os.getenv("LOGS_DIR")
-    FAILED_LOGS = os.getenv("FAILED_LOGS")
-    s3_prefix = "logs"
+load_dotenv()
 
-    os.makedirs(FAILED_LOGS, exist_ok=True)
-    os.makedirs(LOGS_DIR, exist_ok=True)
+# Rotated log segments arrive in SHIP_DIR through the rotation hook in logging_config.py, already
+# closed. Every pass lists SHIP_DIR once, gzips the segments of each service and finished UTC hour
+# into a single object under logs/year=/month=/day=/hour=/ and removes them once uploaded.
+# Segments whose upload failed stay in SHIP_DIR for the next pass.
 
-    
-    pattern = os.path.join(LOGS_DIR, "dropzone.log.*")
 
-    while True:
-        time.sleep(60)
+def parse_segment(name):
+    # "<service>.<YYYYmmddTHHMMSSffffff>.<id>.log" -> (service, stamp), None for anything else
+    if name.startswith(".") or not name.endswith(".log"):
+        return None
+    parts = name[:-len(".log")].rsplit(".", 2)
+    if len(parts) != 3:
+        return None
+    return parts[0], parts[1]
 
-        for path in sorted(glob.glob(pattern)):
-            try:
-                size1 = os.path.getsize(path)
-                time.sleep(1)
-                size2 = os.path.getsize(path)
-                if size1 != size2:
+def pending_batches(ship_dir, flush_all=False):
+    # {(service, hour): [(stamp, path), ...]} for hours that are over (or everything on flush_all)
+    current_hour = f"{utcnow():%Y%m%dT%H}"
+    batches = defaultdict(list)
+    try:
+        with os.scandir(ship_dir) as entries:
+            for entry in entries:
+                parsed = parse_segment(entry.name)
+                if parsed is None:
                     continue
-            except FileNotFoundError:
-                continue
-
-            upload_to_s3(
-                s3=s3,
-                file_path=path,
-                logger_uploader=logger_uploader,
-                S3_BUCKET=bucket,
-                S3_PREFIX=s3_prefix,
-                failed_folder=FAILED_LOGS,
-                is_logs=True
-            )
\ No newline at end of file
+                service, stamp = parsed
+                hour = stamp[:len("YYYYmmddTHH")]
+                if flush_all or hour < current_hour:
+                    batches[(service, hour)].append((stamp, entry.path))
+    except FileNotFoundError:
+        pass
+    return batches
+
+def write_batch(paths, batch_path):
+    # Segments streamed one after another into one gzip member
+    with open(batch_path, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as gz:
+        for path in paths:
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, gz, 1024 * 1024)
+
+def ship_batch(s3, bucket, service, hour, segments, ship_dir, logger_uploader):
+    segments = sorted(segments)
+    paths = [path for _, path in segments]
+    hour_start = datetime.strptime(hour, "%Y%m%dT%H").replace(tzinfo=timezone.utc)
+    file_name = f"{service}.{segments[0][0]}-{segments[-1][0]}.log.gz"
+    key = s3_key("logs", hour_start, file_name, is_logs=True)
+    batch_path = os.path.join(ship_dir, f".{file_name}")
+
+    try:
+        write_batch(paths, batch_path)
+        s3.upload_file(batch_path, bucket, key, ExtraArgs={"ContentType": "application/gzip"})
+    except (ClientError, BotoCoreError, OSError):
+        logger_uploader.warning("🔴 Log upload failed %s (%d segments), will retry", key, len(paths), exc_info=True)
+        return False
+    finally:
+        try:
+            os.remove(batch_path)
+        except FileNotFoundError:
+            pass
+
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    logger_uploader.info("✅ Shipped %d log segments to S3 %s", len(paths), key)
+    return True
+
+def ship_once(s3, bucket, logger_uploader, ship_dir=SHIP_DIR, flush_all=False):
+    shipped = 0
+    for (service, hour), segments in sorted(pending_batches(ship_dir, flush_all).items()):
+        if ship_batch(s3, bucket, service, hour, segments, ship_dir, logger_uploader):
+            shipped += len(segments)
+    return shipped
+
+def ship_rotated_logs(stop_event, s3, bucket, logger_uploader, interval=60):
+    # Runs in one service only (the uploader): every service hands its segments to the same SHIP_DIR
+    os.makedirs(SHIP_DIR, exist_ok=True)
+    logger_uploader.info("🌀 Log shipping started: %s (every %ds)", os.path.abspath(SHIP_DIR), interval)
+    while not stop_event.wait(interval):
+        try:
+            ship_once(s3, bucket, logger_uploader)
+        except Exception:
+            logger_uploader.warning("🔴 Log shipping pass failed", exc_info=True)
+    # Shutdown: the current hour goes too, as its own object
+    ship_once(s3, bucket, logger_uploader, flush_all=True)
+    logger_uploader.info("--Log shipping stopped")
@@ -1,36 +1,211 @@
+import atexit
+import json
 import logging
+import multiprocessing
 import os
+import queue
+import shutil
 import sys
-from logging.handlers import RotatingFileHandler
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from uuid import uuid4
+
+from dotenv import load_dotenv
+
+load_dotenv()
 
 LOG_DIR = "logs"
-LOG_FILE = "dropzone.log"
+LOG_FILE = os.getenv("LOG_FILE", "dropzone.log")
+
+# async: loggers only enqueue records; one listener thread per service formats them and writes the
+# file + stdout.
+# sync: handlers run in the logging thread (the previous behaviour)
+# In both modes pool processes forward their records to the parent: only the parent writes (and
+# rotates) the service's log file
+LOG_MODE = os.getenv("LOG_MODE", "async")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", "5000000"))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# At most LOG_RATE_LIMIT records of the same INFO message per logger every LOG_RATE_WINDOW_S (0 = off)
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", "0"))
+LOG_RATE_WINDOW_S = float(os.getenv("LOG_RATE_WINDOW_S", "60"))
+# Every rotated segment is also linked into SHIP_DIR for log_shipper/log_shipper.py (0 = keep local only)
+LOG_SHIP = os.getenv("LOG_SHIP", "1") == "1"
+SHIP_DIR = os.path.join(LOG_DIR, "shipping")
+
+TEXT_FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
 
 os.makedirs(LOG_DIR, exist_ok=True)
 
+lock = threading.Lock()
+output = None           # file + stdout handlers shared by every logger of this process
+listener = None         # async mode: drains the in-process queue
+child_queue = None      # async mode: records from pool processes
+forward_queue = None    # set in pool processes: parent's child_queue
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    # Per (logger, message template): `limit` records every `window` seconds, the rest are dropped
+    # before they reach a handler. WARNING and above always pass. The first record of the next
+    # window says how many were dropped.
+    def __init__(self, limit, window):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.lock = threading.Lock()
+        self.windows = {}   # key -> [window start, passed, suppressed]
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self.lock:
+            state = self.windows.get(key)
+            if state is not None and now - state[0] < self.window:
+                if state[1] < self.limit:
+                    state[1] += 1
+                    return True
+                state[2] += 1
+                return False
+            if len(self.windows) > 10_000:
+                self.windows.clear()
+            self.windows[key] = [now, 1, 0]
+        if state is not None and state[2]:
+            record.msg = f"{record.msg} (+{state[2]} similar suppressed in the last {self.window:g}s)"
+        return True
+
+
+class LocalQueueHandler(QueueHandler):
+    # Same process: enqueue the record as is, the message is formatted on the listener thread
+    def prepare(self, record):
+        return record
+
+
+def configure_logging(service):
+    # Call before the first setup_logger(): every service writes its own logs/<service>.log
+    global LOG_FILE
+    if "LOG_FILE" not in os.environ:
+        LOG_FILE = f"{service}.log"
+
+def hand_off_segment(source, dest):
+    # RotatingFileHandler rotator: rotate as usual, then link the closed segment into SHIP_DIR as
+    # <service>.<UTC rotation time>.<id>.log. It appears there complete, so the shipper needs no
+    # size-stability check
+    if not os.path.exists(source):
+        return
+    os.rename(source, dest)
+    service = os.path.splitext(LOG_FILE)[0]
+    name = f"{service}.{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}.{uuid4().hex[:8]}.log"
+    os.makedirs(SHIP_DIR, exist_ok=True)
+    try:
+        os.link(dest, os.path.join(SHIP_DIR, name))
+    except OSError:
+        shutil.copyfile(dest, os.path.join(SHIP_DIR, "." + name))
+        os.replace(os.path.join(SHIP_DIR, "." + name), os.path.join(SHIP_DIR, name))
+
+def output_handlers():
+    global output
+    with lock:
+        if output is None:
+            formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+
+            file_handler = RotatingFileHandler(
+                os.path.join(LOG_DIR, LOG_FILE),
+                maxBytes=LOG_MAX_BYTES,
+                backupCount=LOG_BACKUP_COUNT,
+            )
+            if LOG_SHIP:
+                file_handler.rotator = hand_off_segment
+            stream_handler = logging.StreamHandler(sys.stdout)
+            for handler in (file_handler, stream_handler):
+                handler.setFormatter(formatter)
+                handler.setLevel(LOG_LEVEL)
+            output = [file_handler, stream_handler]
+        return output
+
+def local_queue():
+    global listener
+    handlers = output_handlers()
+    with lock:
+        if listener is None:
+            listener = QueueListener(queue.SimpleQueue(), *handlers, respect_handler_level=True)
+            listener.start()
+            atexit.register(listener.stop)
+        return listener.queue
+
+def pool_log_queue():
+    # Parent side: queue for build_process_pool initargs
+    global child_queue
+    handlers = output_handlers()
+    with lock:
+        if child_queue is None:
+            child_queue = multiprocessing.get_context("spawn").Queue()
+            child_listener = QueueListener(child_queue, *handlers, respect_handler_level=True)
+            child_listener.start()
+            atexit.register(child_listener.stop)
+        return child_queue
+
+def forward_to(log_queue):
+    # Pool process side. A spawned process re-imports the parent's main module, which may already
+    # have set up loggers: their file / stdout / local queue handlers are replaced by the parent's
+    # queue, and this process's own listener and log file are closed
+    global forward_queue, listener, output
+    forward_queue = log_queue
+    with lock:
+        local, listener = listener, None
+        own, output = output or [], None
+    for logger in list(logging.Logger.manager.loggerDict.values()):
+        if not isinstance(logger, logging.Logger):
+            continue
+        replaced = [h for h in logger.handlers if h in own or isinstance(h, LocalQueueHandler)]
+        for handler in replaced:
+            logger.removeHandler(handler)
+        if replaced:
+            logger.addHandler(QueueHandler(log_queue))
+    if local is not None:
+        atexit.unregister(local.stop)
+        local.stop()
+    for handler in own:
+        handler.close()
+
 def setup_logger(name):
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(LOG_LEVEL)
 
     if logger.handlers:
         return logger
 
-    formatter = logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s")
-
-    file_handler = RotatingFileHandler(
-        os.path.join(LOG_DIR, LOG_FILE),
-        maxBytes=5_000_000,
-        backupCount=5,
-    )
-    file_handler.setFormatter(formatter)
-    file_handler.setLevel(logging.INFO)
-
-    stream_handler = logging.StreamHandler(sys.stdout)
-    stream_handler.setFormatter(formatter)
-    stream_handler.setLevel(logging.INFO)
+    if LOG_RATE_LIMIT > 0:
+        logger.addFilter(RateLimitFilter(LOG_RATE_LIMIT, LOG_RATE_WINDOW_S))
 
-    logger.addHandler(file_handler)
-    logger.addHandler(stream_handler)
+    if forward_queue is not None:
+        logger.addHandler(QueueHandler(forward_queue))
+    elif LOG_MODE == "async":
+        logger.addHandler(LocalQueueHandler(local_queue()))
+    else:
+        for handler in output_handlers():
+            logger.addHandler(handler)
 
     logger.propagate = False
-    return logger
\ No newline at end of file
+    return logger
@@ -1,11 +1,14 @@
-from logging_config import setup_logger
+from logging_config import setup_logger, configure_logging, LOG_SHIP
 from dotenv import load_dotenv
 from watchdog.events import FileSystemEventHandler
 import os
 import time
 import threading
-from aws.s3_utils import s3_cfg, build_s3
+from aws.s3_utils import shared_s3, pool_size, start_warming, build_transfer_config
 from s3_upload import uploader_worker as upw
+from log_shipper.log_shipper import ship_rotated_logs
+from utils.metrics import serve_metrics
+from utils import tracing
 
 load_dotenv()
 
@@ -15,20 +18,51 @@ if USE_POLLING:
 else:
     from watchdog.observers import Observer
 
+configure_logging("uploader")
 logger_uploader = setup_logger("dropzone.uploader")
 logger_ingest = setup_logger("dropzone.reading")
 
 AWS_REGION = os.getenv("AWS_REGION")
 S3_BUCKET = os.getenv("S3_BUCKET")
 S3_PREFIX = os.getenv("S3_PREFIX")
+# Custom endpoint for an S3-compatible store (MinIO, LocalStack, ...); empty = AWS
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "")
+# Client connection pool (0 = UPLOAD_WORKERS * UPLOAD_CONCURRENCY + 1 for the log shipper), TCP
+# keepalive on its sockets, and connections opened at startup (0 = off)
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "0"))
+S3_TCP_KEEPALIVE = os.getenv("S3_TCP_KEEPALIVE", "1") == "1"
+S3_WARM_CONNECTIONS = int(os.getenv("S3_WARM_CONNECTIONS", "4"))
+# Content-addressed keys (SHA-256 of the Parquet): content already in S3 is never uploaded twice
+UPLOAD_CONTENT_KEYS = os.getenv("UPLOAD_CONTENT_KEYS", "0") == "1"
+# S3 checks every Parquet against the CRC32 computed while it was written (0 = SDK default checksum)
+UPLOAD_CHECKSUMS = os.getenv("UPLOAD_CHECKSUMS", "1") == "1"
 PROCESSED_DIR = os.getenv("PROCESSED_DIR")
 FAILED_DIR_UPLOAD = os.getenv("FAILED_DIR_UPLOAD")
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+MULTIPART_THRESHOLD_MB = float(os.getenv("MULTIPART_THRESHOLD_MB", "8"))
+MULTIPART_CHUNK_MB = float(os.getenv("MULTIPART_CHUNK_MB", "8"))
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+RETRY_BASE_S = float(os.getenv("RETRY_BASE_S", "30"))
+RETRY_MAX_S = float(os.getenv("RETRY_MAX_S", "600"))
+MANIFEST_DB = os.getenv("MANIFEST_DB_UPLOADER", "./file_storage/state/uploader.db")
+# Smallest Parquet first within a priority class (a file waiting > 5 min goes first anyway)
+QUEUE_SHORTEST_FIRST = os.getenv("QUEUE_SHORTEST_FIRST", "0") == "1"
+# Prometheus text metrics on http://<host>:METRICS_PORT_UPLOADER/metrics (0 = off)
+METRICS_PORT = int(os.getenv("METRICS_PORT_UPLOADER", "9102"))
+# Upload spans as JSON lines, read by `python3 -m utils.trace_report` (empty = off)
+TRACE_FILE = os.getenv("TRACE_FILE_UPLOADER", "./logs/traces/uploader.jsonl")
 
 if not S3_BUCKET:
     logger_uploader.error("❗S3_Bucket unavaliable")
     raise SystemExit("S3_Bucket is required")
 
-s3 = build_s3(AWS_REGION, s3_cfg)
+s3 = shared_s3(
+    AWS_REGION,
+    max_pool_connections=S3_MAX_POOL_CONNECTIONS or pool_size(UPLOAD_WORKERS, UPLOAD_CONCURRENCY),
+    endpoint_url=S3_ENDPOINT_URL,
+    tcp_keepalive=S3_TCP_KEEPALIVE,
+)
+transfer_config = build_transfer_config(MULTIPART_THRESHOLD_MB, MULTIPART_CHUNK_MB, UPLOAD_CONCURRENCY)
 
 upw.init_context(
     logger_uploader,
@@ -38,7 +72,12 @@ upw.init_context(
     S3_PREFIX,
     PROCESSED_DIR,
     FAILED_DIR_UPLOAD,
-    s3
+    s3,
+    transfer_config,
+    manifest_path=MANIFEST_DB,
+    shortest_first=QUEUE_SHORTEST_FIRST,
+    content_keys=UPLOAD_CONTENT_KEYS,
+    checksums=UPLOAD_CHECKSUMS,
 )
 
 class ProcessedFileHandler(FileSystemEventHandler):
@@ -72,17 +111,31 @@ if __name__ == "__main__":
 
     stop_event = threading.Event()
 
-    thr_upload = threading.Thread(target=upw.uploader_worker, args=(stop_event,))
-    thr_upload.start()
-
-    thr_rescan = threading.Thread(target=upw.processed_rescan_loop, args=(stop_event, FAILED_DIR_UPLOAD, 60))
+    start_warming(s3, S3_BUCKET, min(S3_WARM_CONNECTIONS, UPLOAD_WORKERS * UPLOAD_CONCURRENCY), logger_uploader)
+    upw.start_retry_scheduler(stop_event, RETRY_BASE_S, RETRY_MAX_S)
+    if TRACE_FILE:
+        tracing.TRACER.configure(TRACE_FILE, "uploader")
+    if METRICS_PORT:
+        upw.register_metrics()
+        serve_metrics(METRICS_PORT, logger_uploader)
+    upw.resume_uploads()
+
+    upload_threads = []
+    for i in range(UPLOAD_WORKERS):
+        thr_upload = threading.Thread(target=upw.uploader_worker, args=(stop_event,), name=f"uploader-{i + 1}")
+        thr_upload.start()
+        upload_threads.append(thr_upload)
+    logger_uploader.info("---%d uploader workers UP---", UPLOAD_WORKERS)
+
+    thr_rescan = threading.Thread(target=upw.processed_rescan_loop, args=(stop_event, [FAILED_DIR_UPLOAD, PROCESSED_DIR], 60))
     thr_rescan.start()
 
-    thr_rescan_processed = threading.Thread(target=upw.processed_rescan_loop, args=(stop_event, PROCESSED_DIR, 60))
-    thr_rescan_processed.start()
-
+    # The only log shipper: the processor's rotated segments arrive in the same logs/shipping folder
+    if LOG_SHIP:
+        thr_logs = threading.Thread(target=ship_rotated_logs, args=(stop_event, s3, S3_BUCKET, logger_uploader), name="log-shipper")
+        thr_logs.start()
 
-    logger_ingest.info("🌀 Rescan of FAILED/UPLOAD folder (every 60 sec) started")
+    logger_ingest.info("🌀 Rescan of FAILED/UPLOAD and PROCESSED folders (every 60 sec) started")
 
     observer = Observer()
     observer.schedule(ProcessedFileHandler(), PROCESSED_DIR, recursive=False)
@@ -105,7 +158,10 @@ if __name__ == "__main__":
 
     observer.join()
     thr_rescan.join()
-    thr_rescan_processed.join()
-    thr_upload.join()
+    for thr_upload in upload_threads:
+        thr_upload.join()
+    if LOG_SHIP:
+        thr_logs.join()
+    upw.manifest.close()
 
                                      
@@ -1,13 +1,23 @@
+import io
 import os
+import time
 import threading
-from queue import Queue, Empty
-from aws.s3_utils import upload_to_s3
-import glob
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from queue import Empty
+from botocore.exceptions import ClientError, BotoCoreError
+from aws.s3_utils import upload_to_s3, s3_key, event_time, content_name, object_exists
 import utils.queue_utils as utils
+from utils.retry_utils import RetryScheduler
+from utils.rescan_utils import DirCursor, rescan_once
+from utils.file_queue import FileQueue, FRESH, RESCAN, RETRY
+from utils.manifest import FileManifest
+from utils.metrics import REGISTRY, STAGE_SECONDS, FILES, RETRIES, UPLOADED_BYTES, count_files
+from utils import tracing
+from utils.checksums import buffer_checksums, content_digest, read_sidecar, write_sidecar, move_sidecar, remove_sidecar, remove_orphans, s3_checksum_args
 
-upload_queue = Queue(maxsize=2000)
-claimed_files = set()
-claimed_files_lock = threading.Lock()
+# Fresh Parquet before rescans before failed/upload retries (utils/file_queue.py)
+upload_queue = FileQueue(maxsize=2000)
 
 TARGET_EXT = ".parquet" 
 
@@ -20,6 +30,15 @@ S3_PREFIX = None
 PROCESSED_DIR = None
 FAILED_DIR_UPLOAD = None
 s3 = None
+transfer_config = None
+manifest = None
+# Content-addressed uploads: the key carries the SHA-256 of the Parquet's data pages (its footer with
+# the per-delivery lineage is left out, utils/checksums.py), and content already in S3 (manifest
+# `objects` cache, then a HEAD request) is not uploaded again
+CONTENT_KEYS = False
+# S3 verifies every object against the CRC32 taken while the Parquet was written (its .sums
+# sidecar, utils/checksums.py); files without one are uploaded with the SDK's own checksum
+CHECKSUMS = True
 
 def init_context(
         logger_uploader_main,
@@ -30,9 +49,15 @@ def init_context(
         processed_dir,
         failed_dir_upload,
         s3_built,
+        transfer_config_built=None,
+        manifest_path=None,
+        shortest_first=False,
+        content_keys=False,
+        checksums=True,
 ):
     global logger_uploader, logger_ingest
-    global AWS_REGION, S3_BUCKET, S3_PREFIX, PROCESSED_DIR, FAILED_DIR_UPLOAD, s3
+    global AWS_REGION, S3_BUCKET, S3_PREFIX, PROCESSED_DIR, FAILED_DIR_UPLOAD, s3, transfer_config, manifest
+    global CONTENT_KEYS, CHECKSUMS
 
     logger_uploader = logger_uploader_main
     logger_ingest = logger_ingest_main
@@ -43,20 +68,110 @@ def init_context(
     PROCESSED_DIR=processed_dir
     FAILED_DIR_UPLOAD=failed_dir_upload
     s3 = s3_built
+    transfer_config = transfer_config_built
+    if manifest_path:
+        manifest = FileManifest(manifest_path)
+    upload_queue.shortest_first = shortest_first
+    CONTENT_KEYS = content_keys
+    CHECKSUMS = checksums
 
-def queue_file(file_path, source):
+def queue_file(file_path, source, priority=FRESH):
     return utils.queue_file(
         file_path=file_path,
         general_queue=upload_queue,
         logger=logger_ingest,
         source=source,
-        set_LOCKER=claimed_files_lock,
-        claimed_set=claimed_files,
+        manifest=manifest,
         target=TARGET_EXT,
+        priority=priority,
     )
 
+def resume_uploads():
+    # Restart: drop files uploaded right before a crash, re-queue uploads that were in flight
+    for file_path in manifest.leftovers():
+        utils.remove_finished(file_path, manifest, logger_uploader)
+    for folder in (PROCESSED_DIR, FAILED_DIR_UPLOAD):
+        remove_orphans(folder)
+    resumed = 0
+    for file_path in manifest.resume():
+        if queue_file(file_path, source="resume", priority=RESCAN):
+            resumed += 1
+    manifest.prune()
+    logger_uploader.info("🟣 Resumed %d in-flight uploads from the manifest", resumed)
+    return resumed
+
+def mark_uploaded(file_path, key, digest=None):
+    if digest is not None:
+        manifest.remember_object(digest, key)
+    manifest.finish(file_path, "uploaded", s3_key=key)
+
+def content_key(file_name, digest):
+    return s3_key(S3_PREFIX, event_time(file_name), content_name(file_name, digest))
+
+def upload_args(digest, sums):
+    extra_args = {}
+    if digest:
+        extra_args["Metadata"] = {"content-sha256": digest}
+    if CHECKSUMS and sums:
+        extra_args.update(s3_checksum_args(sums))
+    return extra_args or None
+
+def existing_object(digest, key):
+    # S3 key of an object with the same content, None when it has to be uploaded
+    known = manifest.uploaded_object(digest)
+    if known is not None:
+        return known
+    if object_exists(s3, S3_BUCKET, key):
+        manifest.remember_object(digest, key)
+        return key
+    return None
+
+def skip_existing(file_path, key, digest):
+    mark_uploaded(file_path, key, digest)
+    logger_uploader.info("🟣 Already in S3 (same content), skipped the upload: %s -> %s", file_path, key)
+    remove_sidecar(file_path)
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logger_uploader.warning("🟡 Skipped upload but failed to remove: %s", file_path, exc_info=True)
+
+# Failed uploads sit in failed/upload; the scheduler re-queues them with backoff
+# (the failed/upload rescan still catches anything it misses, e.g. after a restart)
+retry_scheduler = None
+
+def requeue_retry(file_path):
+    if upload_queue.full():
+        return False
+    if os.path.exists(file_path):
+        queue_file(file_path, source="retry", priority=RETRY)
+    return True
+
+def start_retry_scheduler(stop_event, base_delay=30, max_delay=600):
+    global retry_scheduler
+    retry_scheduler = RetryScheduler(requeue_retry, logger_uploader, base_delay, max_delay)
+    thr = threading.Thread(target=retry_scheduler.run, args=(stop_event,), daemon=True)
+    thr.start()
+    return thr
+
+def schedule_retry(failed_path):
+    attempt = manifest.attempts(failed_path)
+    delay = retry_scheduler.schedule(failed_path, attempt)
+    RETRIES.inc(stage="upload")
+    logger_uploader.info("🌀 Upload retry NO %d of %s in %.0fs", attempt + 1, failed_path, delay)
+
+def file_trace_ids(file_path):
+    try:
+        return tracing.read_trace(file_path)[0]
+    except FileNotFoundError:
+        raise
+    except Exception:
+        logger_uploader.warning("🟡 Could not read trace ids from: %s", file_path, exc_info=True)
+        return []
+
 def uploader_worker(stop_event):
-    logger_uploader.info("--Uploader worker started")
+    logger_uploader.info("--Uploader worker started: %s", threading.current_thread().name)
     while True:
         if stop_event.is_set() and upload_queue.empty():
             break
@@ -67,36 +182,191 @@ def uploader_worker(stop_event):
 
         try:
             logger_uploader.info("🌀 --Start upload: %s", file_path)
-            upload_to_s3(
-                s3, 
-                file_path, 
-                logger_uploader, 
-                S3_BUCKET, 
-                S3_PREFIX, 
-                FAILED_DIR_UPLOAD, 
-                is_logs=False)
+            attempt = manifest.start(file_path, "uploading")
+            stat = os.stat(file_path)
+            trace_ids = file_trace_ids(file_path)
+            started = time.time()
+            # Checksums from the write; a file without a (matching) sidecar is hashed here
+            sums = read_sidecar(file_path, stat.st_size)
+            digest = key = existing = None
+            if CONTENT_KEYS:
+                digest = sums.get("content") if sums else None
+                digest = digest or content_digest(file_path)
+                key = content_key(os.path.basename(file_path), digest)
+                existing = existing_object(digest, key)
+            if existing is not None:
+                skip_existing(file_path, existing, digest)
+                uploaded, result = True, "exists"
+            else:
+                uploaded = upload_to_s3(
+                    s3, 
+                    file_path, 
+                    logger_uploader, 
+                    S3_BUCKET, 
+                    S3_PREFIX, 
+                    FAILED_DIR_UPLOAD, 
+                    is_logs=False,
+                    transfer_config=transfer_config,
+                    on_uploaded=partial(mark_uploaded, digest=digest),
+                    key=key,
+                    extra_args=upload_args(digest, sums))
+                result = "uploaded" if uploaded else "failed"
+                failed_path = os.path.join(FAILED_DIR_UPLOAD, os.path.basename(file_path))
+                if uploaded:
+                    remove_sidecar(file_path)
+                elif os.path.exists(failed_path):
+                    # Follows the Parquet to failed/upload
+                    move_sidecar(file_path, failed_path)
+            ended = time.time()
+            STAGE_SECONDS.observe(ended - started, stage="upload")
+            FILES.inc(stage="upload", result=result)
+            if result == "uploaded":
+                UPLOADED_BYTES.inc(stat.st_size)
+            # Waiting since the Parquet was renamed into processed/ (or into failed/upload before a retry)
+            parquet = os.path.basename(file_path)
+            wait = "handoff_wait" if attempt <= 1 else "retry_wait"
+            tracing.record(trace_ids, wait, min(stat.st_ctime, started), started, parquet=parquet, attempt=attempt)
+            tracing.record(trace_ids, "upload", started, ended, parquet=parquet, attempt=attempt, bytes=stat.st_size, result=result)
+            failed_path = os.path.join(FAILED_DIR_UPLOAD, os.path.basename(file_path))
+            if not uploaded and os.path.exists(failed_path):
+                manifest.finish(file_path, "failed", path=failed_path)
+                if retry_scheduler is not None:
+                    schedule_retry(failed_path)
             logger_uploader.info("✅ Finished upload handling: %s", file_path)
         except FileNotFoundError:
             logger_uploader.info("🟡 Skipped missing file (likely moved/deleted): %s", file_path)
             continue
         finally:
             upload_queue.task_done()
-            utils.release_claim(file_path, claimed_files_lock, claimed_files)
+            utils.release_claim(file_path, manifest)
             
 
-def processed_rescan_loop(stop_event, target_folder, timeout = 60):
-    while not stop_event.is_set():
-        pattern = os.path.join(target_folder, "*.parquet")
-        found = 0
-        queued = 0
+# Combined runtime: Parquet bytes handed over by the process worker are uploaded straight from
+# memory. processed/ only gets the ones whose upload failed or that did not fit HANDOFF_BUDGET
+# bytes in flight; from there the regular uploader workers take over
+handoff_pool = None
+handoff_done = None      # process_worker.finish_handoff(csv_path, output, s3_keys)
+handoff_budget = 0
+handoff_inflight = 0
+handoff_lock = threading.Lock()
 
-        for file_path in sorted(glob.glob(pattern)):
-            if stop_event.is_set():
+def start_handoff(workers, budget_bytes, on_done):
+    global handoff_pool, handoff_done, handoff_budget
+    handoff_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="handoff")
+    handoff_done = on_done
+    handoff_budget = budget_bytes
+    logger_uploader.info("--In-memory handoff UP (%d threads, %d bytes in flight)", workers, budget_bytes)
+
+def stop_handoff():
+    # After the process worker stopped: uploads already handed over are finished (or spilled)
+    if handoff_pool is not None:
+        handoff_pool.shutdown(wait=True)
+
+def hand_off(csv_path, outputs, trace_id=None):
+    # outputs: [(parquet name, bytes)]. Runs on the process pool's result thread, so it never uploads here
+    global handoff_inflight
+    size = sum(len(data) for _, data in outputs)
+    with handoff_lock:
+        fits = handoff_inflight + size <= handoff_budget
+        if fits:
+            handoff_inflight += size
+    if not fits:
+        logger_uploader.info("🟡 Handoff budget full, spilling %d Parquet to processed/: %s", len(outputs), csv_path)
+        spilled = [spill(fname, data) for fname, data in outputs]
+        handoff_done(csv_path, None if None in spilled else ",".join(spilled))
+        return
+    handoff_pool.submit(upload_handoff, csv_path, outputs, size, trace_id, time.time())
+
+def upload_handoff(csv_path, outputs, size, trace_id, handed_at):
+    global handoff_inflight
+    output, keys = [], []
+    try:
+        for fname, data in outputs:
+            key = upload_bytes(fname, data, trace_id, handed_at)
+            if key is not None:
+                output.append(fname)
+                keys.append(key)
+                continue
+            path = spill(fname, data)
+            if path is None:
+                output = None
                 break
-            found += 1
-            logger_uploader.info("🟡 Located parquet-file in FAILED/UPLOAD FOLDER: %s", file_path)
-            if queue_file(file_path, source="rescan"):
-                logger_uploader.info("🟣 FAILED file was queued for upload: %s", file_path)
-                queued += 1
+            output.append(path)
+        handoff_done(csv_path, None if output is None else ",".join(output), ",".join(keys))
+    except Exception:
+        logger_uploader.warning("🔴 Handoff crashed, the CSV stays for the rescan: %s", csv_path, exc_info=True)
+        handoff_done(csv_path, None)
+    finally:
+        with handoff_lock:
+            handoff_inflight -= size
+
+def upload_bytes(fname, data, trace_id=None, handed_at=None):
+    # Same key, metrics and spans as a file upload; the S3 key, or None when it failed
+    started = time.time()
+    sums = buffer_checksums(data)
+    digest = sums.get("content") if CONTENT_KEYS else None
+    key = content_key(fname, digest) if digest else s3_key(S3_PREFIX, event_time(fname), fname)
+    existing = existing_object(digest, key) if digest else None
+    if existing is not None:
+        key, uploaded, result = existing, True, "exists"
+        logger_uploader.info("🟣 Already in S3 (same content), skipped the upload: %s -> %s", fname, key)
+    else:
+        try:
+            s3.upload_fileobj(io.BytesIO(data), S3_BUCKET, key, Config=transfer_config, ExtraArgs=upload_args(digest, sums))
+            uploaded, result = True, "uploaded"
+            if digest:
+                manifest.remember_object(digest, key)
+            logger_uploader.info("✅ Uploaded to S3 from memory %s", key)
+        except (ClientError, BotoCoreError):
+            uploaded, result = False, "failed"
+            logger_uploader.warning("🔴 In-memory upload failed %s, spilling to processed/", key, exc_info=True)
+    ended = time.time()
+    STAGE_SECONDS.observe(ended - started, stage="upload")
+    FILES.inc(stage="upload", result=result)
+    if result == "uploaded":
+        UPLOADED_BYTES.inc(len(data))
+    tracing.record(trace_id, "handoff_wait", handed_at or started, started, parquet=fname, attempt=1, memory=True)
+    tracing.record(trace_id, "upload", started, ended, parquet=fname, attempt=1, bytes=len(data), result=result, memory=True)
+    return key if uploaded else None
+
+def spill(fname, data):
+    # Durable fallback: the Parquet goes to processed/ like any other and is queued for the upload workers
+    tmp_path = os.path.join(PROCESSED_DIR, "." + fname + ".tmp")
+    p_path = os.path.join(PROCESSED_DIR, fname)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        write_sidecar(p_path, buffer_checksums(data))
+        os.replace(tmp_path, p_path)
+    except OSError:
+        logger_uploader.error("🔴 Could not spill %s to processed/", fname, exc_info=True)
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        return None
+    queue_file(p_path, source="handoff spill")
+    return p_path
+
+def register_metrics(registry=REGISTRY):
+    # Scrape-time gauges for the uploader service
+    registry.gauge("dropzone_queue_depth", "Files waiting in the queue", lambda: {"upload": upload_queue.qsize()}, ("queue",))
+    registry.gauge("dropzone_claims", "Files claimed by this run per manifest state", manifest.counts, ("state",))
+    registry.gauge("dropzone_retries_pending", "Files waiting for a delayed retry",
+                   lambda: {"upload": len(retry_scheduler) if retry_scheduler else 0}, ("stage",))
+    registry.gauge("dropzone_failed_files", "Files in the failed folders", lambda: {"upload": count_files(FAILED_DIR_UPLOAD)}, ("folder",))
+
+def processed_rescan_loop(stop_event, target_folders, timeout = 60):
+    # One thread for all folders (processed/ and failed/upload): one cursor per folder
+    # failed/upload is served after fresh and rescanned Parquet
+    cursors = [DirCursor(folder, TARGET_EXT) for folder in target_folders]
+    while not stop_event.is_set():
+        for cursor in cursors:
+            priority = RETRY if cursor.folder == FAILED_DIR_UPLOAD else RESCAN
+            queue_rescan = partial(queue_file, source="rescan", priority=priority)
+            found, queued = rescan_once(cursor, queue_rescan, upload_queue, stop_event)
+            if found:
+                logger_uploader.info("🟣 Rescan %s: %d new or changed parquet files, %d queued", cursor.folder, found, queued)
+        manifest.prune_if_due()
 
         stop_event.wait(timeout)
\ No newline at end of file
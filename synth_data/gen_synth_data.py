@@ -1,4 +1,5 @@
 from synth_data.values import CURRENCY_VARIANTS, STATUS_VARIANTS, PAYMENT_METHOD_VARIANTS
+from synth_data.values import VALID_CURRENCIES, CANONICAL_STATUS, CANONICAL_PAYMENT_METHODS
 import csv
 import os
 import random
@@ -31,12 +32,19 @@ ROWS_PER_FILE = 500
 
 PRODUCT_IDS = ["P" + str(i).zfill(4) for i in range(1, 115)]
 
-def main():
+CLEAN_CURRENCIES = sorted(VALID_CURRENCIES)
+CLEAN_STATUSES = sorted(CANONICAL_STATUS)
+CLEAN_PAYMENT_METHODS = sorted(CANONICAL_PAYMENT_METHODS)
 
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    filename = "payments_" + datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S") + ".csv"
-    tmp_path = os.path.join(OUTPUT_DIR, "." + filename + ".tmp")
-    final_path = os.path.join(OUTPUT_DIR, filename)
+# error_mix: share of rows drawn with all the possible errors above (1.0 = every row), the rest is clean
+def main(output_dir=None, rows_per_file=ROWS_PER_FILE, filename=None, error_mix=1.0):
+    output_dir = output_dir or OUTPUT_DIR
+
+    os.makedirs(output_dir, exist_ok=True)
+    if filename is None:
+        filename = "payments_" + datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S") + ".csv"
+    tmp_path = os.path.join(output_dir, "." + filename + ".tmp")
+    final_path = os.path.join(output_dir, filename)
 
     col1= random.choice(["transaction_id", "id", "tranc_id"])
     col2= random.choice(["transaction_ts", "ttime", "tdate"])
@@ -60,8 +68,21 @@ def main():
         ])
         writer.writeheader()
 
-        for _ in range(ROWS_PER_FILE):
+        for _ in range(rows_per_file):
             transaction_id = str(uuid.uuid4())
+            if random.random() >= error_mix:
+                writer.writerow({
+                    col1: transaction_id,
+                    col2: datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+                    col3: random.randint(999, 10000),
+                    col4: round(random.uniform(1, 3000), 2),
+                    col5: random.choice(CLEAN_CURRENCIES),
+                    col6: random.choice(CLEAN_STATUSES),
+                    col7: random.choice(PRODUCT_IDS),
+                    col8: random.choice(CLEAN_PAYMENT_METHODS),
+                })
+                continue
+
             base_dt = datetime.now() + timedelta(days=random.randint(-2, 0))
             transaction_ts = base_dt.strftime("%Y-%m-%dT%H:%M:%S")
 
@@ -93,6 +114,7 @@ def main():
 
     os.replace(tmp_path, final_path)
     print("Generated file: ", filename)
+    return final_path
 
 if __name__ == "__main__":
     while True:
@@ -1,5 +1,23 @@
 CORRECT_COLUMN_NAMES = ["transaction_id", "transaction_ts", "user_id", "amount", "currency", "status", "product_id", "payment_method"]
 
+# Header names partners send for each column (matched case-insensitively, surrounding spaces ignored)
+COLUMN_ALIASES = {
+    "transaction_id": ["tranc_id", "txn_id"],
+    "transaction_ts": ["ttime", "tdate", "timestamp"],
+    "user_id": ["user"],
+    "amount": [],
+    "currency": ["cur"],
+    "status": ["state"],
+    "product_id": ["product"],
+    "payment_method": ["pay_m", "paym"],
+}
+
+# Names used for several columns: the column at the canonical position of a candidate gets it,
+# otherwise the only candidate not resolved yet
+AMBIGUOUS_COLUMN_ALIASES = {
+    "id": ["transaction_id", "user_id", "product_id"],
+}
+
 VALID_CURRENCIES = {"USD", "EUR", "GBP", "JPY", "CAD"}
 
 CURRENCY_MAPPING = {
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Run from anywhere (`python -m pytest tests`): modules are imported from the repository root, also
+# in the spawned processes of the pool tests (they inherit sys.path)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
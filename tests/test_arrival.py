@@ -0,0 +1,82 @@
+import logging
+import os
+import time
+
+import pytest
+
+from utils.arrival import ArrivalTracker
+
+QUIET_S = 0.3
+
+
+@pytest.fixture
+def tracker():
+    ready = []
+    tracker = ArrivalTracker(lambda arrivals: ready.extend(path for path, _ in arrivals), logging.getLogger("test.arrival"),
+                             ".csv", quiet_s=QUIET_S, max_wait_s=30)
+    tracker.ready = ready
+    return tracker
+
+def append(path, data=b"1,2\n"):
+    with open(path, "ab") as f:
+        f.write(data)
+
+def settle(tracker, path):
+    # What the tracker thread does once the entry is due
+    for entry in tracker.pending.values():
+        entry.due = 0
+    tracker.check([path])
+    return path in tracker.ready
+
+
+def test_close_write_waits_for_quiet_mtime(tracker, tmp_path):
+    path = str(tmp_path / "a.csv")
+    append(path)
+    tracker.note(path, complete=True)
+    assert not settle(tracker, path)
+    time.sleep(QUIET_S)
+    assert settle(tracker, path)
+
+def test_append_after_close_takes_complete_back(tracker, tmp_path):
+    path = str(tmp_path / "a.csv")
+    append(path)
+    tracker.note(path, complete=True)
+    time.sleep(QUIET_S)
+    tracker.note(path)    # appended again
+    append(path)
+    assert not settle(tracker, path)
+    assert not tracker.pending[path].complete
+
+def test_size_change_takes_complete_back(tracker, tmp_path):
+    path = str(tmp_path / "a.csv")
+    append(path)
+    tracker.note(path, complete=True)
+    assert not settle(tracker, path)
+    append(path)           # no event seen (polling observer)
+    time.sleep(QUIET_S)
+    assert not settle(tracker, path)
+    assert not tracker.pending[path].complete
+
+def test_in_place_writer_pausing_less_than_quiet(tracker, tmp_path):
+    path = str(tmp_path / "a.csv")
+    for _ in range(3):
+        append(path)
+        tracker.note(path)
+        assert not settle(tracker, path)
+        time.sleep(QUIET_S / 3)
+    time.sleep(QUIET_S)
+    assert settle(tracker, path)
+    assert tracker.ready == [path]
+
+def test_rename_ready_right_away(tracker, tmp_path):
+    path = str(tmp_path / "a.csv")
+    append(path)
+    tracker.note(path, renamed=True)
+    assert settle(tracker, path)
+
+def test_busy_while_pending(tracker, tmp_path):
+    path = str(tmp_path / "a.csv")
+    append(path)
+    tracker.note(path)
+    assert tracker.busy(os.path.join(str(tmp_path), ".", "a.csv"))
+    assert not tracker.busy(str(tmp_path / "b.csv"))
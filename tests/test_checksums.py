@@ -0,0 +1,58 @@
+import base64
+import hashlib
+import zlib
+
+import pyarrow as pa
+import pytest
+
+from utils.checksums import HashingFile, buffer_checksums, content_digest, read_sidecar, write_sidecar
+from utils.parquet_layout import ParquetLayout
+from utils.tracing import with_trace
+
+TABLE = pa.table({"transaction_id": [f"t{i}" for i in range(5000)], "amount": [i / 10 for i in range(5000)]})
+
+
+def write(path, trace_id, streaming=False):
+    layout = ParquetLayout()
+    schema = with_trace(TABLE.schema, [trace_id], ["same.csv"])
+    with HashingFile(str(path)) as sink:
+        if streaming:
+            writer = layout.writer(sink, schema)
+            layout.write_batch(writer, TABLE)
+            writer.close()
+        else:
+            layout.write_table(TABLE, sink, schema.metadata)
+    return sink.result()
+
+
+def test_file_checksums_match_bytes(tmp_path):
+    sums = write(tmp_path / "a.parquet", "trace-1")
+    data = (tmp_path / "a.parquet").read_bytes()
+    assert sums["size"] == len(data)
+    assert sums["sha256"] == hashlib.sha256(data).hexdigest()
+    assert sums["crc32"] == base64.b64encode(zlib.crc32(data).to_bytes(4, "big")).decode()
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_content_ignores_lineage(tmp_path, streaming):
+    first = write(tmp_path / "a.parquet", "trace-1", streaming)
+    second = write(tmp_path / "b.parquet", "trace-2", streaming)
+    assert first["sha256"] != second["sha256"]
+    assert first["content"] == second["content"]
+    assert content_digest(str(tmp_path / "a.parquet")) == first["content"]
+    assert buffer_checksums((tmp_path / "b.parquet").read_bytes()) == second
+
+def test_content_follows_data(tmp_path):
+    first = write(tmp_path / "a.parquet", "trace-1")
+    layout = ParquetLayout()
+    with HashingFile(str(tmp_path / "b.parquet")) as sink:
+        layout.write_table(TABLE.slice(1), sink)
+    assert sink.result()["content"] != first["content"]
+
+def test_sidecar_of_other_version_ignored(tmp_path):
+    path = str(tmp_path / "a.parquet")
+    sums = write(path, "trace-1")
+    write_sidecar(path, sums)
+    assert read_sidecar(path) == sums
+    with open(path, "ab") as f:
+        f.write(b"x")
+    assert read_sidecar(path) is None
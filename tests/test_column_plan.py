@@ -0,0 +1,69 @@
+import pytest
+
+from incoming_watcher import column_plan
+from incoming_watcher.column_plan import ColumnPlan, HeaderError, resolve
+from synth_data.values import CORRECT_COLUMN_NAMES
+
+
+def test_aliases_and_order():
+    header = ["Amount", " TXN_ID ", "tdate", "user", "cur", "state", "product", "paym", "note"]
+    sources, positional = resolve(header)
+    assert not positional
+    assert sources == {
+        "amount": 0, "transaction_id": 1, "transaction_ts": 2, "user_id": 3,
+        "currency": 4, "status": 5, "product_id": 6, "payment_method": 7,
+    }
+    plan = ColumnPlan(header, "fp")
+    assert plan.usecols == list(range(8))
+    assert plan.names[8] == "_unused_8"
+    assert plan.dropped == ["note"]
+    assert plan.renamed["Amount"] == "amount"
+
+def test_ambiguous_id_by_position():
+    # As the synth generator writes it: "id" for transaction, user and product ids
+    header = ["id", "ttime", "id", "amount", "currency", "status", "id", "pay_m"]
+    sources, positional = resolve(header)
+    assert not positional
+    assert (sources["transaction_id"], sources["user_id"], sources["product_id"]) == (0, 2, 6)
+
+def test_ambiguous_id_only_free_candidate():
+    header = ["amount", "tranc_id", "timestamp", "id", "cur", "status", "product", "paym", "extra"]
+    assert resolve(header)[0]["user_id"] == 3
+
+def test_unknown_names_taken_by_position():
+    header = [f"col{i}" for i in range(len(CORRECT_COLUMN_NAMES))]
+    sources, positional = resolve(header)
+    assert positional
+    assert sources == {column: index for index, column in enumerate(CORRECT_COLUMN_NAMES)}
+
+def test_missing_columns():
+    with pytest.raises(HeaderError, match="currency"):
+        resolve(["transaction_id", "transaction_ts", "user_id", "amount", "status", "product_id", "payment_method"])
+
+def test_plan_cached_by_header(tmp_path, monkeypatch):
+    monkeypatch.setattr(column_plan, "plans", {})
+    first = tmp_path / "a.csv"
+    second = tmp_path / "b.csv"
+    first.write_text("﻿txn_id,ttime,user,amount,cur,state,product,paym\n1,2,3,4,5,6,7,8\n", encoding="utf-8")
+    second.write_text("﻿txn_id,ttime,user,amount,cur,state,product,paym\n9,9,9,9,9,9,9,9\n", encoding="utf-8")
+    plan, cached = column_plan.plan_for(str(first))
+    assert not cached
+    assert plan.sources["transaction_id"] == 0
+    assert column_plan.plan_for(str(second)) == (plan, True)
+
+@pytest.mark.parametrize("content", [b"", b"txn_id,ttime,us"])
+def test_incomplete_header_is_retryable_and_not_cached(tmp_path, monkeypatch, content):
+    monkeypatch.setattr(column_plan, "plans", {})
+    path = tmp_path / "a.csv"
+    path.write_bytes(content)
+    with pytest.raises(column_plan.IncompleteHeader):
+        column_plan.plan_for(str(path))
+    assert column_plan.plans == {}
+
+def test_complete_header_missing_columns_is_final(tmp_path, monkeypatch):
+    monkeypatch.setattr(column_plan, "plans", {})
+    path = tmp_path / "a.csv"
+    path.write_bytes(b"txn_id,ttime,us\n1,2,3\n")
+    with pytest.raises(HeaderError) as raised:
+        column_plan.plan_for(str(path))
+    assert not isinstance(raised.value, column_plan.IncompleteHeader)
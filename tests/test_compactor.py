@@ -0,0 +1,139 @@
+import glob
+import logging
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from compactor import compactor
+from utils.checksums import sidecar_path, write_sidecar
+
+logger = logging.getLogger("test.compactor")
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    paths = {name: str(tmp_path / name) for name in ("staging", "processed", "failed")}
+    for path in paths.values():
+        os.makedirs(path)
+    return paths
+
+def stage(dirs, count, day="20260101"):
+    paths = []
+    for i in range(count):
+        path = os.path.join(dirs["staging"], f"transactions_{day}_000000_{i:032x}.parquet")
+        pq.write_table(pa.table({"transaction_id": [f"t{i}a", f"t{i}b"], "amount": [1.0, 2.0]}), path)
+        paths.append(path)
+    return paths
+
+def compact(dirs):
+    return compactor.compact_once(dirs["staging"], dirs["processed"], dirs["failed"], logger, 1 << 30, 0, flush_all=True)
+
+def outputs(dirs):
+    return sorted(glob.glob(os.path.join(dirs["processed"], "*.parquet")))
+
+def journals(dirs):
+    return glob.glob(os.path.join(dirs["staging"], compactor.JOURNAL_PREFIX + "*"))
+
+def crash_after_rename(sources):
+    raise OSError("crash between rename and cleanup")
+
+
+def test_batch_merged_and_sources_removed(dirs):
+    stage(dirs, 3)
+    assert compact(dirs) == 1
+    [output] = outputs(dirs)
+    assert pq.read_table(output).num_rows == 6
+    assert os.path.basename(output).startswith("transactions_20260101_")
+    assert os.listdir(dirs["staging"]) == []
+
+def test_crash_after_rename_does_not_compact_twice(dirs, monkeypatch):
+    stage(dirs, 3)
+    monkeypatch.setattr(compactor, "remove_sources", crash_after_rename)
+    assert compact(dirs) == 0
+    assert len(outputs(dirs)) == 1 and len(journals(dirs)) == 1
+
+    monkeypatch.undo()
+    assert compact(dirs) == 0
+    assert len(outputs(dirs)) == 1
+    assert os.listdir(dirs["staging"]) == []
+
+def test_output_uploaded_before_recovery(dirs, monkeypatch):
+    # The uploader may take the compacted file away before the sources are cleaned up
+    stage(dirs, 2)
+    monkeypatch.setattr(compactor, "remove_sources", crash_after_rename)
+    compact(dirs)
+    for path in outputs(dirs):
+        os.remove(path)
+    monkeypatch.undo()
+    assert compact(dirs) == 0
+    assert outputs(dirs) == []
+    assert os.listdir(dirs["staging"]) == []
+
+def test_crash_before_rename_rolls_back(dirs, monkeypatch):
+    sources = stage(dirs, 2)
+    real_replace = os.replace
+
+    def crash(src, dst):
+        if dst.startswith(dirs["processed"]) and dst.endswith(".parquet"):
+            raise KeyboardInterrupt   # the process dies: no except branch cleans up
+        return real_replace(src, dst)
+
+    monkeypatch.setattr(compactor.os, "replace", crash)
+    with pytest.raises(KeyboardInterrupt):
+        compact(dirs)
+    monkeypatch.setattr(compactor.os, "replace", real_replace)
+    assert outputs(dirs) == [] and len(journals(dirs)) == 1
+
+    assert compact(dirs) == 1
+    [output] = outputs(dirs)
+    assert pq.read_table(output).num_rows == 4
+    assert not any(os.path.exists(path) for path in sources)
+    assert journals(dirs) == []
+    assert [name for name in os.listdir(dirs["processed"]) if name.endswith(".tmp")] == []
+
+def stage_table(dirs, name, table):
+    path = os.path.join(dirs["staging"], name)
+    pq.write_table(table, path)
+    return path
+
+def test_mismatched_schema_quarantined(dirs):
+    good = stage(dirs, 2)
+    # Written before OUTPUT_TYPES was enforced: user_id kept as text
+    drifted = stage_table(dirs, "transactions_20260101_000000_drifted.parquet",
+                          pa.table({"transaction_id": ["tx"], "amount": [1.0], "user_id": pa.array(["U77"], pa.large_string())}))
+    write_sidecar(drifted, {"size": 1})
+    assert compact(dirs) == 1
+    [output] = outputs(dirs)
+    assert pq.read_table(output).num_rows == 4
+    assert os.listdir(dirs["failed"]) == [os.path.basename(drifted)]
+    assert not os.path.exists(sidecar_path(drifted))
+    assert not any(os.path.exists(path) for path in good)
+    assert os.listdir(dirs["staging"]) == []
+
+def test_schemas_that_do_not_merge(dirs):
+    stage(dirs, 2)
+    other = stage_table(dirs, "transactions_20260101_000000_other.parquet",
+                        pa.table({"transaction_id": ["tx"], "amount": ["not a number"]}))
+    assert compact(dirs) == 1
+    assert pq.read_table(outputs(dirs)[0]).num_rows == 4
+    assert os.listdir(dirs["failed"]) == [os.path.basename(other)]
+
+def test_file_failing_during_merge(dirs, monkeypatch):
+    stage(dirs, 2)
+    bad = stage_table(dirs, "transactions_20260101_000000_bad.parquet",
+                      pa.table({"transaction_id": ["tx"], "amount": [1.0]}))
+    real_read = pq.read_table
+
+    def read_table(path, *args, **kwargs):
+        if path == bad:
+            raise OSError("corrupt page")
+        return real_read(path, *args, **kwargs)
+
+    monkeypatch.setattr(compactor.pq, "read_table", read_table)
+    assert compact(dirs) == 1
+    assert pq.read_table(outputs(dirs)[0]).num_rows == 4
+    assert os.listdir(dirs["failed"]) == [os.path.basename(bad)]
+    assert [name for name in os.listdir(dirs["processed"]) if name.endswith(".tmp")] == []
+    assert journals(dirs) == []
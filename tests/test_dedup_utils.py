@@ -0,0 +1,75 @@
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.dedup_utils import SeenIds, DedupIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = DedupIndex(str(tmp_path / "dedup.db"), window_days=7)
+    yield index
+    index.close()
+
+
+def ids(*values):
+    return pd.Series(values, dtype=object)
+
+
+def test_seen_ids_across_batches():
+    seen = SeenIds()
+    assert seen.first_seen(ids("a", "b", "a")).tolist() == [True, True, False]
+    assert seen.first_seen(ids("b", "c")).tolist() == [False, True]
+    for batch in range(50):
+        seen.first_seen(ids(*[f"x{batch}_{i}" for i in range(20)]))
+    assert len(seen) == 3 + 50 * 20
+    assert seen.first_seen(ids("x7_3", "new")).tolist() == [False, True]
+
+def test_seen_ids_spilled_beyond_cap(tmp_path, monkeypatch):
+    monkeypatch.setattr(SeenIds, "MERGE_BLOCK", 64)
+    capped = SeenIds(max_memory_ids=500, spill_dir=str(tmp_path))
+    unbounded = SeenIds()
+    values = np.random.default_rng(0).integers(0, 5000, 6000).astype(str)
+    for start in range(0, len(values), 250):
+        batch = ids(*values[start:start + 250])
+        assert capped.first_seen(batch).tolist() == unbounded.first_seen(batch).tolist()
+    assert len(capped) == len(unbounded) == len(set(values))
+    assert any(isinstance(run, np.memmap) for run in capped.runs)
+    assert all(len(run) <= 500 for run in capped.runs if not isinstance(run, np.memmap))
+    assert os.listdir(tmp_path) == []
+
+def test_other_delivery_is_dropped(index):
+    assert index.first_seen(ids("t1", "t2"), "delivery-1").tolist() == [True, True]
+    assert index.first_seen(ids("t2", "t3"), "delivery-2").tolist() == [False, True]
+
+def test_retry_keeps_own_rows(index):
+    index.first_seen(ids("t1", "t2"), "delivery-1")
+    assert index.first_seen(ids("t1", "t2"), "delivery-1").tolist() == [True, True]
+
+def test_forget_releases_ids(index):
+    index.first_seen(ids("t1"), "delivery-1")
+    index.forget("delivery-1")
+    assert index.first_seen(ids("t1"), "delivery-2").tolist() == [True]
+
+def test_window_eviction(index):
+    index.first_seen(ids("t1"), "delivery-1")
+    old_day = (date.today() - timedelta(days=8)).toordinal()
+    index.conn.execute("UPDATE seen SET day = ?", (old_day,))
+    index.last_evicted = None
+    assert index.first_seen(ids("t1"), "delivery-2").tolist() == [True]
+
+def test_shared_between_connections(tmp_path):
+    first = DedupIndex(str(tmp_path / "dedup.db"))
+    second = DedupIndex(str(tmp_path / "dedup.db"))
+    try:
+        first.first_seen(ids("t1"), "delivery-1")
+        assert second.first_seen(ids("t1", "t2"), "delivery-2").tolist() == [False, True]
+    finally:
+        first.close()
+        second.close()
+
+def test_empty_batch(index):
+    assert index.first_seen(ids(), "delivery-1").dtype == np.bool_
@@ -0,0 +1,25 @@
+import logging
+import random
+
+import pytest
+
+from benchmarks.engine_parity import compare_file
+from incoming_watcher import process_worker as pw
+from synth_data.gen_synth_data import main as gen_csv
+
+
+@pytest.fixture(autouse=True)
+def context():
+    logger = logging.getLogger("test.engine_parity")
+    pw.init_context(logger, logger, None, None, None, None)
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("error_mix", [1.0, 0.2])
+def test_engines_keep_same_rows(tmp_path, seed, error_mix):
+    # Every header variant and error kind the generator draws, one file per case
+    random.seed(seed)
+    file_path = gen_csv(str(tmp_path), 2000, f"payments_parity_{seed}.csv", error_mix=error_mix)
+    same, kept, _, _ = compare_file(file_path)
+    assert kept > 0
+    assert same
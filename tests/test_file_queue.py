@@ -0,0 +1,67 @@
+import os
+from queue import Full
+
+import pytest
+
+from utils.file_queue import FileQueue, FRESH, RESCAN, RETRY
+
+
+@pytest.fixture
+def files(tmp_path):
+    # name -> (size, mtime)
+    def make(**specs):
+        paths = {}
+        for name, (size, mtime) in specs.items():
+            path = tmp_path / f"{name}.csv"
+            path.write_bytes(b"x" * size)
+            os.utime(path, (mtime, mtime))
+            paths[name] = str(path)
+        return paths
+    return make
+
+def drain(queue):
+    return [os.path.basename(queue.get_nowait())[:-4] for _ in range(queue.qsize())]
+
+
+def test_classes_then_oldest_first(files):
+    paths = files(old=(10, 100), new=(10, 200), rescanned=(10, 50), retried=(10, 10))
+    queue = FileQueue(fair_every=0)
+    queue.put((paths["retried"], RETRY))
+    queue.put((paths["rescanned"], RESCAN))
+    queue.put((paths["new"], FRESH))
+    queue.put((paths["old"], FRESH))
+    assert drain(queue) == ["old", "new", "rescanned", "retried"]
+
+def test_shortest_first(files):
+    paths = files(big=(1000, 100), small=(1, 300), medium=(100, 200))
+    queue = FileQueue(shortest_first=True)
+    for path in paths.values():
+        queue.put((path, FRESH))
+    assert drain(queue) == ["small", "medium", "big"]
+
+def test_overdue_file_goes_first(files):
+    paths = files(big=(1000, 100), small=(1, 300))
+    queue = FileQueue(shortest_first=True, max_wait_s=0)
+    queue.put((paths["big"], FRESH))
+    queue.put((paths["small"], FRESH))
+    assert drain(queue) == ["big", "small"]
+
+def test_lower_class_served_every_fair_every(files):
+    paths = files(**{f"f{i}": (1, 100 + i) for i in range(4)}, retried=(1, 1))
+    queue = FileQueue(fair_every=2)
+    queue.put((paths["retried"], RETRY))
+    for i in range(4):
+        queue.put((paths[f"f{i}"], FRESH))
+    assert drain(queue) == ["f0", "retried", "f1", "f2", "f3"]
+
+def test_fresh_reserve_above_maxsize(files):
+    paths = files(a=(1, 1), b=(1, 2), c=(1, 3))
+    queue = FileQueue(maxsize=1, fresh_reserve=1)
+    queue.put_nowait((paths["a"], RESCAN))
+    assert queue.full()
+    with pytest.raises(Full):
+        queue.put_nowait((paths["b"], RESCAN))
+    queue.put_nowait((paths["b"], FRESH))
+    with pytest.raises(Full):
+        queue.put_nowait((paths["c"], FRESH))
+    assert drain(queue) == ["b", "a"]
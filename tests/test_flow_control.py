@@ -0,0 +1,36 @@
+import logging
+import shutil
+
+from utils.flow_control import FlowControl, disk_free
+
+
+def flow(folders, **limits):
+    return FlowControl(folders, logging.getLogger("test"), **limits)
+
+
+def test_missing_folder_measures_nearest_existing_ancestor(tmp_path):
+    missing = tmp_path / "not" / "created" / "processed"
+    assert disk_free(str(missing)) == shutil.disk_usage(tmp_path).free
+
+
+def test_check_survives_missing_processed_dir(tmp_path):
+    control = flow([str(tmp_path / "processed")], high_files=10, min_free_bytes=1)
+    control.check()
+    files, size, free = control.backlog
+    assert (files, size) == (0, 0)
+    assert free is not None
+    assert not control.paused()
+
+
+def test_pauses_and_resumes_on_backlog(tmp_path):
+    control = flow([str(tmp_path)], high_files=2, low_files=1)
+    for name in ("a.parquet", "b.parquet", "c.parquet.tmp"):
+        (tmp_path / name).write_bytes(b"x")
+    control.check()
+    assert control.paused()
+    (tmp_path / "a.parquet").unlink()
+    control.check()
+    assert control.paused()
+    (tmp_path / "b.parquet").unlink()
+    control.check()
+    assert not control.paused()
@@ -0,0 +1,53 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from logging.handlers import QueueHandler
+
+import pytest
+
+import logging_config
+
+
+def init_child(log_queue):
+    # What a pool process goes through: the re-imported service module sets up a logger
+    # (watcher.py did so at import time), then init_pool_worker forwards to the parent
+    logging_config.setup_logger("dropzone.reading")
+    logging_config.forward_to(log_queue)
+    logging_config.setup_logger("dropzone.processing")
+
+def child_handlers():
+    handlers = [h for name in ("dropzone.reading", "dropzone.processing") for h in logging.getLogger(name).handlers]
+    logging.getLogger("dropzone.processing").warning("hello from pid %d", os.getpid())
+    return {
+        "file": sum(isinstance(h, logging.FileHandler) for h in handlers),
+        "stream": sum(type(h) is logging.StreamHandler for h in handlers),
+        "forwarding": sum(type(h) is QueueHandler for h in handlers),
+        "listener": logging_config.listener is not None,
+        "output": logging_config.output is not None,
+    }
+
+
+@pytest.mark.parametrize("mode", ["async", "sync"])
+def test_pool_process_has_no_file_handler(mode, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LOG_MODE", mode)
+    monkeypatch.setenv("LOG_FILE", "pool.log")
+    (tmp_path / "logs").mkdir()
+    monkeypatch.setattr(logging_config, "LOG_FILE", "pool.log")
+    monkeypatch.setattr(logging_config, "output", None)
+    monkeypatch.setattr(logging_config, "child_queue", None)
+
+    log_queue = logging_config.pool_log_queue()
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=init_child, initargs=(log_queue,)) as pool:
+        found = pool.submit(child_handlers).result(timeout=60)
+
+    assert found == {"file": 0, "stream": 0, "forwarding": 2, "listener": False, "output": False}
+
+    # The child's record reached the parent's file through the queue
+    deadline = time.time() + 5
+    while time.time() < deadline and "hello from pid" not in (tmp_path / "logs" / "pool.log").read_text():
+        time.sleep(0.05)
+    assert "hello from pid" in (tmp_path / "logs" / "pool.log").read_text()
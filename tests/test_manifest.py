@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+from utils.manifest import FileManifest
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "state" / "manifest.db")
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "payments.csv"
+    path.write_text("a,b\n1,2\n")
+    return str(path)
+
+@pytest.fixture
+def manifest(db_path):
+    manifest = FileManifest(db_path, owner="run-1")
+    yield manifest
+    manifest.close()
+
+
+def test_claimed_once_per_run(manifest, csv_path):
+    assert manifest.claim(csv_path)
+    assert not manifest.claim(csv_path)
+    assert manifest.get(csv_path)[:2] == ("queued", "run-1")
+
+def test_finished_file_not_claimed_again(manifest, csv_path):
+    manifest.claim(csv_path)
+    manifest.start(csv_path, "processing")
+    manifest.finish(csv_path, "processed")
+    assert manifest.finished(csv_path)
+    assert not manifest.claim(csv_path)
+    assert manifest.leftovers() == [csv_path]
+
+def test_new_version_claimed_with_new_trace(manifest, csv_path):
+    manifest.claim(csv_path)
+    manifest.finish(csv_path, "empty")
+    first_trace = manifest.trace_id(csv_path)
+    with open(csv_path, "a") as f:
+        f.write("3,4\n")
+    assert not manifest.finished(csv_path)
+    assert manifest.claim(csv_path)
+    assert manifest.trace_id(csv_path) != first_trace
+
+def test_retry_keeps_trace_and_attempts(manifest, csv_path):
+    manifest.claim(csv_path)
+    assert manifest.start(csv_path, "processing") == 1
+    trace_id = manifest.trace_id(csv_path)
+    manifest.release(csv_path)
+    assert manifest.claim(csv_path)
+    assert manifest.start(csv_path, "processing") == 2
+    assert manifest.trace_id(csv_path) == trace_id
+
+def test_resume_after_crash(db_path, csv_path, tmp_path):
+    crashed = FileManifest(db_path, owner="run-1")
+    crashed.claim(csv_path)
+    crashed.start(csv_path, "processing")
+    gone = str(tmp_path / "gone.csv")
+    open(gone, "w").close()
+    crashed.claim(gone)
+    crashed.close()
+    os.remove(gone)
+
+    restarted = FileManifest(db_path, owner="run-2")
+    try:
+        assert restarted.resume() == [csv_path]
+        assert restarted.claim(csv_path)
+        assert restarted.resume() == []
+        assert restarted.counts() == {"queued": 1}
+    finally:
+        restarted.close()
+
+def test_objects_by_content(manifest):
+    assert manifest.uploaded_object("abc") is None
+    manifest.remember_object("abc", "transactions/abc.parquet")
+    assert manifest.uploaded_object("abc") == "transactions/abc.parquet"
+
+def test_pool_crash_gives_attempt_back(manifest, csv_path):
+    manifest.claim(csv_path)
+    assert manifest.start(csv_path, "processing") == 1
+    assert manifest.crashed(csv_path) == 1
+    assert manifest.start(csv_path, "processing") == 1
+    assert manifest.crashed(csv_path) == 2
+    manifest.start(csv_path, "processing")
+    manifest.survived(csv_path)
+    manifest.start(csv_path, "processing")
+    assert manifest.crashed(csv_path) == 1
+
+def test_new_version_resets_crashes(manifest, csv_path):
+    manifest.claim(csv_path)
+    manifest.crashed(csv_path)
+    manifest.release(csv_path)
+    with open(csv_path, "a") as f:
+        f.write("3,4\n")
+    manifest.claim(csv_path)
+    assert manifest.crashed(csv_path) == 1
+
+def test_pruned_while_running(manifest, csv_path):
+    manifest.claim(csv_path)
+    manifest.finish(csv_path, "processed")
+    manifest.remember_object("abc", "transactions/abc.parquet")
+    manifest.conn.execute("UPDATE files SET updated_at = 0")
+    manifest.conn.execute("UPDATE objects SET uploaded_at = 0")
+    assert manifest.prune_if_due()
+    assert manifest.get(csv_path) is None
+    assert manifest.uploaded_object("abc") is None
+    assert not manifest.prune_if_due()
+    assert manifest.prune_if_due(every_s=0)
@@ -0,0 +1,32 @@
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from incoming_watcher.normalization import NormalizationTable, CURRENCY_TABLE, STATUS_TABLE
+
+RAW = ["usd", "US$", "EUR", "€", "XXX", None, "", " USD "]
+EXPECTED = ["USD", "USD", "EUR", "EUR", None, None, None, "USD"]
+
+
+def test_series_mapped_to_fixed_categories():
+    values = pd.Series(RAW, index=range(10, 18), name="currency")
+    normalized = CURRENCY_TABLE.normalize_series(values)
+    assert normalized.astype(object).where(normalized.notna(), None).tolist() == EXPECTED
+    assert list(normalized.cat.categories) == sorted({"USD", "EUR", "GBP", "JPY", "CAD"})
+    assert normalized.index.tolist() == list(range(10, 18))
+    assert normalized.name == "currency"
+
+def test_array_matches_series():
+    normalized = CURRENCY_TABLE.normalize_array(pa.chunked_array([RAW[:4], RAW[4:]], pa.string()))
+    assert normalized.to_pylist() == EXPECTED
+    assert normalized.dictionary.to_pylist() == CURRENCY_TABLE.categories
+
+def test_same_dictionary_for_every_file():
+    first = STATUS_TABLE.normalize_array(pa.array(["ok"]))
+    second = STATUS_TABLE.normalize_array(pa.array(["declined", "unknown"]))
+    assert first.dictionary.equals(second.dictionary)
+    assert pd.Series(["ok"]).pipe(STATUS_TABLE.normalize_series).cat.categories.tolist() == first.dictionary.to_pylist()
+
+def test_mapping_outside_canonical_values():
+    with pytest.raises(ValueError):
+        NormalizationTable({"A", "B"}, {"a": "A", "c": "C"})
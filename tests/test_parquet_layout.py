@@ -0,0 +1,41 @@
+from datetime import datetime
+
+import pyarrow as pa
+
+from utils.parquet_layout import OUTPUT_TYPES, ParquetLayout
+
+
+def rows(user_ids):
+    count = len(user_ids)
+    return pa.table({
+        "transaction_id": [f"t{i}" for i in range(count)],
+        "transaction_ts": [datetime(2026, 1, 1, 0, 0, i) for i in range(count)],
+        "user_id": user_ids,
+        "amount": [1.5] * count,
+        "currency": ["USD"] * count,
+        "status": ["SUCCESS"] * count,
+        "product_id": ["P0001"] * count,
+        "payment_method": ["CARD"] * count,
+    })
+
+def output_schema():
+    return pa.schema(list(OUTPUT_TYPES.items()))
+
+
+def test_declared_types():
+    table = ParquetLayout().conform(rows([3.0, 1.0, None]))
+    assert table.schema == output_schema()
+    assert table["user_id"].to_pylist() == [3, 1, None]
+
+def test_values_that_do_not_fit_are_dropped():
+    drops = {}
+    table = ParquetLayout().conform(rows(["12", "U77", None, "1.5"]), drops)
+    assert table.schema == output_schema()
+    assert table["transaction_id"].to_pylist() == ["t0", "t2"]
+    assert table["user_id"].to_pylist() == [12, None]
+    assert drops == {"bad_type": 2}
+
+def test_nothing_fits():
+    table = ParquetLayout().conform(rows(["U1", "U2"]), {})
+    assert table.num_rows == 0
+    assert table.schema == output_schema()
@@ -0,0 +1,84 @@
+import logging
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+import pytest
+
+from incoming_watcher import process_worker as pw
+
+
+class Scheduler:
+    def schedule(self, item, attempt):
+        return 1.0
+
+
+@pytest.fixture
+def worker(tmp_path):
+    logger = logging.getLogger("test.process_worker")
+    dirs = [str(tmp_path / name) for name in ("incoming", "processed", "failed_read", "failed_transform")]
+    for path in dirs:
+        (tmp_path / path).mkdir()
+    pw.init_context(logger, logger, *dirs,
+                    manifest_path=str(tmp_path / "state" / "processor.db"),
+                    dedup_path=str(tmp_path / "state" / "dedup.db"))
+    csv_path = tmp_path / "incoming" / "payments.csv"
+    csv_path.write_text("transaction_id\nt1\n")
+    pw.manifest.claim(str(csv_path))
+    yield str(csv_path)
+    pw.manifest.close()
+    pw.dedup_index.close()
+    pw.dedup_index = None
+
+def record_ids(file_path):
+    # What drop_seen_elsewhere did in the pool before the outcome below
+    pw.dedup_index.first_seen(pd.Series(["t1"]), pw.delivery_id(file_path))
+
+def resend_keeps_rows():
+    return pw.dedup_index.first_seen(pd.Series(["t1"]), "corrected-resend").tolist() == [True]
+
+def finish(file_path, result=None, error=None):
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result((result, {}, []))
+    pw.process_queue.put((file_path, 0))
+    pw.process_queue.get()
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    pw.finish_processing(file_path, pw.manifest.start(file_path, "processing"), slots, Scheduler(), future)
+
+
+@pytest.mark.parametrize("outcome", [
+    {"result": pw.RETRY},
+    {"error": BrokenProcessPool()},
+    {"error": RuntimeError("lost result")},
+])
+def test_unpublished_delivery_releases_ids(worker, outcome):
+    record_ids(worker)
+    finish(worker, **outcome)
+    assert resend_keeps_rows()
+
+def test_failed_handoff_releases_ids(worker):
+    record_ids(worker)
+    pw.finish_handoff(worker, None)
+    assert resend_keeps_rows()
+
+def test_published_delivery_keeps_ids(worker):
+    record_ids(worker)
+    finish(worker, result=True)
+    assert not resend_keeps_rows()
+
+def test_incomplete_header_retried_then_failed(worker, tmp_path):
+    with open(worker, "w") as f:
+        f.write("transaction_id,transaction_ts,us")
+    for attempt in range(1, pw.MAX_ATTEMPTS):
+        assert pw.read_csv(worker, attempt) == pw.RETRY
+    assert pw.read_csv(worker, pw.MAX_ATTEMPTS) is None
+    assert (tmp_path / "failed_read" / "payments.csv").exists()
+
+def test_complete_header_missing_columns_fails_at_once(worker, tmp_path):
+    assert pw.read_csv(worker, 1) is None
+    assert (tmp_path / "failed_read" / "payments.csv").exists()
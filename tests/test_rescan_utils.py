@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from queue import Queue
+
+from utils.rescan_utils import DirCursor, rescan_once
+
+
+def drop(folder, name, mtime, data=b"a,b\n"):
+    path = folder / name
+    path.write_bytes(data)
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+def names(entries):
+    return [os.path.basename(path) for path, _ in entries]
+
+def scan_and_mark(cursor):
+    entries = cursor.scan()
+    for path, signature in entries:
+        cursor.mark(path, signature)
+    return names(entries)
+
+
+def test_only_new_or_changed_entries(tmp_path):
+    drop(tmp_path, "b.csv", 200)
+    drop(tmp_path, "a.csv", 100)
+    drop(tmp_path, ".hidden.csv", 50)
+    drop(tmp_path, "c.csv.tmp", 50)
+    drop(tmp_path, "d.parquet", 50)
+    cursor = DirCursor(str(tmp_path), ".csv")
+    assert scan_and_mark(cursor) == ["a.csv", "b.csv"]
+    assert scan_and_mark(cursor) == []
+
+    drop(tmp_path, "a.csv", 300, b"a,b\n1,2\n")
+    assert scan_and_mark(cursor) == ["a.csv"]
+
+def test_unmarked_entries_returned_again(tmp_path):
+    drop(tmp_path, "a.csv", 100)
+    cursor = DirCursor(str(tmp_path), ".csv")
+    assert names(cursor.scan()) == ["a.csv"]
+    assert names(cursor.scan()) == ["a.csv"]
+
+def test_full_pass_resets_cursor(tmp_path):
+    drop(tmp_path, "a.csv", 100)
+    cursor = DirCursor(str(tmp_path), ".csv", full_every=3)
+    assert scan_and_mark(cursor) == ["a.csv"]
+    assert scan_and_mark(cursor) == []
+    assert scan_and_mark(cursor) == ["a.csv"]
+
+def test_removed_entries_forgotten(tmp_path):
+    path = drop(tmp_path, "a.csv", 100)
+    cursor = DirCursor(str(tmp_path), ".csv")
+    scan_and_mark(cursor)
+    os.remove(path)
+    assert cursor.scan() == []
+    assert cursor.seen == {}
+
+def test_missing_folder(tmp_path):
+    assert DirCursor(str(tmp_path / "gone"), ".csv").scan() == []
+
+def test_rescan_stops_at_full_queue(tmp_path):
+    for i in range(3):
+        drop(tmp_path, f"f{i}.csv", 100 + i)
+    cursor = DirCursor(str(tmp_path), ".csv")
+    general_queue = Queue(maxsize=1)
+
+    def queue_fn(file_path):
+        if general_queue.full():
+            return False
+        general_queue.put(file_path)
+        return True
+
+    assert rescan_once(cursor, queue_fn, general_queue, threading.Event()) == (2, 1)
+    general_queue.get()
+    # f0 was marked when queued, f1 stays for the next pass
+    assert rescan_once(cursor, queue_fn, general_queue, threading.Event()) == (2, 1)
+    assert os.path.basename(general_queue.get()) == "f1.csv"
+
+def test_recently_written_left_for_later(tmp_path):
+    drop(tmp_path, "old.csv", 100)
+    drop(tmp_path, "growing.csv", time.time())
+    cursor = DirCursor(str(tmp_path), ".csv", settle_s=60)
+    assert scan_and_mark(cursor) == ["old.csv"]
+    cursor.settle_s = 0
+    assert scan_and_mark(cursor) == ["growing.csv"]
+
+def test_skipped_files_stay_unmarked(tmp_path):
+    drop(tmp_path, "a.csv", 100)
+    drop(tmp_path, "b.csv", 200)
+    cursor = DirCursor(str(tmp_path), ".csv")
+    queued = []
+
+    def queue_fn(file_path):
+        queued.append(os.path.basename(file_path))
+        return True
+
+    busy = lambda file_path: file_path.endswith("a.csv")
+    assert rescan_once(cursor, queue_fn, Queue(), threading.Event(), busy) == (1, 1)
+    assert rescan_once(cursor, queue_fn, Queue(), threading.Event()) == (1, 1)
+    assert queued == ["b.csv", "a.csv"]
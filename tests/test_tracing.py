@@ -0,0 +1,21 @@
+from utils.tracing import Tracer
+
+
+def test_spans_dropped_without_trace_file():
+    tracer = Tracer()
+    for _ in range(100):
+        tracer.record("t1", "read", 1.0, 2.0)
+    tracer.extend([{"trace_id": "t2", "name": "write"}])
+    assert tracer.pending == []
+    assert tracer.drain() == []
+
+def test_pool_process_buffers_until_drained():
+    tracer = Tracer()
+    tracer.buffer()
+    tracer.record(["t1", "t2"], "read", 1.0, 2.5, file="a.csv")
+    spans = tracer.drain()
+    assert [(span["trace_id"], span["name"], span["duration_s"], span["file"]) for span in spans] == [
+        ("t1", "read", 1.5, "a.csv"),
+        ("t2", "read", 1.5, "a.csv"),
+    ]
+    assert tracer.drain() == []
@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+
+from watchdog.events import FileSystemEventHandler
+
+from utils.queue_utils import is_candidate
+
+# Arrival detection for files written in place. Observer callbacks only record the event (no I/O,
+# so the observer thread never waits); one tracker thread decides when a file is complete:
+#   rename into the folder                                  -> ready on the next pass
+#   close-write                                             -> ready once the file was not written
+#       for `quiet_s` (its mtime is that old): a writer that appends and closes in bursts closes
+#       many times
+#   created / modified                                      -> ready once no event came for
+#       `quiet_s`, two stats `quiet_s` apart agree on (size, mtime), the mtime is `quiet_s` old and
+#       the last byte is a newline (a file without one is accepted after `max_wait_s`)
+# A later modify event or a changed (size, mtime) takes back an earlier rename / close-write.
+# Everything that became ready in one pass goes to `on_ready` as one batch.
+
+
+class Pending:
+    __slots__ = ("first_seen", "complete", "renamed", "signature", "due")
+
+    def __init__(self, now):
+        self.first_seen = now
+        self.complete = False
+        self.renamed = False
+        self.signature = None
+        self.due = now
+
+
+class ArrivalTracker:
+    def __init__(self, on_ready, logger, target, quiet_s=2.0, max_wait_s=10.0):
+        self.on_ready = on_ready      # on_ready([(path, first event time), ...])
+        self.logger = logger
+        self.target = target
+        self.quiet_s = quiet_s
+        self.max_wait_s = max_wait_s
+        self.cond = threading.Condition()
+        self.pending = {}
+
+    def __len__(self):
+        with self.cond:
+            return len(self.pending)
+
+    def busy(self, file_path):
+        # Still settling here, so the rescan leaves it alone (one folder per tracker: names are unique)
+        name = os.path.basename(file_path)
+        with self.cond:
+            return any(os.path.basename(path) == name for path in self.pending)
+
+    def note(self, file_path, complete=False, renamed=False):
+        # Observer thread: O(1), never touches the file
+        if not is_candidate(file_path, self.target):
+            return
+        now = time.monotonic()
+        with self.cond:
+            entry = self.pending.get(file_path)
+            if entry is None:
+                entry = self.pending[file_path] = Pending(now)
+            entry.complete = complete or renamed
+            entry.renamed = renamed
+            if renamed:
+                entry.due = now
+                self.cond.notify()
+            else:
+                entry.due = now + self.quiet_s
+
+    def run(self, stop_event):
+        while not stop_event.is_set():
+            with self.cond:
+                due = [path for path, entry in self.pending.items() if entry.due <= time.monotonic()]
+                if not due:
+                    next_due = min((entry.due for entry in self.pending.values()), default=None)
+                    timeout = 0.5 if next_due is None else max(0.0, next_due - time.monotonic())
+                    self.cond.wait(min(timeout, 0.5))
+                    continue
+            self.check(due)
+
+    def check(self, paths):
+        ready = []
+        for path in paths:
+            with self.cond:
+                entry = self.pending.get(path)
+                if entry is None or entry.due > time.monotonic():
+                    continue   # a newer event pushed it back
+            verdict = self.settled(path, entry)
+            with self.cond:
+                if self.pending.get(path) is not entry:
+                    continue
+                if verdict is None:
+                    del self.pending[path]
+                elif verdict:
+                    del self.pending[path]
+                    ready.append((path, entry.first_seen))
+                elif entry.due <= time.monotonic():
+                    entry.due = time.monotonic() + self.quiet_s
+        if not ready:
+            return
+        wall_offset = time.time() - time.monotonic()
+        try:
+            self.on_ready([(path, first_seen + wall_offset) for path, first_seen in ready])
+        except Exception:
+            self.logger.warning("🟡 Queueing %d arrivals failed, left for the rescan", len(ready), exc_info=True)
+
+    def settled(self, path, entry):
+        # True: complete; False: check again later; None: gone (or given up on, see below)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        signature = (stat.st_size, stat.st_mtime_ns)
+        stable = entry.signature == signature
+        if not stable and entry.signature is not None:
+            # Written again since the last look
+            entry.complete = entry.renamed = False
+        entry.signature = signature
+        if entry.renamed:
+            return True
+        quiet = time.time() - stat.st_mtime >= self.quiet_s
+        if entry.complete:
+            return quiet
+        waited_out = time.monotonic() - entry.first_seen >= self.max_wait_s
+        if not (stable and quiet):
+            return False
+        if stat.st_size == 0:
+            # Still empty after max_wait_s: left to the rescan instead of polling it forever
+            return None if waited_out else False
+        return waited_out or ends_with_newline(path, stat.st_size)
+
+
+def ends_with_newline(path, size):
+    try:
+        with open(path, "rb") as f:
+            f.seek(size - 1)
+            return f.read(1) == b"\n"
+    except OSError:
+        return False
+
+
+class ArrivalHandler(FileSystemEventHandler):
+    # Runs on the observer thread: only records the event, the tracker thread queues the file
+    def __init__(self, tracker):
+        super().__init__()
+        self.tracker = tracker
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.tracker.note(event.dest_path, renamed=True)
+
+    def on_closed(self, event):
+        # inotify IN_CLOSE_WRITE (Linux): the writer is done
+        if not event.is_directory:
+            self.tracker.note(event.src_path, complete=True)
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.tracker.note(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.tracker.note(event.src_path)
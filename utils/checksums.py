@@ -0,0 +1,182 @@
+import base64
+import hashlib
+import json
+import os
+import time
+import zlib
+from collections import deque
+
+# Checksums of a Parquet file, computed from the bytes while they are written (HashingFile) and
+# kept next to the file in "<name>.parquet.sums" until it is uploaded, so the uploader never reads
+# the file only to hash it. CRC32 is sent to S3 as the full-object checksum (accepted for single PUT
+# and multipart uploads alike). `content` names content-addressed objects: the SHA-256 of the bytes
+# before the Parquet footer (data pages, page index). The footer holds the lineage (trace ids and
+# source names, utils/tracing.py), which differs for every delivery of the same data, so it is left out;
+# the schema in it is fixed by ParquetLayout
+
+SIDECAR_EXT = ".sums"
+PARQUET_MAGIC = b"PAR1"
+
+
+class Checksums:
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+        self.crc32 = 0
+        self.size = 0
+        # SHA-256 state before each of the last writes: pyarrow writes the footer in one call,
+        # followed by its length and the magic
+        self.marks = deque(maxlen=4)
+        self.tail = b""
+
+    def update(self, data):
+        self.marks.append((self.size, self.sha256.copy()))
+        self.sha256.update(data)
+        self.crc32 = zlib.crc32(data, self.crc32)
+        self.size += len(data)
+        self.tail = (self.tail + bytes(data[-8:]))[-8:]
+
+    def result(self):
+        sums = {
+            "size": self.size,
+            "sha256": self.sha256.hexdigest(),
+            "crc32": base64.b64encode(self.crc32.to_bytes(4, "big")).decode("ascii"),
+        }
+        end = data_end(self.tail, self.size)
+        for offset, state in self.marks:
+            if offset == end:
+                sums["content"] = state.hexdigest()
+        return sums
+
+
+class HashingFile:
+    # Write-only file for pyarrow writers (pq.write_table / ParquetWriter): every buffer goes to
+    # disk and through the checksums. pyarrow never closes it, the `with` block does
+    def __init__(self, path):
+        self.file = open(path, "wb")
+        self.checksums = Checksums()
+
+    def write(self, data):
+        data = memoryview(data)
+        self.checksums.update(data)
+        return self.file.write(data)
+
+    def tell(self):
+        return self.checksums.size
+
+    def flush(self):
+        self.file.flush()
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+    def close(self):
+        self.file.close()
+
+    def result(self):
+        return self.checksums.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def data_end(tail, size):
+    # Offset of the Parquet footer, from the file's last 8 bytes (<footer length>PAR1); None if not Parquet
+    if size < 12 or len(tail) < 8 or tail[4:] != PARQUET_MAGIC:
+        return None
+    end = size - 8 - int.from_bytes(tail[:4], "little")
+    return end if end >= 4 else None
+
+def buffer_checksums(data):
+    # bytes / pa.Buffer already in memory (in-memory handoff)
+    data = memoryview(data)
+    checksums = Checksums()
+    end = data_end(bytes(data[-8:]), len(data))
+    if end is None:
+        checksums.update(data)
+    else:
+        checksums.update(data[:end])
+        checksums.update(data[end:])
+    return checksums.result()
+
+def content_digest(path, chunk_size=1024 * 1024):
+    # `content` of a Parquet on disk without a (matching) sidecar: one read of its data pages
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - 8))
+        end = data_end(f.read(8), size)
+        f.seek(0)
+        digest = hashlib.sha256()
+        remaining = size if end is None else end
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+def sidecar_path(path):
+    return path + SIDECAR_EXT
+
+def write_sidecar(path, sums):
+    # Before the Parquet itself is renamed into place: whoever sees the file finds its checksums
+    tmp_path = os.path.join(os.path.dirname(path), "." + os.path.basename(path) + SIDECAR_EXT + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(sums, f)
+    os.replace(tmp_path, sidecar_path(path))
+
+def read_sidecar(path, size=None):
+    # Checksums of `path`, None when there is no sidecar or it belongs to another version of the file
+    try:
+        with open(sidecar_path(path)) as f:
+            sums = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if size is None:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+    return sums if sums.get("size") == size else None
+
+def move_sidecar(path, dest_path):
+    try:
+        os.replace(sidecar_path(path), sidecar_path(dest_path))
+    except FileNotFoundError:
+        pass
+
+def remove_sidecar(path):
+    try:
+        os.remove(sidecar_path(path))
+    except FileNotFoundError:
+        pass
+
+def remove_orphans(folder, min_age_s=3600):
+    # Sidecars whose Parquet is gone (crash between the upload and the cleanup). Young ones are kept:
+    # a writer creates the sidecar just before it renames the Parquet into place
+    cutoff = time.time() - min_age_s
+    try:
+        with os.scandir(folder) as entries:
+            entries = list(entries)
+    except FileNotFoundError:
+        return 0
+    names = {entry.name for entry in entries}
+    removed = 0
+    for entry in entries:
+        if not entry.name.endswith(SIDECAR_EXT) or entry.name[:-len(SIDECAR_EXT)] in names:
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+def s3_checksum_args(sums):
+    # ExtraArgs for upload_file / upload_fileobj: S3 rejects the object if its CRC32 differs
+    return {"ChecksumCRC32": sums["crc32"]}
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+
+def hash_ids(ids):
+    return pd.util.hash_pandas_object(ids, index=False).to_numpy()
+
+
+class SeenIds:
+    # Set of 64-bit id hashes (~8 bytes per id) kept as sorted runs;
+    # runs of similar size are merged, so lookups touch O(log n) arrays.
+    # With max_memory_ids, a merged run larger than that is written to a file in spill_dir and
+    # memory-mapped instead of kept in memory (the file is unlinked right away, so nothing is left
+    # behind). Memory then stays around 16 bytes per id up to the cap (runs are merged in blocks of
+    # MERGE_BLOCK), whatever the number of ids
+    MERGE_BLOCK = 1 << 20
+
+    def __init__(self, max_memory_ids=0, spill_dir=None):
+        self.max_memory_ids = max_memory_ids
+        self.spill_dir = spill_dir
+        self.runs = []
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def contains(self, hashes):
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self.runs:
+            pos = np.searchsorted(run, hashes)
+            pos[pos == len(run)] = len(run) - 1
+            found |= run[pos] == hashes
+        return found
+
+    def add(self, hashes):
+        run = np.unique(hashes)
+        if not len(run):
+            return
+        while self.runs and len(self.runs[-1]) <= len(run):
+            run = self.merge(self.runs.pop(), run)
+        self.runs.append(run)
+
+    def merge(self, older, newer):
+        if not self.max_memory_ids or len(older) + len(newer) <= self.max_memory_ids:
+            return np.union1d(older, newer)
+        fd, path = tempfile.mkstemp(prefix=".seen_ids_", suffix=".bin", dir=self.spill_dir)
+        count = 0
+        with os.fdopen(fd, "wb") as f:
+            i = j = 0
+            while i < len(older) or j < len(newer):
+                # Up to MERGE_BLOCK values of each run, both cut at the same hash
+                cutoff = min(
+                    older[min(i + self.MERGE_BLOCK, len(older)) - 1] if i < len(older) else newer[-1],
+                    newer[min(j + self.MERGE_BLOCK, len(newer)) - 1] if j < len(newer) else older[-1],
+                )
+                next_i = int(np.searchsorted(older, cutoff, "right"))
+                next_j = int(np.searchsorted(newer, cutoff, "right"))
+                block = np.union1d(older[i:next_i], newer[j:next_j])
+                f.write(block.tobytes())
+                count += len(block)
+                i, j = next_i, next_j
+        run = np.memmap(path, dtype=newer.dtype, mode="r", shape=(count,))
+        os.remove(path)
+        return run
+
+    def first_seen(self, ids):
+        # Mask of ids seen neither earlier in this batch nor in any previous batch
+        hashes = hash_ids(ids)
+        keep = ~pd.Series(hashes).duplicated().to_numpy() & ~self.contains(hashes)
+        self.add(hashes[keep])
+        return keep
+
+
+def source_id(source):
+    digest = hashlib.blake2b(source.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class DedupIndex:
+    # transaction_ids seen across files during the last `window_days`, as 64-bit hashes in SQLite
+    # (exact, on disk, shared by all pool processes). Each id remembers the delivery that brought it
+    # (`source`: the claim's trace id, see process_worker.delivery_id), so a retried file does not
+    # drop its own rows while a resend under the same name does; a delivery that finally fails is
+    # forgotten
+    def __init__(self, db_path, window_days=7):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self.window_days = window_days
+        self.last_evicted = None
+
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS seen (h INTEGER PRIMARY KEY, day INTEGER NOT NULL, src INTEGER NOT NULL) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS seen_day ON seen(day);
+            CREATE INDEX IF NOT EXISTS seen_src ON seen(src);
+            CREATE TEMP TABLE batch (h INTEGER PRIMARY KEY) WITHOUT ROWID;
+        """)
+
+    def evict(self, today=None):
+        today = today or date.today()
+        if self.last_evicted == today:
+            return
+        cutoff = (today - timedelta(days=self.window_days)).toordinal()
+        self.conn.execute("DELETE FROM seen WHERE day <= ?", (cutoff,))
+        self.last_evicted = today
+
+    def first_seen(self, ids, source):
+        # Mask of ids not delivered by another delivery inside the window; the new ones are recorded
+        if not len(ids):
+            return np.zeros(0, dtype=bool)
+        self.evict()
+
+        hashes = hash_ids(ids.astype(str)).view(np.int64)
+        src = source_id(source)
+        unique = np.unique(hashes).tolist()
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("DELETE FROM batch")
+            self.conn.executemany("INSERT INTO batch (h) VALUES (?)", ((h,) for h in unique))
+            taken = self.conn.execute(
+                "SELECT h FROM batch JOIN seen USING (h) WHERE seen.src != ?", (src,)
+            ).fetchall()
+            self.conn.execute(
+                "INSERT OR IGNORE INTO seen (h, day, src) SELECT h, ?, ? FROM batch",
+                (date.today().toordinal(), src),
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        return ~np.isin(hashes, np.array([h for (h,) in taken], dtype=np.int64))
+
+    def forget(self, source):
+        self.conn.execute("DELETE FROM seen WHERE src = ?", (source_id(source),))
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,120 @@
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from queue import Queue, Full
+
+# Priority classes, lower is served first
+FRESH = 0    # watchdog events: new drops
+RESCAN = 1   # rescans and resume after restart
+RETRY = 2    # scheduled retries and failed/ folders
+
+
+def file_stat(file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return 0, time.time()
+    return stat.st_size, stat.st_mtime
+
+
+class FileQueue(Queue):
+    # Drop-in replacement for Queue(maxsize) of file paths, fed with put((file_path, priority)).
+    # - classes: FRESH before RESCAN before RETRY; every `fair_every`-th get serves the oldest lower
+    #   class instead, so a steady stream of fresh files cannot starve recovery completely
+    # - within a class: oldest file (mtime) first, or smallest first with shortest_first=True;
+    #   then a file that waited longer than max_wait_s goes first, so big files are not starved
+    # - FRESH may use `fresh_reserve` slots above maxsize: a full queue of rescanned backlog
+    #   does not turn new drops away
+    def __init__(self, maxsize=0, shortest_first=False, fair_every=8, max_wait_s=300, fresh_reserve=200):
+        self.shortest_first = shortest_first
+        self.fair_every = fair_every
+        self.max_wait_s = max_wait_s
+        self.fresh_reserve = fresh_reserve
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        self.heaps = {}      # class -> heap of (key, seq, file_path)
+        self.arrivals = {}   # class -> deque of (queued_at, seq, key, file_path), for max_wait_s
+        self.taken = set()   # seqs already served from the other structure
+        self.seq = itertools.count()
+        self.counts = {}     # class -> files waiting
+        self.gets = 0
+
+    def _qsize(self):
+        return sum(self.counts.values())
+
+    def _put(self, item):
+        file_path, priority = item
+        size, mtime = file_stat(file_path)
+        key = (size, mtime) if self.shortest_first else (mtime,)
+        seq = next(self.seq)
+        heapq.heappush(self.heaps.setdefault(priority, []), (key, seq, file_path))
+        if self.shortest_first:
+            self.arrivals.setdefault(priority, deque()).append((time.monotonic(), seq, key, file_path))
+        self.counts[priority] = self.counts.get(priority, 0) + 1
+
+    def _pop_heap(self, priority):
+        heap = self.heaps[priority]
+        while True:
+            key, seq, file_path = heapq.heappop(heap)
+            if seq in self.taken:
+                self.taken.discard(seq)
+                continue
+            if self.shortest_first:
+                self.taken.add(seq)
+            return file_path
+
+    def _pop_overdue(self, priority):
+        arrivals = self.arrivals.get(priority)
+        while arrivals and arrivals[0][1] in self.taken:
+            self.taken.discard(arrivals.popleft()[1])
+        if arrivals and time.monotonic() - arrivals[0][0] >= self.max_wait_s:
+            queued_at, seq, key, file_path = arrivals.popleft()
+            self.taken.add(seq)
+            return file_path
+        return None
+
+    def _get(self):
+        classes = sorted(priority for priority, count in self.counts.items() if count)
+        self.gets += 1
+        priority = classes[0]
+        if len(classes) > 1 and self.fair_every and self.gets % self.fair_every == 0:
+            priority = classes[1]
+
+        file_path = None
+        if self.shortest_first:
+            file_path = self._pop_overdue(priority)
+        if file_path is None:
+            file_path = self._pop_heap(priority)
+        self.counts[priority] -= 1
+        if not self.counts[priority]:
+            # Only lazily deleted entries are left in this class
+            for entry in self.heaps.pop(priority, ()):
+                self.taken.discard(entry[1])
+            for entry in self.arrivals.pop(priority, ()):
+                self.taken.discard(entry[1])
+        return file_path
+
+    def put(self, item, block=True, timeout=None):
+        # Queue.put with the class-aware limit
+        limit = self.maxsize + (self.fresh_reserve if item[1] == FRESH else 0)
+        with self.not_full:
+            if self.maxsize > 0:
+                if not block:
+                    if self._qsize() >= limit:
+                        raise Full
+                elif timeout is None:
+                    while self._qsize() >= limit:
+                        self.not_full.wait()
+                else:
+                    deadline = time.monotonic() + timeout
+                    while self._qsize() >= limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise Full
+                        self.not_full.wait(remaining)
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
@@ -0,0 +1,122 @@
+import os
+import shutil
+import threading
+
+
+def folder_backlog(folder, target):
+    # (files, bytes) waiting in one downstream folder; one scandir pass, .tmp files included
+    files = size = 0
+    try:
+        entries = os.scandir(folder)
+    except FileNotFoundError:
+        return 0, 0
+    with entries:
+        for entry in entries:
+            if not entry.name.endswith((target, ".tmp")):
+                continue
+            try:
+                size += entry.stat().st_size
+            except FileNotFoundError:
+                continue
+            files += 1
+    return files, size
+
+
+def disk_free(folder):
+    # Free bytes on the filesystem holding folder; a folder not created yet is measured at its
+    # nearest existing ancestor, which is where it will be created
+    path = os.path.abspath(folder)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return shutil.disk_usage(path).free
+
+
+class FlowControl:
+    # Watermark flow control between stages. Pauses when the downstream backlog crosses a high
+    # watermark (files or bytes) or free disk drops below min_free_bytes; resumes only once all of
+    # them are back under their low watermark. A limit of 0 turns that check off
+    def __init__(
+        self,
+        folders,
+        logger,
+        target=".parquet",
+        high_files=0,
+        low_files=0,
+        high_bytes=0,
+        low_bytes=0,
+        min_free_bytes=0,
+        resume_free_bytes=0,
+        interval=5,
+    ):
+        self.folders = [folder for folder in folders if folder]
+        self.logger = logger
+        self.target = target
+        self.high_files = high_files
+        self.low_files = low_files or high_files
+        self.high_bytes = high_bytes
+        self.low_bytes = low_bytes or high_bytes
+        self.min_free_bytes = min_free_bytes
+        self.resume_free_bytes = max(resume_free_bytes, min_free_bytes)
+        self.interval = interval
+
+        self.open = threading.Event()
+        self.open.set()
+        self.backlog = (0, 0, None)
+
+    def paused(self):
+        return not self.open.is_set()
+
+    def wait_open(self, timeout=None):
+        return self.open.wait(timeout)
+
+    def measure(self):
+        files = size = 0
+        for folder in self.folders:
+            folder_files, folder_bytes = folder_backlog(folder, self.target)
+            files += folder_files
+            size += folder_bytes
+        free = disk_free(self.folders[0]) if self.folders and self.min_free_bytes else None
+        self.backlog = (files, size, free)
+        return self.backlog
+
+    def over_high(self, files, size, free):
+        reasons = []
+        if self.high_files and files >= self.high_files:
+            reasons.append(f"{files} files waiting")
+        if self.high_bytes and size >= self.high_bytes:
+            reasons.append(f"{size // (1024 * 1024)} MB waiting")
+        if self.min_free_bytes and free is not None and free < self.min_free_bytes:
+            reasons.append(f"{free // (1024 * 1024)} MB free on disk")
+        return reasons
+
+    def under_low(self, files, size, free):
+        if self.high_files and files > self.low_files:
+            return False
+        if self.high_bytes and size > self.low_bytes:
+            return False
+        if self.min_free_bytes and free is not None and free < self.resume_free_bytes:
+            return False
+        return True
+
+    def check(self):
+        files, size, free = self.measure()
+        if not self.paused():
+            reasons = self.over_high(files, size, free)
+            if reasons:
+                self.open.clear()
+                self.logger.warning("⏸️ Backpressure: pausing intake (%s)", ", ".join(reasons))
+        elif self.under_low(files, size, free):
+            self.open.set()
+            self.logger.info("▶️ Backpressure: resuming intake (%d files, %d MB waiting)", files, size // (1024 * 1024))
+
+    def run(self, stop_event):
+        while not stop_event.is_set():
+            try:
+                self.check()
+            except Exception:
+                self.logger.warning("🟡 Backpressure check failed", exc_info=True)
+            stop_event.wait(self.interval)
+        self.open.set()
@@ -0,0 +1,268 @@
+import os
+import sqlite3
+import threading
+import time
+from uuid import uuid4
+
+# One row per file (keyed by file name: CSV names and uuid Parquet names never collide)
+#   csv:     queued -> processing -> processed | empty (every row filtered out) | failed
+#   parquet: queued -> uploading  -> uploaded  | failed
+# `owner` identifies the run holding the claim; rows left active by a dead run are stale
+# and can be claimed again, finished rows are never redone for the same file (size + mtime)
+# `crashes`: process pool crashes in a row the file was in flight for (its attempt is given back)
+# `objects`: content hash -> S3 key of every object uploaded with content-addressed keys
+
+ACTIVE_STATES = ("queued", "processing", "uploading")
+DONE_STATES = ("processed", "empty", "uploaded")
+
+# Finished and failed rows (and remembered objects) older than RETENTION_S are pruned on start and
+# then every PRUNE_EVERY_S, so the tables of a long-running service stay bounded
+RETENTION_S = 7 * 24 * 3600
+PRUNE_EVERY_S = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    state TEXT NOT NULL,
+    owner TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    size INTEGER,
+    mtime REAL,
+    output TEXT,
+    s3_key TEXT,
+    trace_id TEXT,
+    crashes INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_state ON files(state);
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    s3_key TEXT NOT NULL,
+    uploaded_at REAL NOT NULL
+);
+"""
+
+
+def file_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None, None
+    return stat.st_size, stat.st_mtime
+
+
+class FileManifest:
+    def __init__(self, db_path, owner=None, commit_every=500, commit_interval=0.1):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self.owner = owner or uuid4().hex
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+
+        self.lock = threading.RLock()
+        self.pending = 0
+        self.last_pruned = None
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+        if "trace_id" not in columns:
+            self.conn.execute("ALTER TABLE files ADD COLUMN trace_id TEXT")
+        if "crashes" not in columns:
+            self.conn.execute("ALTER TABLE files ADD COLUMN crashes INTEGER NOT NULL DEFAULT 0")
+
+        self.flusher = threading.Thread(target=self.flush_loop, daemon=True)
+        self.flusher.start()
+
+    # --- batching ---
+
+    def write(self, sql, params, durable=False):
+        with self.lock:
+            cur = self.conn.execute(sql, params)
+            self.pending += 1
+            if durable or self.pending >= self.commit_every:
+                self.commit()
+            return cur
+
+    def commit(self):
+        with self.lock:
+            if self.pending:
+                self.conn.commit()
+                self.pending = 0
+
+    def flush_loop(self):
+        # An open batch holds SQLite's write lock, so it is never kept longer than commit_interval
+        while True:
+            time.sleep(self.commit_interval)
+            try:
+                self.commit()
+            except sqlite3.ProgrammingError:
+                return
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            self.conn.close()
+
+    # --- queries ---
+
+    def get(self, file_path):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT state, owner, attempts, size, mtime FROM files WHERE name = ?",
+                (os.path.basename(file_path),),
+            ).fetchone()
+
+    def finished(self, file_path):
+        # Finished earlier and the file on disk is that same file (a crash hit before it was removed)
+        row = self.get(file_path)
+        if row is None or row[0] not in DONE_STATES:
+            return False
+        return (row[3], row[4]) == file_stat(file_path)
+
+    def trace_id(self, file_path):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT trace_id FROM files WHERE name = ?", (os.path.basename(file_path),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def attempts(self, file_path):
+        row = self.get(file_path)
+        return row[2] if row else 0
+
+    def counts(self):
+        # Files claimed by this run per state
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT state, COUNT(*) FROM files WHERE owner = ? GROUP BY state", (self.owner,)
+            ).fetchall()
+        return dict(rows)
+
+    def resume(self, states=ACTIVE_STATES):
+        # Paths of files that were in flight when the previous run stopped
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT path FROM files WHERE state IN ({','.join('?' * len(states))}) AND (owner IS NULL OR owner != ?) ORDER BY created_at",
+                (*states, self.owner),
+            ).fetchall()
+        return [path for (path,) in rows if os.path.exists(path)]
+
+    def leftovers(self):
+        # Finished files still on disk
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT path FROM files WHERE state IN ({','.join('?' * len(DONE_STATES))})",
+                DONE_STATES,
+            ).fetchall()
+        return [path for (path,) in rows if os.path.exists(path) and self.finished(path)]
+
+    def uploaded_object(self, digest):
+        # S3 key of an object with this content hash uploaded earlier (content-addressed uploads)
+        with self.lock:
+            row = self.conn.execute("SELECT s3_key FROM objects WHERE digest = ?", (digest,)).fetchone()
+        return row[0] if row else None
+
+    def prune(self, older_than_s=RETENTION_S):
+        self.last_pruned = time.monotonic()
+        cutoff = time.time() - older_than_s
+        self.write(
+            f"DELETE FROM files WHERE state IN ({','.join('?' * len(DONE_STATES))}, 'failed') AND updated_at < ?",
+            (*DONE_STATES, cutoff),
+        )
+        # Older objects are still found with a HEAD request
+        self.write("DELETE FROM objects WHERE uploaded_at < ?", (cutoff,), durable=True)
+
+    def prune_if_due(self, every_s=PRUNE_EVERY_S, older_than_s=RETENTION_S):
+        # From the services' rescan loops
+        if self.last_pruned is not None and time.monotonic() - self.last_pruned < every_s:
+            return False
+        self.prune(older_than_s)
+        return True
+
+    # --- transitions ---
+
+    def claim(self, file_path):
+        name = os.path.basename(file_path)
+        size, mtime = file_stat(file_path)
+        now = time.time()
+        with self.lock:
+            row = self.get(file_path)
+            if row is not None:
+                state, owner, attempts, old_size, old_mtime = row
+                if state in ACTIVE_STATES and owner == self.owner:
+                    return False
+                if state in DONE_STATES and (old_size, old_mtime) == (size, mtime):
+                    return False
+                # A new version of the file starts a new trace; retries keep theirs
+                changed = (old_size, old_mtime) != (size, mtime)
+                if state != "failed" and changed:
+                    attempts = 0
+                self.write(
+                    "UPDATE files SET path = ?, state = 'queued', owner = ?, attempts = ?, size = ?, mtime = ?, updated_at = ?, "
+                    "trace_id = CASE WHEN ? OR trace_id IS NULL THEN ? ELSE trace_id END, "
+                    "crashes = CASE WHEN ? THEN 0 ELSE crashes END WHERE name = ?",
+                    (file_path, self.owner, attempts, size, mtime, now, changed, uuid4().hex, changed, name),
+                )
+            else:
+                self.write(
+                    "INSERT INTO files (name, path, state, owner, size, mtime, trace_id, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+                    (name, file_path, self.owner, size, mtime, uuid4().hex, now, now),
+                )
+            return True
+
+    def release(self, file_path, reset_attempts=False):
+        self.write(
+            "UPDATE files SET owner = NULL, attempts = CASE WHEN ? THEN 0 ELSE attempts END, updated_at = ? WHERE name = ? AND owner = ?",
+            (reset_attempts, time.time(), os.path.basename(file_path), self.owner),
+        )
+
+    def start(self, file_path, state):
+        # Returns the attempt number this start represents. Committed right away: the work may
+        # run in another process that has to write to the same database
+        with self.lock:
+            self.write(
+                "UPDATE files SET state = ?, attempts = attempts + 1, updated_at = ? WHERE name = ?",
+                (state, time.time(), os.path.basename(file_path)),
+                durable=True,
+            )
+            return self.attempts(file_path)
+
+    def crashed(self, file_path):
+        # The process pool died while this file was in flight, maybe because of another file: the
+        # attempt is given back and counted as a crash instead. Returns the crashes in a row
+        with self.lock:
+            self.write(
+                "UPDATE files SET crashes = crashes + 1, attempts = MAX(attempts - 1, 0), updated_at = ? WHERE name = ?",
+                (time.time(), os.path.basename(file_path)),
+                durable=True,
+            )
+            row = self.conn.execute("SELECT crashes FROM files WHERE name = ?", (os.path.basename(file_path),)).fetchone()
+        return row[0] if row else 0
+
+    def survived(self, file_path):
+        # Came back from the pool: the crash streak is over
+        self.write("UPDATE files SET crashes = 0 WHERE name = ? AND crashes > 0", (os.path.basename(file_path),))
+
+    def set_state(self, file_path, state):
+        self.write(
+            "UPDATE files SET state = ?, updated_at = ? WHERE name = ?",
+            (state, time.time(), os.path.basename(file_path)),
+        )
+
+    def remember_object(self, digest, s3_key):
+        self.write(
+            "INSERT OR REPLACE INTO objects (digest, s3_key, uploaded_at) VALUES (?, ?, ?)",
+            (digest, s3_key, time.time()),
+        )
+
+    def finish(self, file_path, state, path=None, output=None, s3_key=None):
+        # Committed before returning: callers delete or move the file right after
+        self.write(
+            "UPDATE files SET state = ?, path = COALESCE(?, path), output = COALESCE(?, output), s3_key = COALESCE(?, s3_key), updated_at = ? WHERE name = ?",
+            (state, path, output, s3_key, time.time(), os.path.basename(file_path)),
+            durable=True,
+        )
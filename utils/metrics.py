@@ -0,0 +1,210 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.checksums import SIDECAR_EXT
+
+# Prometheus text-format metrics without a client library.
+# Counters and histograms are plain dicts behind an uncontended lock (cheap on the hot path);
+# gauges are callbacks evaluated only when /metrics is scraped.
+# Pool processes collect into their own copy of REGISTRY and return `REGISTRY.drain()` with each
+# result; the parent adds it with `REGISTRY.merge()`.
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def label_key(labelnames, labels):
+    return tuple(str(labels[name]) for name in labelnames)
+
+def format_labels(labelnames, key, extra=()):
+    pairs = list(zip(labelnames, key)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = label_key(self.labelnames, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def drain(self):
+        with self.lock:
+            values, self.values = self.values, {}
+        return values
+
+    def merge(self, values):
+        with self.lock:
+            for key, amount in values.items():
+                self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        with self.lock:
+            values = dict(self.values)
+        return [f"{self.name}{format_labels(self.labelnames, key)} {value}" for key, value in sorted(values.items())]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.values = {}   # key -> [count per bucket..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        key = label_key(self.labelnames, labels)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[-2] += 1
+            series[-1] += value
+
+    def drain(self):
+        with self.lock:
+            values, self.values = self.values, {}
+        return values
+
+    def merge(self, values):
+        with self.lock:
+            for key, other in values.items():
+                series = self.values.setdefault(key, [0] * (len(self.buckets) + 2))
+                for i, amount in enumerate(other):
+                    series[i] += amount
+
+    def render(self):
+        with self.lock:
+            values = {key: list(series) for key, series in self.values.items()}
+        lines = []
+        for key, series in sorted(values.items()):
+            cumulative = 0
+            for bound, amount in zip(self.buckets + ("+Inf",), series):
+                cumulative += amount
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {series[-1]}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn, labelnames=()):
+        # fn() returns a number, or {label value(s): number} when labelnames are given
+        self.name = name
+        self.help_text = help_text
+        self.fn = fn
+        self.labelnames = labelnames
+
+    def render(self):
+        value = self.fn()
+        if not self.labelnames:
+            return [f"{self.name} {value}"]
+        lines = []
+        for key, amount in sorted(value.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{format_labels(self.labelnames, key)} {amount}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DURATION_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, fn, labelnames=()):
+        return self.register(Gauge(name, help_text, fn, labelnames))
+
+    def drain(self):
+        return {name: metric.drain() for name, metric in self.metrics.items() if hasattr(metric, "drain")}
+
+    def merge(self, collected):
+        for name, values in collected.items():
+            if values and name in self.metrics:
+                self.metrics[name].merge(values)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                body = metric.render()
+            except Exception:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(body)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("dropzone_stage_seconds", "Time spent per file in each stage", ("stage",))
+FILES = REGISTRY.counter("dropzone_files_total", "Files handled per stage and result", ("stage", "result"))
+RETRIES = REGISTRY.counter("dropzone_retries_total", "Retries scheduled per stage", ("stage",))
+ROWS_IN = REGISTRY.counter("dropzone_rows_in_total", "Rows read from incoming CSV files")
+ROWS_OUT = REGISTRY.counter("dropzone_rows_out_total", "Rows written to Parquet")
+ROWS_DROPPED = REGISTRY.counter("dropzone_rows_dropped_total", "Rows dropped by each transform filter", ("filter",))
+UPLOADED_BYTES = REGISTRY.counter("dropzone_uploaded_bytes_total", "Parquet bytes uploaded to S3")
+
+
+def count_files(folder):
+    try:
+        with os.scandir(folder) as entries:
+            # Checksum sidecars (utils/checksums.py) belong to their Parquet
+            return sum(1 for entry in entries if not entry.name.startswith(".") and not entry.name.endswith(SIDECAR_EXT))
+    except FileNotFoundError:
+        return 0
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, logger, host="0.0.0.0"):
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("📈 Metrics on http://%s:%d/metrics", host, port)
+    return server
@@ -0,0 +1,127 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Parquet writer settings shared by the process worker (pool processes get a copy through
+# init_context) and the compactor: codec, row-group size, sort order, dictionary columns,
+# statistics, page index and Bloom filters, plus the declared Arrow type of every output column.
+
+# Both engines produce these types (pandas would give user_id as double and large_string columns)
+OUTPUT_TYPES = {
+    "transaction_id": pa.string(),
+    "transaction_ts": pa.timestamp("us"),
+    "user_id": pa.int64(),
+    "amount": pa.float64(),
+    "currency": pa.dictionary(pa.int8(), pa.string()),
+    "status": pa.dictionary(pa.int8(), pa.string()),
+    "product_id": pa.string(),
+    "payment_method": pa.dictionary(pa.int8(), pa.string()),
+}
+
+
+def cast_or_null(column, target):
+    # Cast that turns values which do not fit `target` into nulls instead of failing the column:
+    # every distinct value is cast on its own (only reached when the whole-column cast failed)
+    values = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    uniques = pc.unique(values)
+    cast = []
+    for value in uniques:
+        try:
+            cast.append(value.cast(target).as_py())
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            cast.append(None)
+    return pc.take(pa.array(cast, target), pc.index_in(values, value_set=uniques))
+
+
+def column_list(value):
+    # "a, b" -> ["a", "b"]; "all" -> True; "" / "none" -> False (for use_dictionary / write_statistics)
+    value = (value or "").strip()
+    if value.lower() == "all":
+        return True
+    if value.lower() in ("", "none"):
+        return False
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class ParquetLayout:
+    def __init__(
+        self,
+        compression="zstd",
+        compression_level=None,
+        row_group_rows=1_000_000,
+        sort_by=("transaction_ts", "user_id"),
+        dictionary=("currency", "status", "payment_method", "product_id"),
+        statistics=True,
+        page_index=True,
+        bloom_filters=(),
+        bloom_fpp=0.05,
+    ):
+        self.compression = compression
+        self.compression_level = compression_level
+        self.row_group_rows = row_group_rows
+        self.sort_by = list(sort_by)
+        self.dictionary = list(dictionary) if isinstance(dictionary, (list, tuple)) else dictionary
+        self.statistics = statistics
+        self.page_index = page_index
+        self.bloom_filters = list(bloom_filters)
+        self.bloom_fpp = bloom_fpp
+
+    def conform(self, table, drops=None):
+        # Declared types, no pandas metadata, sorted rows. The schema is always OUTPUT_TYPES: rows
+        # with a value that does not fit its column's type are dropped (counted in `drops` under
+        # "bad_type")
+        columns = []
+        keep = None
+        for field, column in zip(table.schema, table.columns):
+            target = OUTPUT_TYPES.get(field.name)
+            if target is not None and column.type != target:
+                try:
+                    column = column.cast(target)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    cast = cast_or_null(column, target)
+                    fits = pc.or_(pc.is_null(column), pc.is_valid(cast))
+                    keep = fits if keep is None else pc.and_(keep, fits)
+                    column = cast
+            columns.append(column)
+        table = pa.Table.from_arrays(columns, names=table.column_names)
+        if keep is not None:
+            kept = table.filter(keep)
+            if drops is not None:
+                drops["bad_type"] = drops.get("bad_type", 0) + table.num_rows - kept.num_rows
+            table = kept
+        return self.sort(table)
+
+    def sort(self, table):
+        keys = [(name, "ascending") for name in self.sort_by if name in table.column_names]
+        return table.sort_by(keys) if keys and table.num_rows > 1 else table
+
+    def writer_options(self, schema, rows=None):
+        options = {
+            "compression": self.compression,
+            "compression_level": self.compression_level,
+            "use_dictionary": self.dictionary,
+            "write_statistics": self.statistics,
+            "write_page_index": self.page_index,
+        }
+        sorting = [pq.SortingColumn(schema.get_field_index(name)) for name in self.sort_by if name in schema.names]
+        if sorting:
+            # Every row group is sorted on its own (one per write), which is what this metadata states
+            options["sorting_columns"] = sorting
+        blooms = [name for name in self.bloom_filters if name in schema.names]
+        if blooms:
+            # Sized for one row group: the 1M-value default would dwarf small files
+            ndv = max(1, min(rows or self.row_group_rows, self.row_group_rows))
+            options["bloom_filter_options"] = {name: {"ndv": ndv, "fpp": self.bloom_fpp} for name in blooms}
+        return options
+
+    def write_table(self, table, path, metadata=None):
+        # metadata: schema metadata for the footer (lineage keys, utils/tracing.py)
+        if metadata:
+            table = table.replace_schema_metadata(metadata)
+        pq.write_table(table, path, row_group_size=self.row_group_rows, **self.writer_options(table.schema, table.num_rows))
+
+    def writer(self, path, schema, rows=None):
+        return pq.ParquetWriter(path, schema, **self.writer_options(schema, rows))
+
+    def write_batch(self, writer, table):
+        writer.write_table(table, row_group_size=self.row_group_rows)
@@ -1,6 +1,8 @@
 import os
 from queue import Full
 
+from utils.file_queue import FRESH
+
 
 def is_candidate(file_path, target):
     name = os.path.basename(file_path)
@@ -10,40 +12,45 @@ def is_candidate(file_path, target):
         return False
     return True
 
-def claim_file(file_path, set_LOCKER, claimed_set, target):
+def claim_file(file_path, manifest, target):
     if not is_candidate(file_path, target):
         return False
-    
-    set_LOCKER.acquire()
-    try:
-        if file_path in claimed_set:
-            return False
-        claimed_set.add(file_path)
-        return True
-    finally:
-        set_LOCKER.release()
+    return manifest.claim(file_path)
+
+def release_claim(file_path, manifest, reset_attempts=False):
+    manifest.release(file_path, reset_attempts)
 
-def release_claim(file_path, set_LOCKER, claimed_set):
-    set_LOCKER.acquire()
+def remove_finished(file_path, manifest, logger):
+    # Work already done in an earlier run (crash before the file was removed): never redo it
+    if not manifest.finished(file_path):
+        return False
     try:
-        claimed_set.discard(file_path)
-    finally:
-        set_LOCKER.release()
+        os.remove(file_path)
+        logger.info("🟣 Already finished in a previous run, removed leftover: %s", file_path)
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logger.warning("🟡 Failed to remove finished leftover: %s", file_path, exc_info=True)
+    return True
 
-def queue_file(file_path, general_queue, logger, source, set_LOCKER, claimed_set, target):
-    if not claim_file(file_path, set_LOCKER, claimed_set, target):
+def queue_file(file_path, general_queue, logger, source, manifest, target, priority=FRESH):
+    if not is_candidate(file_path, target):
+        return False
+    if remove_finished(file_path, manifest, logger):
+        return False
+    if not claim_file(file_path, manifest, target):
         return False
     
     try:
-        general_queue.put(file_path, timeout=1)
+        general_queue.put((file_path, priority), timeout=1)
         logger.info("-- Queued (%s): %s", source, file_path)
         return True
     except Full:
-        logger.warning("🟡 Queue full, could not enqueue: %s", file_path, exc_info=True)
-        release_claim(file_path, set_LOCKER, claimed_set)
+        logger.warning("🟡 Queue full, left for the next rescan: %s", file_path)
+        release_claim(file_path, manifest)
         return False
     
     except Exception:
         logger.warning("🟡 Adding to queue failed: %s", file_path, exc_info=True)
-        release_claim(file_path, set_LOCKER, claimed_set)
+        release_claim(file_path, manifest)
         return False
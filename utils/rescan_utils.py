@@ -0,0 +1,70 @@
+import os
+import time
+
+from utils.queue_utils import is_candidate
+
+
+class DirCursor:
+    # Incremental rescan of one folder: a single os.scandir pass that only returns entries that
+    # were not handed off yet or changed since (inode, mtime, size). Every `full_every` passes the
+    # cursor is reset, so files that were released without being finished get picked up again.
+    # With settle_s, a file written during the last settle_s seconds is left for a later pass
+    def __init__(self, folder, target, full_every=10, settle_s=0):
+        self.folder = folder
+        self.target = target
+        self.full_every = full_every
+        self.settle_s = settle_s
+        self.passes = 0
+        self.seen = {}
+
+    def scan(self):
+        self.passes += 1
+        if self.full_every and self.passes % self.full_every == 0:
+            self.seen.clear()
+
+        present = set()
+        fresh = []
+        settled_before = time.time() - self.settle_s
+        try:
+            entries = os.scandir(self.folder)
+        except FileNotFoundError:
+            return []
+        with entries:
+            for entry in entries:
+                if not is_candidate(entry.name, self.target):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                present.add(entry.name)
+                if self.settle_s and stat.st_mtime > settled_before:
+                    continue
+                if self.seen.get(entry.name) != signature:
+                    fresh.append((stat.st_mtime_ns, entry.path, signature))
+
+        # Forget entries that left the folder: the dict never outgrows the folder itself
+        self.seen = {name: signature for name, signature in self.seen.items() if name in present}
+        return [(path, signature) for _, path, signature in sorted(fresh)]
+
+    def mark(self, file_path, signature):
+        self.seen[os.path.basename(file_path)] = signature
+
+
+def rescan_once(cursor, queue_fn, general_queue, stop_event, skip=None):
+    # Oldest first; stops at a full queue and leaves the rest unmarked for the next pass, as well
+    # as files skip(path) says someone else is still watching
+    found = queued = 0
+    for file_path, signature in cursor.scan():
+        if stop_event.is_set():
+            break
+        if skip is not None and skip(file_path):
+            continue
+        found += 1
+        if queue_fn(file_path):
+            queued += 1
+        elif general_queue.full():
+            break
+        cursor.mark(file_path, signature)
+    return found, queued
@@ -0,0 +1,63 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+
+def backoff_delay(attempt, base_delay, max_delay, jitter=0.5):
+    # attempt 1 -> ~base_delay, doubling per attempt, capped; jitter spreads retries of a burst
+    delay = min(max_delay, base_delay * (2 ** (attempt - 1)))
+    return delay * random.uniform(1 - jitter, 1)
+
+
+class RetryScheduler:
+    # Delayed retries without blocking workers: items wait in a heap keyed by next-attempt time,
+    # a single thread hands them back through `requeue(item)` when they are due.
+    # `requeue` returns False when the target queue is full; the item is then tried again shortly
+    def __init__(self, requeue, logger, base_delay=30, max_delay=600, jitter=0.5):
+        self.requeue = requeue
+        self.logger = logger
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+        self.heap = []
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+
+    def __len__(self):
+        with self.cond:
+            return len(self.heap)
+
+    def schedule(self, item, attempt):
+        delay = backoff_delay(attempt, self.base_delay, self.max_delay, self.jitter)
+        with self.cond:
+            heapq.heappush(self.heap, (time.monotonic() + delay, next(self.seq), item))
+            self.cond.notify()
+        return delay
+
+    def pop_due(self, timeout=1):
+        with self.cond:
+            now = time.monotonic()
+            if not self.heap or self.heap[0][0] > now:
+                wait = timeout if not self.heap else min(timeout, self.heap[0][0] - now)
+                self.cond.wait(wait)
+                return []
+
+            due = []
+            while self.heap and self.heap[0][0] <= now:
+                due.append(heapq.heappop(self.heap)[2])
+            return due
+
+    def run(self, stop_event):
+        while not stop_event.is_set():
+            for item in self.pop_due():
+                try:
+                    requeued = self.requeue(item)
+                except Exception:
+                    self.logger.warning("🟡 Retry requeue failed: %s", item, exc_info=True)
+                    requeued = False
+                if not requeued:
+                    with self.cond:
+                        heapq.heappush(self.heap, (time.monotonic() + 1, next(self.seq), item))
@@ -0,0 +1,108 @@
+import argparse
+import glob
+import json
+from collections import defaultdict
+
+import numpy as np
+
+# Reads the span files written by utils/tracing.py (rotated files included) and reports
+# the slowest files end to end plus a per-stage latency breakdown.
+# Usage: python3 -m utils.trace_report logs/traces/*.jsonl* --top 10
+#        python3 -m utils.trace_report logs/traces/*.jsonl* --trace <trace_id>
+
+STAGES = ["arrival", "queue_wait", "read", "transform", "write", "stream", "staging_wait", "handoff_wait", "upload", "retry_wait"]
+
+
+def load_spans(patterns):
+    traces = defaultdict(list)
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        span = json.loads(line)
+                    except ValueError:
+                        continue
+                    traces[span["trace_id"]].append(span)
+    return traces
+
+def summarize(trace_id, spans):
+    spans = sorted(spans, key=lambda span: span["start"])
+    stages = defaultdict(float)
+    for span in spans:
+        stages[span["name"]] += span["duration_s"]
+    files = [span["file"] for span in spans if span.get("file")]
+    parquets = [span["parquet"] for span in spans if span.get("parquet")]
+    return {
+        "trace_id": trace_id,
+        "file": files[0] if files else None,
+        "parquet": parquets[-1] if parquets else None,
+        "uploaded": any(span["name"] == "upload" and span.get("result") in ("uploaded", "exists") for span in spans),
+        "total_s": round(max(span["end"] for span in spans) - spans[0]["start"], 3),
+        "stages": {name: round(seconds, 3) for name, seconds in stages.items()},
+    }
+
+def stage_breakdown(summaries):
+    per_stage = defaultdict(list)
+    for summary in summaries:
+        for name, seconds in summary["stages"].items():
+            per_stage[name].append(seconds)
+    per_stage["end_to_end"] = [summary["total_s"] for summary in summaries if summary["uploaded"]]
+
+    rows = []
+    for name in STAGES + sorted(set(per_stage) - set(STAGES) - {"end_to_end"}) + ["end_to_end"]:
+        values = per_stage.get(name)
+        if not values:
+            continue
+        values = np.asarray(values)
+        rows.append({
+            "stage": name,
+            "files": len(values),
+            "p50": round(float(np.percentile(values, 50)), 3),
+            "p90": round(float(np.percentile(values, 90)), 3),
+            "p99": round(float(np.percentile(values, 99)), 3),
+            "max": round(float(values.max()), 3),
+            "total": round(float(values.sum()), 3),
+        })
+    return rows
+
+def print_table(rows, columns):
+    widths = {column: max(len(column), *(len(str(row.get(column, ""))) for row in rows)) for column in columns}
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(str(row.get(column, "")).ljust(widths[column]) for column in columns))
+
+def main():
+    parser = argparse.ArgumentParser(description="Slowest files and per-stage latency from dropzone trace files")
+    parser.add_argument("files", nargs="+", help="trace files or glob patterns")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--trace", help="print every span of one trace id")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    traces = load_spans(args.files)
+    if args.trace:
+        for span in sorted(traces.get(args.trace, []), key=lambda span: span["start"]):
+            print(json.dumps(span))
+        return
+
+    summaries = [summarize(trace_id, spans) for trace_id, spans in traces.items()]
+    slowest = sorted(summaries, key=lambda summary: summary["total_s"], reverse=True)[:args.top]
+    breakdown = stage_breakdown(summaries)
+
+    if args.json:
+        print(json.dumps({"traces": len(summaries), "slowest": slowest, "stages": breakdown}, indent=2))
+        return
+
+    print(f"{len(summaries)} traces\n")
+    print(f"Slowest {len(slowest)} files:")
+    print_table([
+        {"trace_id": s["trace_id"], "file": s["file"], "total_s": s["total_s"], "uploaded": s["uploaded"],
+         **{name: s["stages"].get(name, "") for name in STAGES if any(name in t["stages"] for t in slowest)}}
+        for s in slowest
+    ], ["trace_id", "file", "total_s", "uploaded"] + [name for name in STAGES if any(name in t["stages"] for t in slowest)])
+    print("\nPer-stage latency (seconds):")
+    print_table(breakdown, ["stage", "files", "p50", "p90", "p99", "max", "total"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import threading
+from logging.handlers import RotatingFileHandler
+from uuid import uuid4
+
+import pyarrow.parquet as pq
+
+# Per-file lineage: a trace id is assigned when a CSV is claimed (utils/manifest.py), travels in
+# the Parquet footer (TRACE_KEY, SOURCES_KEY) through compaction to the uploader, and every stage
+# records a span: one JSON object per line in the service's trace file.
+# Pool processes have no trace file: their spans are buffered (TRACER.buffer() in init_pool_worker)
+# and returned with the result (TRACER.drain() in the child, TRACER.extend() in the parent), the same
+# way as the metrics. Anywhere else spans are dropped while no trace file is configured (off).
+
+TRACE_KEY = b"dropzone.trace_ids"
+SOURCES_KEY = b"dropzone.sources"
+
+
+class Tracer:
+    def __init__(self):
+        self.logger = None
+        self.service = None
+        self.lock = threading.Lock()
+        self.buffering = False
+        self.pending = []
+
+    def configure(self, path, service, max_bytes=50_000_000, backup_count=3):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        logger = logging.getLogger(f"dropzone.trace.{service}")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        if not logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+        self.logger = logger
+        self.service = service
+
+    def buffer(self):
+        # Pool process: keep spans until drain()
+        self.buffering = True
+
+    def emit(self, span):
+        if self.logger is None:
+            if self.buffering:
+                with self.lock:
+                    self.pending.append(span)
+            return
+        span.setdefault("service", self.service)
+        self.logger.info(json.dumps(span, default=str))
+
+    def record(self, trace_ids, name, start, end, **attrs):
+        if not trace_ids:
+            return
+        if isinstance(trace_ids, str):
+            trace_ids = [trace_ids]
+        for trace_id in trace_ids:
+            self.emit({
+                "trace_id": trace_id,
+                "span_id": uuid4().hex[:16],
+                "name": name,
+                "start": round(start, 6),
+                "end": round(end, 6),
+                "duration_s": round(end - start, 6),
+                **attrs,
+            })
+
+    def drain(self):
+        with self.lock:
+            spans, self.pending = self.pending, []
+        return spans
+
+    def extend(self, spans):
+        for span in spans:
+            self.emit(span)
+
+
+TRACER = Tracer()
+record = TRACER.record
+
+
+def with_trace(schema, trace_ids, sources):
+    # Schema with the lineage keys added to its (pandas) metadata
+    trace_ids = [trace_id for trace_id in trace_ids if trace_id]
+    if not trace_ids:
+        return schema
+    metadata = dict(schema.metadata or {})
+    metadata[TRACE_KEY] = ",".join(trace_ids).encode()
+    metadata[SOURCES_KEY] = ",".join(sources).encode()
+    return schema.with_metadata(metadata)
+
+def read_trace(parquet_path):
+    # (trace_ids, sources) from the Parquet footer; empty lists for untraced files
+    return schema_trace(pq.read_schema(parquet_path))
+
+def schema_trace(schema):
+    metadata = schema.metadata or {}
+    trace_ids = metadata.get(TRACE_KEY, b"").decode()
+    sources = metadata.get(SOURCES_KEY, b"").decode()
+    return [t for t in trace_ids.split(",") if t], [s for s in sources.split(",") if s]